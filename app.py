@@ -1,7 +1,15 @@
-from flask import Flask, render_template, request, redirect, url_for, jsonify
-from database import init_db, get_conn
-from datetime import datetime
+from flask import Flask, render_template, request, redirect, url_for, jsonify, Response, stream_with_context, abort, g
+from database import init_db, get_conn, connect
+from exports import ARROW_AVAILABLE, FORMATS, stream_export
+from live_events import LIVE_FEED_DEFAULTS, EventHub, latest_event_id, publish_events, session_summary
+import metrics
+import rollups
+from utils import DEFAULTER_THRESHOLD
+from timetable import SCHEDULE_DEFAULTS, SessionScheduler, import_term, insert_sessions, read_timetable
+from datetime import datetime, date
 import json
+import io
+import time
 from pathlib import Path
 
 app = Flask(__name__)
@@ -24,6 +32,33 @@ def save_camera_config(config):
     with open(CONFIG_FILE, 'w') as f:
         json.dump(config, f)
 
+# Start and end sessions on their timetable slots, no clicks needed
+schedule_config = dict(SCHEDULE_DEFAULTS, **load_camera_config().get('timetable', {}))
+session_scheduler = None
+if schedule_config.pop('auto_activate'):
+    session_scheduler = SessionScheduler(**schedule_config).start()
+
+metrics_config = dict(metrics.METRICS_DEFAULTS, **load_camera_config().get('metrics', {}))
+
+# Live attendance feed: one watcher thread shared by every open session page
+live_feed_config = dict(LIVE_FEED_DEFAULTS, **load_camera_config().get('live_feed', {}))
+event_hub = None
+if live_feed_config.pop('enabled'):
+    event_hub = EventHub(**live_feed_config).start()
+
+@app.before_request
+def start_timer():
+    g.request_start = time.perf_counter()
+
+@app.after_request
+def record_request(response):
+    if 'request_start' in g:
+        # The route pattern, not the path, keeps the label set small
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        metrics.observe('http_request_seconds', time.perf_counter() - g.request_start,
+                        route=route, method=request.method, status=response.status_code)
+    return response
+
 @app.route('/')
 def index():
     conn = get_conn()
@@ -44,7 +79,9 @@ def index():
 def camera_settings():
     if request.method == 'POST':
         camera_index = int(request.form.get('camera_index', 1))
-        config = {'camera_index': camera_index}
+        # Keep other settings (e.g. the recognizer's pipeline block) intact
+        config = load_camera_config()
+        config['camera_index'] = camera_index
         save_camera_config(config)
         return redirect(url_for('index'))
     
@@ -70,21 +107,40 @@ def create_session():
     date = request.form.get('date')
     start = request.form.get('start_time')
     end = request.form.get('end_time')
-    
+    section = request.form.get('section') or None
+
     conn = get_conn()
-    cur = conn.cursor()
-    # Ensure subject exists
-    cur.execute('INSERT OR IGNORE INTO subjects(name) VALUES (?)', (subject,))
-    conn.commit()
-    cur.execute('SELECT id FROM subjects WHERE name=?', (subject,))
-    sid = cur.fetchone()['id']
-    
-    cur.execute('''
-        INSERT INTO sessions(subject_id, teacher, date, start_time, end_time, active) 
-        VALUES (?, ?, ?, ?, ?, 0)
-    ''', (sid, teacher, date, start, end))
-    conn.commit()
+    # Creates the subject if needed; one transaction
+    created = insert_sessions(conn, [(subject, teacher, section, date, start, end)])
     conn.close()
+    if not created:
+        abort(409, f"A {subject} session{f' for section {section}' if section else ''} "
+                   f"already exists on {date} at {start}")
+    return redirect(url_for('index'))
+
+@app.route('/import_timetable', methods=['POST'])
+def import_timetable():
+    """Expand an uploaded weekly timetable (CSV/JSON) into sessions for first_day..last_day"""
+    upload = request.files.get('timetable')
+    if upload is None or not upload.filename:
+        abort(400, 'Upload a timetable CSV or JSON file')
+    try:
+        first_day = date.fromisoformat(request.form.get('first_day', ''))
+        last_day = date.fromisoformat(request.form.get('last_day', ''))
+    except ValueError:
+        abort(400, 'first_day and last_day must be YYYY-MM-DD dates')
+    skip = [d.strip() for d in request.form.get('skip_dates', '').split(',') if d.strip()]
+
+    # Parsed straight from the upload: no temporary file to reopen (not possible on Windows while open)
+    text = io.TextIOWrapper(upload.stream, encoding='utf-8-sig', newline='')
+    try:
+        slots = read_timetable(text, Path(upload.filename).suffix.lower() == '.json')
+    except (KeyError, ValueError) as e:
+        abort(400, f'Invalid timetable: {e}')
+    conn = get_conn()
+    created = import_term(conn, slots, first_day, last_day, skip)
+    conn.close()
+    print(f'Imported {len(slots)} weekly slots: {created} sessions created')
     return redirect(url_for('index'))
 
 @app.route('/start_session/<int:session_id>')
@@ -108,18 +164,103 @@ def end_session(session_id):
     conn.close()
     return redirect(url_for('index'))
 
+PAGE_SIZE = 100
+
 @app.route('/attendance/<int:session_id>')
 def view_attendance(session_id):
+    page = max(1, request.args.get('page', 1, type=int))
     conn = get_conn()
     cur = conn.cursor()
     cur.execute('''
-        SELECT a.id, st.name, st.roll_no, a.entry_time, a.exit_time, a.duration_sec, a.status
+        SELECT a.id, a.student_id, st.name, st.roll_no, a.entry_time, a.exit_time, a.duration_sec, a.status
         FROM attendance a JOIN students st ON a.student_id=st.id 
         WHERE a.session_id=?
-    ''', (session_id,))
+        ORDER BY a.id
+        LIMIT ? OFFSET ?
+    ''', (session_id, PAGE_SIZE, (page - 1) * PAGE_SIZE))
     rows = cur.fetchall()
+    # Summary over the whole session, not just this page
+    summary = session_summary(cur, session_id)
+    # The live feed resumes from here, so nothing committed after this read is missed
+    last_event_id = latest_event_id(conn) if event_hub else None
     conn.close()
-    return render_template('session.html', records=rows, session_id=session_id)
+    pages = max(1, -(-summary['total'] // PAGE_SIZE))
+    return render_template('session.html', records=rows, session_id=session_id,
+                           summary=summary, page=page, pages=pages, last_event_id=last_event_id)
+
+@app.route('/stream/<int:session_id>')
+def stream_attendance(session_id):
+    """Server-Sent Events: entry, update and summary events of the session as they are committed"""
+    if event_hub is None:
+        abort(404)
+    # EventSource sends Last-Event-ID when it reconnects; the page passes ?after= on first connect
+    after = request.headers.get('Last-Event-ID', type=int)
+    if after is None:
+        after = request.args.get('after', event_hub.last_id, type=int)
+    return Response(stream_with_context(event_hub.stream(session_id, after)), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+def export_response(scope, params, filename):
+    fmt = request.args.get('format', 'csv')
+    if fmt not in FORMATS:
+        abort(400, f"Unknown format {fmt}; use one of {', '.join(FORMATS)}")
+    if fmt != 'csv' and not ARROW_AVAILABLE:
+        abort(501, 'Parquet/Arrow export needs pyarrow installed')
+    mimetype, ext = FORMATS[fmt]
+
+    def generate():
+        # Dedicated connection: the cursor lives as long as the response streams
+        conn = connect()
+        try:
+            yield from stream_export(conn, scope, params, fmt)
+        finally:
+            conn.really_close()
+
+    return Response(stream_with_context(generate()), mimetype=mimetype,
+                    headers={'Content-Disposition': f'attachment; filename={filename}.{ext}'})
+
+@app.route('/export/session/<int:session_id>')
+def export_session(session_id):
+    return export_response('session', (session_id,), f'attendance_session_{session_id}')
+
+@app.route('/export/student/<int:student_id>')
+def export_student(student_id):
+    return export_response('student', (student_id,), f'attendance_student_{student_id}')
+
+@app.route('/export/range')
+def export_range():
+    start = request.args.get('start')
+    end = request.args.get('end')
+    try:
+        datetime.strptime(start or '', '%Y-%m-%d')
+        datetime.strptime(end or '', '%Y-%m-%d')
+    except ValueError:
+        abort(400, 'start and end must be YYYY-MM-DD dates')
+    return export_response('range', (start, end), f'attendance_{start}_to_{end}')
+
+# Reports read the trigger-maintained rollup tables, never the attendance table
+@app.route('/reports/students')
+def report_students():
+    conn = get_conn()
+    rows = rollups.student_attendance(conn, request.args.get('student_id', type=int),
+                                      request.args.get('subject_id', type=int))
+    conn.close()
+    return jsonify(rows)
+
+@app.route('/reports/subjects')
+def report_subjects():
+    conn = get_conn()
+    rows = rollups.subject_averages(conn)
+    conn.close()
+    return jsonify(rows)
+
+@app.route('/reports/defaulters')
+def report_defaulters():
+    threshold = request.args.get('threshold', DEFAULTER_THRESHOLD, type=float)
+    conn = get_conn()
+    rows = rollups.defaulters(conn, threshold, request.args.get('subject_id', type=int))
+    conn.close()
+    return jsonify({'threshold': threshold, 'defaulters': rows})
 
 @app.route('/manual_update', methods=['POST'])
 def manual_update():
@@ -128,9 +269,34 @@ def manual_update():
     conn = get_conn()
     cur = conn.cursor()
     cur.execute('UPDATE attendance SET status=? WHERE id=?', (status, att_id))
+    cur.execute('SELECT session_id, student_id FROM attendance WHERE id=?', (att_id,))
+    row = cur.fetchone()
+    if row is not None:
+        publish_events(cur, [(row['session_id'], 'update', {'att_id': int(att_id), 'student_id': row['student_id'],
+                                                            'status': status}),
+                             (row['session_id'], 'summary', session_summary(cur, row['session_id']))])
     conn.commit()
     conn.close()
     return ('', 204)
 
+# Prometheus scrape target: the dashboard's own metrics plus what the recognizer published
+@app.route('/metrics')
+def metrics_endpoint():
+    sources = [('dashboard', metrics.REGISTRY.snapshot())]
+    published = metrics.read_published(metrics_config['stats_file'], exclude='dashboard')
+    for process, (updated_at, rows) in sorted(published.items()):
+        sources.append((process, rows + [('gauge', 'metrics_age_seconds', {}, time.time() - updated_at)]))
+    return Response(metrics.render(sources), mimetype='text/plain; version=0.0.4')
+
+@app.route('/debug/profile')
+def debug_profile():
+    """Sample every dashboard thread for a few seconds; enabled by metrics.profiling"""
+    if not metrics_config['profiling']:
+        abort(404)
+    seconds = min(request.args.get('seconds', metrics_config['profile_seconds'], type=float), 60)
+    stacks = metrics.sample_profile(seconds)
+    path = metrics.write_profile(stacks, metrics_config['profile_dir'], 'dashboard')
+    return Response(path.read_text(), mimetype='text/plain')
+
 if __name__ == '_main_':
     app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
@@ -0,0 +1,290 @@
+import threading
+import time
+from itertools import chain
+
+import numpy as np
+
+import metrics
+from database import get_conn
+from live_events import publish_events, session_summary
+from timetable import to_seconds
+from utils import format_ts, parse_ts, PRESENCE_GAP, PRESENCE_THRESHOLD
+
+
+def attendance_status(duration, session_length):
+    if session_length is None:
+        # Fallback: if present > 60 sec -> present
+        return 'Present' if duration >= 60 else 'Absent'
+    return 'Present' if duration >= int(session_length * PRESENCE_THRESHOLD) else 'Absent'
+
+
+def session_length_secs(cur, session_id):
+    cur.execute('SELECT date, start_time, end_time FROM sessions WHERE id=?', (session_id,))
+    srow = cur.fetchone()
+    if not srow or not srow['start_time'] or not srow['end_time']:
+        return None
+    # Dashboard and timetable sessions store HH:MM, which secs_between can't parse
+    try:
+        return to_seconds(srow['end_time']) - to_seconds(srow['start_time'])
+    except (TypeError, ValueError):
+        # Free-text or malformed times: use the fallback rule rather than failing every checkpoint
+        return None
+
+
+class Presence:
+    """One student's sightings in a session, merged into [start, end] intervals of epoch seconds"""
+
+    __slots__ = ('student_id', 'starts', 'ends')
+
+    def __init__(self, student_id, starts, ends):
+        self.student_id = student_id
+        self.starts = starts
+        self.ends = ends
+
+    def see(self, t, max_gap=None):
+        """Extend the last interval, or open a new one after more than max_gap unseen (None: never)"""
+        last = self.ends[-1]
+        if t <= last:
+            return
+        if max_gap is None or t - last <= max_gap:
+            self.ends[-1] = t
+        else:
+            self.starts.append(t)
+            self.ends.append(t)
+
+    def merge(self, starts, ends, max_gap=None):
+        """Fold in intervals from elsewhere (e.g. an earlier checkpoint), in any order"""
+        merged = []
+        for start, end in sorted(zip(self.starts + list(starts), self.ends + list(ends))):
+            if merged and (max_gap is None or start - merged[-1][1] <= max_gap):
+                merged[-1][1] = max(merged[-1][1], end)
+            else:
+                merged.append([start, end])
+        self.starts = [start for start, _ in merged]
+        self.ends = [end for _, end in merged]
+
+    def copy(self):
+        return Presence(self.student_id, list(self.starts), list(self.ends))
+
+
+@metrics.timer('flush_seconds')
+def flush_attendance_records(conn, session_id, present_track):
+    """Upsert one session's present_track and its intervals in a single transaction; returns rows written"""
+    if not present_track:
+        return 0
+    cur = conn.cursor()
+    session_length = session_length_secs(cur, session_id)
+
+    names = list(present_track)
+    records = list(present_track.values())
+    counts = np.fromiter((len(rec.starts) for rec in records), dtype=np.intp, count=len(records))
+    starts = np.fromiter(chain.from_iterable(rec.starts for rec in records), dtype=np.int64)
+    ends = np.fromiter(chain.from_iterable(rec.ends for rec in records), dtype=np.int64)
+    # Time actually in the room: each student's interval lengths summed, gaps excluded
+    offsets = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    durations = np.add.reduceat(ends - starts, offsets).tolist()
+
+    rows = []
+    intervals = []
+    for rec, duration in zip(records, durations):
+        rows.append((format_ts(rec.starts[0]), format_ts(rec.ends[-1]), duration,
+                     attendance_status(duration, session_length), session_id, rec.student_id))
+        intervals.extend((session_id, rec.student_id, format_ts(start), format_ts(end), end - start)
+                         for start, end in zip(rec.starts, rec.ends))
+
+    with conn:
+        # Update rows from earlier checkpoints, then insert the students seen for the first time
+        cur.executemany('''UPDATE attendance SET entry_time=?, exit_time=?, duration_sec=?, status=?
+                           WHERE session_id=? AND student_id=?''', rows)
+        cur.executemany('''INSERT INTO attendance(entry_time, exit_time, duration_sec, status, session_id, student_id)
+                           SELECT ?, ?, ?, ?, ?, ?
+                           WHERE NOT EXISTS (SELECT 1 FROM attendance WHERE session_id=? AND student_id=?)''',
+                        [row + row[-2:] for row in rows])
+        # Intervals are rewritten whole: the last one grows and gaps may have closed since
+        cur.executemany('DELETE FROM attendance_intervals WHERE session_id=? AND student_id=?',
+                        [(session_id, rec.student_id) for rec in records])
+        cur.executemany('''INSERT INTO attendance_intervals(session_id, student_id, start_time, end_time, duration_sec)
+                           VALUES (?, ?, ?, ?, ?)''', intervals)
+        # Live feed: the rows as written, plus the session totals
+        cur.execute('SELECT student_id, id FROM attendance WHERE session_id=?', (session_id,))
+        att_ids = dict(cur.fetchall())
+        events = [(session_id, 'update', {'att_id': att_ids.get(student_id), 'student_id': student_id, 'name': name,
+                                          'entry_time': entry, 'exit_time': exit_, 'duration_sec': duration,
+                                          'status': status})
+                  for name, (entry, exit_, duration, status, _, student_id) in zip(names, rows)]
+        events.append((session_id, 'summary', session_summary(cur, session_id)))
+        publish_events(cur, events)
+    return len(rows)
+
+
+class AttendanceWriter:
+    """Owns present_track and writes it behind the recognition loop.
+
+    mark() only touches memory, in integer seconds; timestamps are formatted
+    and durations computed at checkpoint time.  A background thread checkpoints the active
+    session every `interval` seconds, does a final flush when the session
+    ends, and on start-up recovers an in-progress session from the rows of
+    earlier checkpoints, so a crash or restart loses at most one interval.
+    """
+
+    def __init__(self, session_cache, interval=30, tick=1.0, max_gap=PRESENCE_GAP):
+        self.session_cache = session_cache
+        self.interval = interval
+        self.tick = tick
+        self.max_gap = max_gap   # Seconds unseen that split presence; None keeps first-to-last
+        self.session_id = None
+        self.present_track = {}  # name -> Presence
+        # Wall clock anchored once and advanced by the monotonic clock, so clock changes can't reorder sightings
+        self._epoch = time.time() - time.monotonic()
+        self.checkpoints = 0
+        self._dirty = False
+        self._finished = []      # (session_id, present_track) awaiting their final flush
+        self._entries = []       # First sightings not yet published to the live feed
+        self._recover = None     # session_id whose earlier rows still need merging
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._sync_session(self.session_cache.active_session_id)
+        self._thread = threading.Thread(target=self._run, name='attendance-writer', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stop the thread and write everything still in memory"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(self.interval)
+        self.publish_entries()
+        self.checkpoint()
+
+    def mark(self, session_id, name, student_id):
+        """Record a sighting; returns (first sighting this session, epoch seconds)"""
+        now = int(self._epoch + time.monotonic())
+        with self._lock:
+            if session_id != self.session_id:
+                self._switch(session_id)
+            rec = self.present_track.get(name)
+            if rec is not None:
+                rec.see(now, self.max_gap)
+            else:
+                self.present_track[name] = Presence(student_id, [now], [now])
+                self._entries.append((session_id, name, student_id, now))
+            self._dirty = True
+        return rec is None, now
+
+    def checkpoint(self, force=False):
+        """Write finished sessions and the active one (if changed, or force); returns rows written"""
+        with self._lock:
+            finished, self._finished = self._finished, []
+
+        written = 0
+        conn = get_conn()
+        try:
+            for old_session, track in finished:
+                written += flush_attendance_records(conn, old_session, track)
+                print(f'Attendance flushed for ended session {old_session}: {len(track)} records')
+        except Exception as e:
+            # Keep the data for the next attempt; recovery waits too, it must read these rows
+            print('Attendance checkpoint failed:', e)
+            with self._lock:
+                self._finished = finished + self._finished
+            return 0
+        finally:
+            conn.close()
+
+        # After the finished tracks are written: a re-activated session recovers them, not a stale copy
+        self._merge_recovered()
+        with self._lock:
+            session_id = self.session_id
+            snapshot = {name: rec.copy() for name, rec in self.present_track.items()} if self._dirty or force else {}
+            self._dirty = False
+
+        conn = get_conn()
+        try:
+            if session_id is not None and snapshot:
+                written += flush_attendance_records(conn, session_id, snapshot)
+        except Exception as e:
+            # Keep the data for the next attempt
+            print('Attendance checkpoint failed:', e)
+            with self._lock:
+                self._dirty = True
+            return written
+        finally:
+            conn.close()
+        self.checkpoints += 1
+        return written
+
+    def publish_entries(self):
+        """Announce first sightings on the live feed without waiting for the next checkpoint"""
+        with self._lock:
+            entries, self._entries = self._entries, []
+        if not entries:
+            return
+        conn = get_conn()
+        try:
+            with conn:
+                publish_events(conn.cursor(), [(session_id, 'entry', {'student_id': student_id, 'name': name,
+                                                                      'entry_time': format_ts(t)})
+                                               for session_id, name, student_id, t in entries])
+        except Exception as e:
+            print('Live feed publish failed:', e)
+        finally:
+            conn.close()
+
+    def _switch(self, session_id):
+        # Caller holds the lock
+        if self.session_id is not None and self.present_track:
+            self._finished.append((self.session_id, self.present_track))
+        self.session_id = session_id
+        self.present_track = {}
+        self._dirty = False
+        self._recover = session_id
+
+    def _sync_session(self, session_id):
+        with self._lock:
+            if session_id != self.session_id:
+                self._switch(session_id)
+
+    def _merge_recovered(self):
+        with self._lock:
+            session_id, self._recover = self._recover, None
+        if session_id is None:
+            return
+        conn = get_conn()
+        try:
+            cur = conn.cursor()
+            cur.execute('''SELECT st.name, i.student_id, i.start_time, i.end_time
+                           FROM attendance_intervals i JOIN students st ON i.student_id=st.id
+                           WHERE i.session_id=?''', (session_id,))
+            rows = cur.fetchall()
+        finally:
+            conn.close()
+        recovered = {}
+        for row in rows:
+            rec = recovered.setdefault(row['name'], Presence(row['student_id'], [], []))
+            rec.starts.append(parse_ts(row['start_time']))
+            rec.ends.append(parse_ts(row['end_time']))
+        with self._lock:
+            if session_id != self.session_id:
+                return
+            for name, old in recovered.items():
+                rec = self.present_track.get(name)
+                if rec is None:
+                    old.merge([], [], self.max_gap)
+                    self.present_track[name] = old
+                else:
+                    rec.merge(old.starts, old.ends, self.max_gap)
+        if recovered:
+            print(f'Recovered {len(recovered)} attendance records for session {session_id}')
+
+    def _run(self):
+        last_checkpoint = time.monotonic()
+        while not self._stop.wait(self.tick):
+            self._sync_session(self.session_cache.active_session_id)
+            self.publish_entries()
+            due = time.monotonic() - last_checkpoint >= self.interval
+            if due or self._finished or self._recover is not None:
+                self.checkpoint()
+                last_checkpoint = time.monotonic()
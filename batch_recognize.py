@@ -0,0 +1,205 @@
+import argparse
+import csv
+import os
+import queue
+import threading
+import time
+from collections import defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+from attendance_writer import Presence, flush_attendance_records
+from detectors import BACKENDS, DETECTOR_DEFAULTS, FaceDetector, face_encodings
+from database import get_conn, init_db
+from face_index import UNKNOWN, load_matcher
+from gallery_store import GALLERY_PATH
+from session_cache import SessionCache
+from sources import Source
+from utils import parse_ts
+
+
+def decode_frames(inputs, out, every, scale, image_fps):
+    """Decoder thread: (input, frame index, seconds into the recording, downscaled RGB frame) into `out`"""
+    for path in inputs:
+        source = Source(path, Path(path).name)
+        if not source.open():
+            print(f"Cannot open {path}")
+            continue
+        fps = source.capture.get(cv2.CAP_PROP_FPS) if source.kind == 'video' else image_fps
+        fps = fps or image_fps
+        index = -1
+        while True:
+            ret, frame = source.read()
+            if not ret:
+                break
+            index += 1
+            if index % every:
+                continue
+            small = cv2.resize(frame, (0, 0), fx=scale, fy=scale) if scale != 1 else frame
+            out.put((source.name, index, index / fps, np.ascontiguousarray(small[:, :, ::-1])))
+        source.release()
+    out.put(None)
+
+
+detector = None  # Per worker process, set by init_worker
+
+
+def init_worker(backend):
+    global detector
+    detector = FaceDetector(**dict(DETECTOR_DEFAULTS, backend=backend))
+
+
+def detect_and_encode(rgb, scale):
+    """Worker: face boxes (full-frame coordinates) and encodings of one frame"""
+    locations = detector.detect(rgb)
+    encodings = face_encodings(rgb, locations) if locations else []
+    boxes = [tuple(int(v / scale) for v in location) for location in locations]
+    return boxes, np.asarray(encodings, dtype=np.float32)
+
+
+def ordered_results(pool, frames, window, scale):
+    """Submit frames to the pool with at most `window` in flight; yield results in frame order"""
+    pending = deque()
+    while True:
+        item = frames.get()
+        if item is None:
+            break
+        name, index, seconds, rgb = item
+        pending.append((name, index, seconds, pool.submit(detect_and_encode, rgb, scale)))
+        while len(pending) >= window:
+            name, index, seconds, future = pending.popleft()
+            yield (name, index, seconds) + future.result()
+    while pending:
+        name, index, seconds, future = pending.popleft()
+        yield (name, index, seconds) + future.result()
+
+
+def merge_intervals(times, max_gap):
+    """Sorted sighting times -> [(start, end)] with gaps up to max_gap bridged"""
+    intervals = []
+    for t in sorted(times):
+        if intervals and t - intervals[-1][1] <= max_gap:
+            intervals[-1][1] = t
+        else:
+            intervals.append([t, t])
+    return [tuple(iv) for iv in intervals]
+
+
+def load_ground_truth(path):
+    """CSV with source,frame,name rows: the people visible in each labeled frame"""
+    truth = defaultdict(set)
+    with open(path, newline='') as f:
+        for row in csv.DictReader(f):
+            names = truth[(row['source'].strip(), int(row['frame']))]
+            # A row with an empty name labels a frame with nobody in it
+            if (row.get('name') or '').strip():
+                names.add(row['name'].strip())
+    return truth
+
+
+def score(predicted, truth):
+    """Precision/recall of (frame, name) pairs over the labeled frames that were processed"""
+    tp = fp = fn = scored = 0
+    for key, names in truth.items():
+        if key not in predicted:
+            # Skipped by --every (or not decoded): no prediction, not a miss
+            continue
+        found = predicted[key]
+        scored += 1
+        tp += len(found & names)
+        fp += len(found - names)
+        fn += len(names - found)
+    precision = tp / (tp + fp) if tp + fp else 0.0
+    recall = tp / (tp + fn) if tp + fn else 0.0
+    return precision, recall, tp, fp, fn, scored
+
+
+def write_session(session_id, presence, offset, max_gap):
+    """Presence intervals -> attendance rows of the session, timed from its start plus offset"""
+    conn = get_conn()
+    row = conn.execute('SELECT date, start_time FROM sessions WHERE id=?', (session_id,)).fetchone()
+    if row is None:
+        raise SystemExit(f"Session {session_id} not found")
+    if not row['date'] or not row['start_time']:
+        raise SystemExit(f"Session {session_id} has no date/start time; set them before writing presence to it")
+    start_time = row['start_time'] if row['start_time'].count(':') == 2 else row['start_time'] + ':00'
+    session_start = parse_ts(f"{row['date']} {start_time}") + offset
+
+    session_cache = SessionCache()
+    present_track = {}
+    for name, times in presence.items():
+        intervals = merge_intervals(times, max_gap)
+        present_track[name] = Presence(session_cache.student_id(name),
+                                       [round(session_start + start) for start, _ in intervals],
+                                       [round(session_start + end) for _, end in intervals])
+        spans = ', '.join(f"{start:.0f}-{end:.0f}s" for start, end in intervals)
+        print(f"  {name}: {spans}")
+    written = flush_attendance_records(conn, session_id, present_track)
+    conn.close()
+    return written
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Recognize faces in recorded videos and image folders')
+    parser.add_argument('inputs', nargs='+', help='video files and/or image directories')
+    parser.add_argument('--session', type=int, help='write presence into this session (default: report only)')
+    parser.add_argument('--offset', type=float, default=0,
+                        help='seconds between the session start and the start of the recording')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='detector/encoder processes')
+    parser.add_argument('--every', type=int, default=1, help='process every nth frame')
+    parser.add_argument('--scale', type=float, default=0.5, help='downscale before detection')
+    parser.add_argument('--detector', '--model', default='hog', choices=BACKENDS, help='face detector backend')
+    parser.add_argument('--image-fps', type=float, default=1.0, help='frames per second assumed for image folders')
+    parser.add_argument('--max-gap', type=float, default=10.0,
+                        help='seconds a student may go unseen within one presence interval')
+    parser.add_argument('--truth', help='ground-truth CSV (source,frame,name) for precision/recall')
+    args = parser.parse_args()
+
+    if not GALLERY_PATH.exists():
+        print('Encodings not found. Run encode_faces.py first.')
+        exit(1)
+    face_index = load_matcher()
+    if args.session is not None:
+        init_db()
+
+    frames = queue.Queue(maxsize=args.workers * 4)
+    decoder = threading.Thread(target=decode_frames, name='decoder', daemon=True,
+                               args=(args.inputs, frames, args.every, args.scale, args.image_fps))
+    presence = defaultdict(list)   # name -> seconds into the recording it was seen
+    predicted = {}                 # (source, frame) -> names
+    frame_count = face_count = 0
+
+    start = time.perf_counter()
+    decoder.start()
+    with ProcessPoolExecutor(args.workers, initializer=init_worker, initargs=(args.detector,)) as pool:
+        for source_name, index, seconds, boxes, encodings in ordered_results(pool, frames, args.workers * 2,
+                                                                            args.scale):
+            matches = face_index.match(encodings) if len(encodings) else []
+            names = {m.name for m in matches if m.name != UNKNOWN}
+            predicted[(source_name, index)] = names
+            for person in names:
+                presence[person].append(seconds)
+            frame_count += 1
+            face_count += len(boxes)
+    elapsed = time.perf_counter() - start
+
+    print(f"Processed {frame_count} frames, {face_count} faces in {elapsed:.1f}s: "
+          f"{frame_count / elapsed:.1f} frames/s, {face_count / elapsed:.1f} faces/s ({args.workers} workers)")
+    print(f"Recognized {len(presence)} people")
+
+    if args.truth:
+        truth = load_ground_truth(args.truth)
+        precision, recall, tp, fp, fn, scored = score(predicted, truth)
+        print(f"Against {scored} of {len(truth)} labeled frames (the ones processed): precision {precision:.3f}, recall {recall:.3f} "
+              f"(tp {tp}, fp {fp}, fn {fn})")
+
+    if args.session is not None:
+        written = write_session(args.session, presence, args.offset, args.max_gap)
+        print(f"Wrote {written} attendance records to session {args.session}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+"""Recall and latency of the IVF index against exact FaceIndex search.
+
+Run from the repository root:
+
+    python -m benchmarks.ann_index [--people 1000 10000 100000] [--nprobe 1 4 8 16]
+"""
+import argparse
+import time
+
+import numpy as np
+
+from face_index import FaceIndex, IVFIndex
+
+TOLERANCE = 0.48
+
+
+def synthetic_gallery(people, photos, rng):
+    # One unit-norm identity vector per person, photos scattered around it
+    centers = rng.normal(size=(people, 128)).astype(np.float32)
+    centers /= np.linalg.norm(centers, axis=1, keepdims=True)
+    encodings = np.repeat(centers, photos, axis=0)
+    encodings += rng.normal(scale=0.02, size=encodings.shape).astype(np.float32)
+    names = [f"student_{i // photos}" for i in range(len(encodings))]
+    return centers, encodings, names
+
+
+def per_query_ms(matcher, queries):
+    start = time.perf_counter()
+    for q in queries:
+        matcher.match(q[None, :])
+    return (time.perf_counter() - start) * 1000 / len(queries)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--people', type=int, nargs='+', default=(1_000, 10_000, 100_000))
+    parser.add_argument('--photos', type=int, default=5, help='encodings per person')
+    parser.add_argument('--nprobe', type=int, nargs='+', default=(1, 4, 8, 16))
+    parser.add_argument('--queries', type=int, default=200)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    print(f"{'people':>7} {'method':>12} {'recall@1':>9} {'ms/query':>9}")
+    for people in args.people:
+        centers, encodings, names = synthetic_gallery(people, args.photos, rng)
+        exact = FaceIndex(encodings, names, tolerance=TOLERANCE)
+
+        build_start = time.perf_counter()
+        ivf = IVFIndex.build(exact)
+        build = time.perf_counter() - build_start
+
+        picks = rng.integers(0, people, size=args.queries)
+        queries = centers[picks] + rng.normal(scale=0.02, size=(args.queries, 128)).astype(np.float32)
+        truth = [m.name for m in exact.match(queries)]
+
+        print(f"{people:>7} {'brute force':>12} {1.0:>9.3f} {per_query_ms(exact, queries):>9.3f}")
+        for nprobe in args.nprobe:
+            ivf.nprobe = nprobe
+            found = [m.name for m in ivf.match(queries)]
+            recall = np.mean([a == b for a, b in zip(found, truth)])
+            label = f"ivf np={nprobe}"
+            print(f"{people:>7} {label:>12} {recall:>9.3f} {per_query_ms(ivf, queries):>9.3f}")
+        print(f"{people:>7} {'build s':>12} {'':>9} {build:>9.1f}  ({len(ivf.coarse)} buckets)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,159 @@
+"""Dashboard/recognizer query latency before and after the schema tuning.
+
+Seeds a year of attendance for 5k students into two temporary databases:
+one with the original schema (rollback journal, no indexes, a new connection
+per query) and one migrated by database.init_db (WAL, indexes, per-thread
+connection reuse).  Then times the dashboard queries, alone and while a
+writer thread checkpoints attendance.
+
+Run from the repository root:
+
+    python -m benchmarks.database [--students 5000] [--days 180]
+"""
+import argparse
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import database
+
+VIEW_ATTENDANCE = '''
+    SELECT a.id, st.name, st.roll_no, a.entry_time, a.exit_time, a.duration_sec, a.status
+    FROM attendance a JOIN students st ON a.student_id=st.id
+    WHERE a.session_id=?
+'''
+TODAYS_SESSIONS = '''
+    SELECT s.id, sub.name as subject, s.teacher, s.date, s.start_time, s.end_time, s.active
+    FROM sessions s LEFT JOIN subjects sub ON s.subject_id=sub.id
+    WHERE date=?
+'''
+STUDENT_HISTORY = 'SELECT COUNT(*), SUM(duration_sec) FROM attendance WHERE student_id=?'
+ACTIVE_SESSION = 'SELECT id FROM sessions WHERE active=1'
+
+# The tables as database.py created them before the migrations
+ORIGINAL_SCHEMA = (
+    '''CREATE TABLE students (id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT NOT NULL UNIQUE,
+       roll_no TEXT, added_on TEXT DEFAULT (datetime('now')))''',
+    'CREATE TABLE subjects (id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT NOT NULL UNIQUE)',
+    '''CREATE TABLE sessions (id INTEGER PRIMARY KEY AUTOINCREMENT, subject_id INTEGER, teacher TEXT,
+       date TEXT, start_time TEXT, end_time TEXT, active INTEGER DEFAULT 0)''',
+    '''CREATE TABLE attendance (id INTEGER PRIMARY KEY AUTOINCREMENT, session_id INTEGER,
+       student_id INTEGER, entry_time TEXT, exit_time TEXT, duration_sec INTEGER, status TEXT,
+       marked_at TEXT DEFAULT (datetime('now')))''',
+)
+
+
+
+def seed(conn, students, days, sessions_per_day, class_size, rng):
+    cur = conn.cursor()
+    cur.executemany('INSERT INTO students(name, roll_no) VALUES (?, ?)',
+                    [(f"student_{i}", f"R{i:05d}") for i in range(students)])
+    cur.executemany('INSERT INTO subjects(name) VALUES (?)', [(f"subject_{i}",) for i in range(50)])
+    sessions, attendance = [], []
+    session_id = 0
+    for day in range(days):
+        date = f"2025-{1 + day // 28 % 12:02d}-{1 + day % 28:02d}"
+        for slot in range(sessions_per_day):
+            session_id += 1
+            hour = 8 + slot % 9
+            sessions.append((1 + slot % 50, 'teacher', date, f"{hour:02d}:00:00", f"{hour:02d}:50:00"))
+            for student in rng.sample(range(1, students + 1), class_size):
+                attendance.append((session_id, student, f"{date} {hour:02d}:01:00",
+                                   f"{date} {hour:02d}:49:00", 2880, 'Present'))
+    cur.executemany('INSERT INTO sessions(subject_id, teacher, date, start_time, end_time) VALUES (?, ?, ?, ?, ?)',
+                    sessions)
+    cur.executemany('''INSERT INTO attendance(session_id, student_id, entry_time, exit_time, duration_sec, status)
+                       VALUES (?, ?, ?, ?, ?, ?)''', attendance)
+    conn.commit()
+    return session_id, len(attendance)
+
+
+def baseline_conn(path):
+    # What get_conn() did before: a fresh default connection per call
+    conn = sqlite3.connect(path)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+def run_queries(get_conn, sessions, students, n, rng):
+    timings = {'view_attendance': [], 'todays_sessions': [], 'student_history': [], 'active_session': []}
+    for _ in range(n):
+        for name, sql, arg in (('view_attendance', VIEW_ATTENDANCE, (rng.randint(1, sessions),)),
+                               ('todays_sessions', TODAYS_SESSIONS, ('2025-06-15',)),
+                               ('student_history', STUDENT_HISTORY, (rng.randint(1, students),)),
+                               ('active_session', ACTIVE_SESSION, ())):
+            start = time.perf_counter()
+            conn = get_conn()
+            conn.execute(sql, arg).fetchall()
+            conn.close()
+            timings[name].append(time.perf_counter() - start)
+    return {k: 1000 * sorted(v)[len(v) // 2] for k, v in timings.items()}
+
+
+def writer_loop(get_conn, sessions, stop):
+    # Recognizer-style checkpoints: one transaction of 60 upserts, twice a second
+    rng = random.Random(1)
+    while not stop.is_set():
+        conn = get_conn()
+        session_id = rng.randint(1, sessions)
+        with conn:
+            conn.executemany('UPDATE attendance SET exit_time=exit_time WHERE session_id=? AND student_id=?',
+                             [(session_id, rng.randint(1, 5000)) for _ in range(60)])
+        conn.close()
+        time.sleep(0.5)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--students', type=int, default=5000)
+    parser.add_argument('--days', type=int, default=180, help='teaching days in the year')
+    parser.add_argument('--sessions-per-day', type=int, default=100)
+    parser.add_argument('--class-size', type=int, default=50)
+    parser.add_argument('--queries', type=int, default=50)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        results = {}
+        for label in ('baseline', 'tuned'):
+            path = Path(tmp) / f"{label}.db"
+            database.DB_PATH = path
+            if label == 'tuned':
+                database.init_db()
+                get_conn = database.get_conn
+            else:
+                # Original schema only: skip WAL and migrations
+                conn = baseline_conn(path)
+                for stmt in ORIGINAL_SCHEMA:
+                    conn.execute(stmt)
+                conn.close()
+                get_conn = lambda: baseline_conn(path)
+
+            start = time.perf_counter()
+            conn = get_conn()
+            sessions, rows = seed(conn, args.students, args.days, args.sessions_per_day,
+                                  args.class_size, random.Random(0))
+            conn.close()
+            print(f"{label}: seeded {rows} attendance rows over {sessions} sessions "
+                  f"in {time.perf_counter() - start:.1f}s")
+
+            idle = run_queries(get_conn, sessions, args.students, args.queries, random.Random(2))
+            stop = threading.Event()
+            writer = threading.Thread(target=writer_loop, args=(get_conn, sessions, stop), daemon=True)
+            writer.start()
+            busy = run_queries(get_conn, sessions, args.students, args.queries, random.Random(3))
+            stop.set()
+            writer.join()
+            results[label] = (idle, busy)
+
+        print(f"\n{'query (median ms)':<18} {'baseline':>10} {'tuned':>10} {'baseline+writes':>16} {'tuned+writes':>13}")
+        for name in results['baseline'][0]:
+            b_idle, b_busy = results['baseline'][0][name], results['baseline'][1][name]
+            t_idle, t_busy = results['tuned'][0][name], results['tuned'][1][name]
+            print(f"{name:<18} {b_idle:>10.2f} {t_idle:>10.2f} {b_busy:>16.2f} {t_busy:>13.2f}")
+
+
+if __name__ == '__main__':
+    main()
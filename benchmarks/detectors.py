@@ -0,0 +1,124 @@
+"""Speed and recall of the face detector backends at several input widths.
+
+Every image of a fixed set is resized to each width and run through each
+backend.  Recall is measured against a ground-truth CSV
+(image,top,right,bottom,left in original pixels) when given, otherwise
+against dlib HOG on the full-resolution image.  A detection counts if its
+IoU with a reference face is at least --iou; backends box faces
+differently, so the default is loose.
+
+Run from the repository root (hog/cnn need face_recognition; ssd/yunet need
+`python detectors.py download`):
+
+    python -m benchmarks.detectors [dataset] [--widths 320 480 640] [--truth faces.csv]
+"""
+import argparse
+import csv
+import time
+from collections import defaultdict
+from pathlib import Path
+
+import cv2
+
+from detectors import BACKENDS, DETECTOR_DEFAULTS, create_backend
+
+IMAGE_SUFFIXES = {'.jpg', '.jpeg', '.png', '.bmp'}
+
+
+def load_images(directory):
+    paths = sorted(p for p in Path(directory).rglob('*') if p.suffix.lower() in IMAGE_SUFFIXES)
+    images = {}
+    for path in paths:
+        bgr = cv2.imread(str(path))
+        if bgr is not None:
+            images[path.relative_to(directory).as_posix()] = cv2.cvtColor(bgr, cv2.COLOR_BGR2RGB)
+    return images
+
+
+def load_truth(path):
+    truth = defaultdict(list)
+    with open(path, newline='') as f:
+        for row in csv.DictReader(f):
+            truth[row['image'].strip()].append(tuple(int(row[k]) for k in ('top', 'right', 'bottom', 'left')))
+    return truth
+
+
+def area(box):
+    top, right, bottom, left = box
+    return (right - left) * (bottom - top)
+
+
+def iou(a, b):
+    top, right, bottom, left = max(a[0], b[0]), min(a[1], b[1]), min(a[2], b[2]), max(a[3], b[3])
+    inter = max(0, right - left) * max(0, bottom - top)
+    union = area(a) + area(b) - inter
+    return inter / union if union else 0.0
+
+
+def matched(found, reference, threshold):
+    """Reference faces covered by a detection, each detection used once"""
+    unused = list(found)
+    hits = 0
+    for ref in reference:
+        best = max(unused, key=lambda box: iou(box, ref), default=None)
+        if best is not None and iou(best, ref) >= threshold:
+            unused.remove(best)
+            hits += 1
+    return hits
+
+
+def resize_to(rgb, width):
+    factor = width / rgb.shape[1]
+    if factor >= 1:
+        return rgb, 1.0
+    return cv2.resize(rgb, (width, round(rgb.shape[0] * factor)), interpolation=cv2.INTER_AREA), factor
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('images', nargs='?', default='dataset', help='Directory of images (searched recursively)')
+    parser.add_argument('--widths', type=int, nargs='+', default=[320, 480, 640])
+    parser.add_argument('--backends', nargs='+', default=list(BACKENDS), choices=BACKENDS)
+    parser.add_argument('--truth', help='CSV of image,top,right,bottom,left face boxes')
+    parser.add_argument('--iou', type=float, default=0.3)
+    parser.add_argument('--repeat', type=int, default=3, help='Timed passes over the set (best is reported)')
+    args = parser.parse_args()
+
+    images = load_images(args.images)
+    if not images:
+        raise SystemExit(f"No images under {args.images}")
+    if args.truth:
+        truth = load_truth(args.truth)
+        reference_name = args.truth
+    else:
+        hog = create_backend('hog')
+        truth = {name: hog.detect(rgb) for name, rgb in images.items()}
+        reference_name = 'full-resolution hog'
+    faces = sum(len(truth.get(name, ())) for name in images)
+    print(f"{len(images)} images, {faces} reference faces ({reference_name})")
+    print(f"{'backend':<8} {'width':>5} {'ms/frame':>9} {'recall':>7} {'found':>6}")
+
+    for backend in args.backends:
+        try:
+            options = {k: v for k, v in DETECTOR_DEFAULTS.items() if k != 'backend'}
+            detector = create_backend(backend, **options)
+        except (FileNotFoundError, ImportError) as e:
+            print(f"{backend:<8} skipped: {e}")
+            continue
+        for width in args.widths:
+            resized = {name: resize_to(rgb, width) for name, rgb in images.items()}
+            best = float('inf')
+            for _ in range(args.repeat):
+                found = {}
+                start = time.perf_counter()
+                for name, (rgb, factor) in resized.items():
+                    found[name] = [tuple(int(v / factor) for v in box) for box in detector.detect(rgb)]
+                best = min(best, time.perf_counter() - start)
+            hits = sum(matched(found[name], truth.get(name, ()), args.iou) for name in images)
+            found_count = sum(len(boxes) for boxes in found.values())
+            recall = hits / faces if faces else 0.0
+            print(f"{backend:<8} {width:>5} {best / len(images) * 1000:>9.1f} {recall:>7.1%} {found_count:>6}")
+
+
+if __name__ == '__main__':
+    main()
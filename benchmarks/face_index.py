@@ -0,0 +1,79 @@
+"""Compare the compare_faces first-match scan with the batched FaceIndex.
+
+Run from the repository root:
+
+    python -m benchmarks.face_index [--faces 5] [--repeat 20]
+"""
+import argparse
+import time
+
+import numpy as np
+
+from face_index import FaceIndex
+
+try:
+    import face_recognition
+
+    def compare_faces(known_encodings, encoding, tolerance):
+        return face_recognition.compare_faces(known_encodings, encoding, tolerance=tolerance)
+except ImportError:
+    # Same computation as face_recognition.compare_faces, for boxes without dlib
+    def compare_faces(known_encodings, encoding, tolerance):
+        return list(np.linalg.norm(np.array(known_encodings) - encoding, axis=1) <= tolerance)
+
+GALLERY_SIZES = (100, 1_000, 10_000, 100_000)
+TOLERANCE = 0.48
+
+
+def synthetic_gallery(n, rng, photos_per_person=5):
+    # Encodings from face_recognition are roughly unit-norm 128-d vectors
+    encodings = rng.normal(size=(n, 128)).astype(np.float64)
+    encodings /= np.linalg.norm(encodings, axis=1, keepdims=True)
+    names = [f"student_{i // photos_per_person}" for i in range(n)]
+    return list(encodings), names
+
+
+def current_path(known_encodings, known_names, frame_encodings):
+    names = []
+    for encoding in frame_encodings:
+        matches = compare_faces(known_encodings, encoding, TOLERANCE)
+        names.append(known_names[matches.index(True)] if True in matches else "Unknown")
+    return names
+
+
+def timed(fn, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--faces', type=int, default=5, help='faces per frame')
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--sizes', type=int, nargs='+', default=GALLERY_SIZES)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    print(f"{'gallery':>8} {'compare_faces ms':>17} {'FaceIndex ms':>13} {'build ms':>9} {'speedup':>8}")
+    for n in args.sizes:
+        known_encodings, known_names = synthetic_gallery(n, rng)
+        # Queries are noisy copies of enrolled faces so both paths find a match
+        picks = rng.integers(0, n, size=args.faces)
+        frame = [known_encodings[i] + rng.normal(scale=0.01, size=128) for i in picks]
+
+        build_start = time.perf_counter()
+        index = FaceIndex(known_encodings, known_names, tolerance=TOLERANCE)
+        build = time.perf_counter() - build_start
+
+        repeat = max(1, args.repeat // 10) if n >= 100_000 else args.repeat
+        old = timed(lambda: current_path(known_encodings, known_names, frame), repeat)
+        new = timed(lambda: index.match(frame), repeat)
+        print(f"{n:>8} {old * 1000:>17.2f} {new * 1000:>13.2f} {build * 1000:>9.1f} {old / new:>7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,138 @@
+"""Delivery latency of the live attendance feed with many open session pages.
+
+The dashboard is served by werkzeug's threaded server from a scratch
+database, and --viewers raw sockets subscribe to /stream/<session>.  A
+separate connection then commits update events the way the recognizer's
+writer does, each stamped with its commit time, and the benchmark measures
+how long each takes to reach every viewer.  The hub's read count shows the
+database is queried at most once per poll interval, however many viewers
+are open.
+
+Run from the repository root:
+
+    python -m benchmarks.live_feed [--viewers 500] [--events 50] [--rate 10]
+"""
+import argparse
+import json
+import logging
+import os
+import resource
+import selectors
+import socket
+import tempfile
+import threading
+import time
+
+import numpy as np
+from werkzeug.serving import make_server
+
+import database
+from live_events import publish_events
+
+
+def subscribe(port, session_id):
+    sock = socket.create_connection(('127.0.0.1', port))
+    # HTTP/1.0 keeps the body unchunked, so frames can be split on blank lines
+    sock.sendall(f"GET /stream/{session_id}?after=0 HTTP/1.0\r\nHost: localhost\r\n\r\n".encode())
+    sock.setblocking(False)
+    return sock
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--viewers', type=int, default=500)
+    parser.add_argument('--events', type=int, default=50)
+    parser.add_argument('--rate', type=float, default=10, help='Events committed per second')
+    parser.add_argument('--poll-interval', type=float, default=0.25, help='live_feed.poll_interval')
+    args = parser.parse_args()
+
+    # Every viewer holds a client and a server socket
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    wanted = args.viewers * 2 + 256
+    if soft < wanted:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (min(wanted, hard), hard))
+
+    # Scratch database and config; the dashboard reads both at import
+    os.chdir(tempfile.mkdtemp())
+    with open('camera_config.json', 'w') as f:
+        json.dump({'live_feed': {'poll_interval': args.poll_interval}}, f)
+    import app as dashboard
+    conn = database.get_conn()
+    session_id = conn.execute("INSERT INTO sessions(teacher, date, start_time, end_time, active) "
+                              "VALUES ('benchmark', date('now', 'localtime'), '00:00', '23:59', 1)").lastrowid
+    # One event up front so every stream answers as soon as it is open
+    publish_events(conn.cursor(), [(session_id, 'summary', {'total': 0, 'present': 0, 'absent': 0})])
+    conn.commit()
+
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    server = make_server('127.0.0.1', 0, dashboard.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    selector = selectors.DefaultSelector()
+    buffers = {}
+    start = time.perf_counter()
+    for _ in range(args.viewers):
+        sock = subscribe(server.server_port, session_id)
+        selector.register(sock, selectors.EVENT_READ)
+        buffers[sock] = b''
+
+    latencies = []
+    connected = set()
+
+    def read(timeout):
+        for key, _ in selector.select(timeout):
+            chunk = key.fileobj.recv(65536)
+            now = time.time()
+            if not chunk:
+                selector.unregister(key.fileobj)
+                continue
+            buffer = buffers[key.fileobj] + chunk
+            if key.fileobj not in connected:
+                if b'\r\n\r\n' not in buffer:
+                    buffers[key.fileobj] = buffer
+                    continue
+                connected.add(key.fileobj)
+                buffer = buffer.split(b'\r\n\r\n', 1)[1]
+            *frames, buffers[key.fileobj] = buffer.split(b'\n\n')
+            for frame in frames:
+                data = [line[6:] for line in frame.split(b'\n') if line.startswith(b'data: ')]
+                if data:
+                    sent = json.loads(data[0]).get('sent')
+                    if sent is not None:
+                        latencies.append(now - sent)
+
+    while len(connected) < args.viewers and time.perf_counter() - start < 30:
+        read(0.1)
+    print(f"{len(connected)}/{args.viewers} viewers connected in {time.perf_counter() - start:.1f} s")
+
+    def produce():
+        conn = database.get_conn()
+        for i in range(args.events):
+            with conn:
+                publish_events(conn.cursor(), [(session_id, 'update',
+                                                 {'student_id': i, 'status': 'Present', 'sent': time.time()})])
+            time.sleep(1 / args.rate)
+        conn.close()
+
+    polls_before = dashboard.event_hub.polls
+    producer = threading.Thread(target=produce)
+    producer.start()
+    expected = args.events * len(connected)
+    deadline = time.perf_counter() + args.events / args.rate + 10
+    while len(latencies) < expected and time.perf_counter() < deadline:
+        read(0.1)
+    producer.join()
+
+    ms = np.array(latencies) * 1000
+    print(f"delivered {len(latencies)}/{expected} events "
+          f"({args.events} commits x {len(connected)} viewers)")
+    if len(ms):
+        print(f"latency ms: p50 {np.percentile(ms, 50):.1f}  p99 {np.percentile(ms, 99):.1f}  max {ms.max():.1f}")
+    print(f"hub database reads: {dashboard.event_hub.polls - polls_before} for {args.events} commits "
+          f"(poll interval {args.poll_interval} s)")
+    dashboard.event_hub.stop()
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
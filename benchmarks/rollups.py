@@ -0,0 +1,111 @@
+"""Report queries from the rollup tables versus ad-hoc joins over attendance.
+
+Seeds ~1M attendance rows (triggers keep the rollups current while seeding),
+then times per-student attendance, per-subject averages and the defaulter
+list both ways and checks that they agree.
+
+Run from the repository root:
+
+    python -m benchmarks.rollups [--days 200] [--sessions-per-day 100] [--class-size 50]
+"""
+import argparse
+import random
+import tempfile
+import time
+from pathlib import Path
+
+import database
+import rollups
+from benchmarks.database import seed
+from utils import DEFAULTER_THRESHOLD
+
+ADHOC_STUDENT = '''
+    WITH held AS (
+        SELECT COALESCE(s.subject_id, 0) AS subject_id, COUNT(DISTINCT a.session_id) AS sessions_held
+        FROM attendance a JOIN sessions s ON a.session_id=s.id GROUP BY 1
+    )
+    SELECT a.student_id, COALESCE(s.subject_id, 0) AS subject_id,
+           SUM(a.status IS 'Present') AS present, h.sessions_held
+    FROM attendance a JOIN sessions s ON a.session_id=s.id
+    JOIN held h ON h.subject_id=COALESCE(s.subject_id, 0)
+    JOIN students st ON st.id=a.student_id
+    WHERE a.student_id=?
+    GROUP BY a.student_id, COALESCE(s.subject_id, 0)
+'''
+ADHOC_SUBJECTS = '''
+    WITH held AS (
+        SELECT COALESCE(s.subject_id, 0) AS subject_id, COUNT(DISTINCT a.session_id) AS sessions_held
+        FROM attendance a JOIN sessions s ON a.session_id=s.id GROUP BY 1
+    ), per_student AS (
+        SELECT a.student_id, COALESCE(s.subject_id, 0) AS subject_id, SUM(a.status IS 'Present') AS present
+        FROM attendance a JOIN sessions s ON a.session_id=s.id GROUP BY 1, 2
+    )
+    SELECT p.subject_id, AVG(1.0 * p.present / h.sessions_held)
+    FROM per_student p JOIN held h ON h.subject_id=p.subject_id GROUP BY p.subject_id
+'''
+ADHOC_DEFAULTERS = '''
+    WITH held AS (
+        SELECT COALESCE(s.subject_id, 0) AS subject_id, COUNT(DISTINCT a.session_id) AS sessions_held
+        FROM attendance a JOIN sessions s ON a.session_id=s.id GROUP BY 1
+    ), per_student AS (
+        SELECT a.student_id, COALESCE(s.subject_id, 0) AS subject_id, SUM(a.status IS 'Present') AS present
+        FROM attendance a JOIN sessions s ON a.session_id=s.id GROUP BY 1, 2
+    )
+    SELECT p.student_id, p.subject_id
+    FROM per_student p JOIN held h ON h.subject_id=p.subject_id
+    WHERE 1.0 * p.present / h.sessions_held < ?
+'''
+
+
+def timed(fn, repeat):
+    best, result = float('inf'), None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--students', type=int, default=5000)
+    parser.add_argument('--days', type=int, default=200)
+    parser.add_argument('--sessions-per-day', type=int, default=100)
+    parser.add_argument('--class-size', type=int, default=50)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        database.DB_PATH = Path(tmp) / 'rollups.db'
+        database.init_db()
+        conn = database.get_conn()
+        start = time.perf_counter()
+        _, rows = seed(conn, args.students, args.days, args.sessions_per_day, args.class_size, random.Random(0))
+        print(f"Seeded {rows} attendance rows with rollup triggers in {time.perf_counter() - start:.1f}s")
+        # A share of absences so there are defaulters to find
+        conn.execute("UPDATE attendance SET status='Absent' WHERE id % 5 = 0")
+        conn.commit()
+
+        rebuild_ms, _ = timed(lambda: rollups.rebuild(conn), 1)
+        print(f"Full rebuild: {rebuild_ms:.0f} ms\n")
+
+        student = random.Random(1).randint(1, args.students)
+        cases = [
+            ('per-student', lambda: conn.execute(ADHOC_STUDENT, (student,)).fetchall(),
+             lambda: rollups.student_attendance(conn, student_id=student)),
+            ('subject averages', lambda: conn.execute(ADHOC_SUBJECTS).fetchall(),
+             lambda: rollups.subject_averages(conn)),
+            ('defaulters', lambda: conn.execute(ADHOC_DEFAULTERS, (DEFAULTER_THRESHOLD,)).fetchall(),
+             lambda: rollups.defaulters(conn)),
+        ]
+        print(f"{'report':<18} {'ad-hoc ms':>10} {'rollup ms':>10} {'speedup':>8} {'rows':>7}")
+        for name, adhoc, rollup in cases:
+            adhoc_ms, adhoc_rows = timed(adhoc, args.repeat)
+            rollup_ms, rollup_rows = timed(rollup, args.repeat)
+            assert len(adhoc_rows) == len(rollup_rows), (name, len(adhoc_rows), len(rollup_rows))
+            print(f"{name:<18} {adhoc_ms:>10.1f} {rollup_ms:>10.2f} {adhoc_ms / rollup_ms:>7.0f}x {len(rollup_rows):>7}")
+        conn.really_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+"""Trigger-to-log latency of sensor.py's listener, without hardware.
+
+A FileSerial stands in for the Arduino and a video file or image directory
+for the camera.  Triggers are sent one at a time and in back-to-back bursts;
+every trigger should be marked in the active session, each within a
+fraction of a second, and the writer batches them into attendance rows.
+
+Run from the repository root (needs face_recognition):
+
+    python -m benchmarks.sensor --camera path/to/door.avi [--triggers 20] [--burst 3]
+"""
+import argparse
+import os
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import database
+import sensor
+from attendance_writer import AttendanceWriter
+from session_cache import SessionCache
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--camera', required=True, help='Video file or image directory played as the camera')
+    parser.add_argument('--triggers', type=int, default=20)
+    parser.add_argument('--burst', type=int, default=3, help='Triggers sent back to back in each burst')
+    parser.add_argument('--gap', type=float, default=0.5, help='Seconds between bursts')
+    args = parser.parse_args()
+
+    sensor.load_gallery()
+    camera = str(Path(args.camera).resolve())
+
+    # Log into a scratch database with one active session, not the repository's attendance.db
+    os.chdir(tempfile.mkdtemp())
+    database.init_db()
+    conn = database.get_conn()
+    conn.execute("INSERT INTO sessions(teacher, date, start_time, end_time, active) "
+                 "VALUES ('benchmark', date('now', 'localtime'), '00:00', '23:59', 1)")
+    conn.commit()
+    session_cache = SessionCache().start()
+    attendance_writer = AttendanceWriter(session_cache).start()
+
+    config = dict(sensor.SENSOR_DEFAULTS)
+    ring = sensor.FrameRing(sensor.Source(camera), config['buffer_frames']).start()
+    port = sensor.FileSerial('triggers.txt')
+    listener = sensor.SensorListener(port, ring, config, session_cache, attendance_writer)
+    logged = threading.Semaphore(0)
+    listener.on_logged = lambda name, latency: logged.release()
+    listener.start()
+    time.sleep(1)  # Fill the ring buffer
+
+    sent = 0
+    with open('triggers.txt', 'a') as triggers:
+        while sent < args.triggers:
+            for _ in range(min(args.burst, args.triggers - sent)):
+                triggers.write('Detected\n')
+                sent += 1
+            triggers.flush()
+            time.sleep(args.gap)
+
+    received = sum(logged.acquire(timeout=10) for _ in range(sent))
+    listener.stop()
+    ring.stop()
+    port.close()
+    session_cache.stop()
+    attendance_writer.stop()
+    rows = conn.execute('SELECT COUNT(*) FROM attendance').fetchone()[0]
+    lat = sorted(listener.latencies)
+    print(f"\n{sent} triggers sent, {received} logged, {ring.frames_read} frames buffered, "
+          f"{rows} attendance rows written")
+    if lat:
+        print(f"latency: median {lat[len(lat) // 2] * 1000:.0f} ms, p95 {lat[int(len(lat) * 0.95)] * 1000:.0f} ms, "
+              f"max {lat[-1] * 1000:.0f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,23 @@
+import argparse
+import time
+
+from face_index import INDEX_PATH, FaceIndex, IVFIndex
+from gallery_store import GALLERY_PATH
+
+parser = argparse.ArgumentParser(description='Build the optional IVF index used for large galleries')
+parser.add_argument('--per-person', type=int, default=3, help='centroids kept per person')
+parser.add_argument('--nlist', type=int, default=None, help='coarse buckets (default 4*sqrt(centroids))')
+args = parser.parse_args()
+
+if not GALLERY_PATH.exists():
+    print('Gallery not found. Run encode_faces.py first.')
+    exit(1)
+
+start = time.perf_counter()
+face_index = FaceIndex.from_gallery(GALLERY_PATH)
+ivf = IVFIndex.build(face_index, per_person=args.per_person, nlist=args.nlist)
+ivf.save(INDEX_PATH)
+
+print(f"Indexed {len(face_index.names)} people: {len(ivf.centroids)} centroids in "
+      f"{len(ivf.coarse)} buckets ({time.perf_counter() - start:.1f}s)")
+print('Saved index:', INDEX_PATH)
@@ -1,16 +1,287 @@
 import sqlite3
+import threading
+import time
 from pathlib import Path
 
+import metrics
+
 DB_PATH = Path("attendance.db")
 
-def get_conn():
-    conn = sqlite3.connect(DB_PATH)
+# Applied to every connection: WAL lets the dashboard read while the recognizer writes
+CONNECTION_PRAGMAS = (
+    'PRAGMA busy_timeout=5000',
+    'PRAGMA synchronous=NORMAL',   # Safe with WAL; fsync on checkpoint instead of every commit
+    'PRAGMA cache_size=-16000',    # 16 MB page cache
+    'PRAGMA temp_store=MEMORY',
+)
+
+# Subject of an attendance row's session; 0 when the session has none
+def _subject_of(row):
+    return f"COALESCE((SELECT subject_id FROM sessions WHERE id={row}.session_id), 0)"
+
+def _rollup_add(row):
+    subject = _subject_of(row)
+    return f'''
+        INSERT INTO subject_rollup(subject_id, sessions_held)
+            SELECT {subject}, 1 WHERE NOT EXISTS (SELECT 1 FROM session_rollup WHERE session_id={row}.session_id)
+            ON CONFLICT(subject_id) DO UPDATE SET sessions_held=sessions_held+1;
+        INSERT INTO session_rollup(session_id, subject_id, records, present)
+            VALUES ({row}.session_id, {subject}, 1, {row}.status IS 'Present')
+            ON CONFLICT(session_id) DO UPDATE SET records=records+1, present=present+excluded.present;
+        INSERT INTO attendance_rollup(student_id, subject_id, records, present, duration_sec)
+            VALUES ({row}.student_id, {subject}, 1, {row}.status IS 'Present', COALESCE({row}.duration_sec, 0))
+            ON CONFLICT(student_id, subject_id) DO UPDATE SET records=records+1,
+                present=present+excluded.present, duration_sec=duration_sec+excluded.duration_sec;
+    '''
+
+def _rollup_remove(row):
+    subject = _subject_of(row)
+    return f'''
+        UPDATE attendance_rollup SET records=records-1, present=present-({row}.status IS 'Present'),
+            duration_sec=duration_sec-COALESCE({row}.duration_sec, 0)
+            WHERE student_id={row}.student_id AND subject_id={subject};
+        UPDATE session_rollup SET records=records-1, present=present-({row}.status IS 'Present')
+            WHERE session_id={row}.session_id;
+        UPDATE subject_rollup SET sessions_held=sessions_held-1
+            WHERE subject_id={subject}
+            AND EXISTS (SELECT 1 FROM session_rollup WHERE session_id={row}.session_id AND records=0);
+        DELETE FROM session_rollup WHERE session_id={row}.session_id AND records=0;
+    '''
+
+# Recomputes every rollup from attendance; used for the backfill and by `python rollups.py rebuild`
+REBUILD_ROLLUPS = '''
+    DELETE FROM attendance_rollup;
+    DELETE FROM session_rollup;
+    DELETE FROM subject_rollup;
+    INSERT INTO session_rollup(session_id, subject_id, records, present)
+        SELECT a.session_id, COALESCE(s.subject_id, 0), COUNT(*), SUM(a.status IS 'Present')
+        FROM attendance a LEFT JOIN sessions s ON a.session_id=s.id
+        GROUP BY a.session_id;
+    INSERT INTO subject_rollup(subject_id, sessions_held)
+        SELECT subject_id, COUNT(*) FROM session_rollup GROUP BY subject_id;
+    INSERT INTO attendance_rollup(student_id, subject_id, records, present, duration_sec)
+        SELECT a.student_id, COALESCE(s.subject_id, 0), COUNT(*), SUM(a.status IS 'Present'),
+               SUM(COALESCE(a.duration_sec, 0))
+        FROM attendance a LEFT JOIN sessions s ON a.session_id=s.id
+        GROUP BY a.student_id, COALESCE(s.subject_id, 0);
+'''
+
+# Schema migrations, applied in order and tracked with PRAGMA user_version
+MIGRATIONS = [
+    # 1: indexes for the dashboard's per-session view, per-student lookups and today's sessions
+    '''
+    CREATE INDEX IF NOT EXISTS idx_attendance_session ON attendance(session_id, student_id);
+    CREATE INDEX IF NOT EXISTS idx_attendance_student ON attendance(student_id);
+    CREATE INDEX IF NOT EXISTS idx_sessions_date ON sessions(date);
+    CREATE INDEX IF NOT EXISTS idx_sessions_active ON sessions(active);
+    ''',
+    # 2: rollups for the reports, kept current by triggers on every attendance write
+    f'''
+    CREATE TABLE IF NOT EXISTS attendance_rollup (
+        student_id INTEGER NOT NULL,
+        subject_id INTEGER NOT NULL,
+        records INTEGER NOT NULL DEFAULT 0,
+        present INTEGER NOT NULL DEFAULT 0,
+        duration_sec INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY(student_id, subject_id)
+    );
+    CREATE INDEX IF NOT EXISTS idx_attendance_rollup_subject ON attendance_rollup(subject_id);
+    CREATE TABLE IF NOT EXISTS session_rollup (
+        session_id INTEGER PRIMARY KEY,
+        subject_id INTEGER NOT NULL,
+        records INTEGER NOT NULL DEFAULT 0,
+        present INTEGER NOT NULL DEFAULT 0
+    );
+    CREATE TABLE IF NOT EXISTS subject_rollup (
+        subject_id INTEGER PRIMARY KEY,
+        sessions_held INTEGER NOT NULL DEFAULT 0
+    );
+    CREATE TRIGGER IF NOT EXISTS trg_attendance_rollup_insert AFTER INSERT ON attendance
+    BEGIN {_rollup_add('NEW')} END;
+    CREATE TRIGGER IF NOT EXISTS trg_attendance_rollup_delete AFTER DELETE ON attendance
+    BEGIN {_rollup_remove('OLD')} END;
+    CREATE TRIGGER IF NOT EXISTS trg_attendance_rollup_update
+    AFTER UPDATE OF session_id, student_id, status, duration_sec ON attendance
+    BEGIN {_rollup_remove('OLD')} {_rollup_add('NEW')} END;
+    {REBUILD_ROLLUPS}
+    ''',
+    # 3: timetable imports create sessions per class section
+    '''
+    ALTER TABLE sessions ADD COLUMN section TEXT;
+    ''',
+    # 4: door-sensor events logged by the old sensor.py (renamed to sensor_log by init_db):
+    # first and last event inside a session become that student's entry and exit
+    '''
+    CREATE TABLE IF NOT EXISTS sensor_log (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT,
+        date TEXT,
+        time TEXT
+    );
+    INSERT OR IGNORE INTO students(name)
+        SELECT DISTINCT name FROM sensor_log WHERE name IS NOT NULL AND name != 'Unknown';
+    INSERT INTO attendance(session_id, student_id, entry_time, exit_time, duration_sec, status)
+        SELECT s.id, st.id, MIN(l.date || ' ' || l.time), MAX(l.date || ' ' || l.time),
+               CAST(strftime('%s', MAX(l.date || ' ' || l.time)) - strftime('%s', MIN(l.date || ' ' || l.time)) AS INTEGER),
+               'Present'
+        FROM sensor_log l
+        JOIN students st ON st.name=l.name
+        JOIN sessions s ON s.date=l.date AND l.time >= s.start_time AND l.time < s.end_time
+        WHERE NOT EXISTS (SELECT 1 FROM attendance a WHERE a.session_id=s.id AND a.student_id=st.id)
+        GROUP BY s.id, st.id;
+    ''',
+    # 5: main.py's Facenet embeddings (float32 BLOB) on the shared students table, and the
+    # rows of its old students(name, embedding) / attendance(name, timestamp) tables
+    '''
+    ALTER TABLE students ADD COLUMN embedding BLOB;
+    CREATE TABLE IF NOT EXISTS main_students (name TEXT PRIMARY KEY, embedding TEXT);
+    CREATE TABLE IF NOT EXISTS main_log (name TEXT, timestamp TEXT);
+    INSERT OR IGNORE INTO students(name) SELECT name FROM main_students;
+    INSERT OR IGNORE INTO students(name) SELECT DISTINCT name FROM main_log WHERE name IS NOT NULL;
+    INSERT INTO attendance(session_id, student_id, entry_time, exit_time, duration_sec, status)
+        SELECT s.id, st.id, MIN(l.timestamp), MAX(l.timestamp),
+               CAST(strftime('%s', MAX(l.timestamp)) - strftime('%s', MIN(l.timestamp)) AS INTEGER), 'Present'
+        FROM main_log l
+        JOIN students st ON st.name=l.name
+        JOIN sessions s ON s.date=substr(l.timestamp, 1, 10)
+            AND substr(l.timestamp, 12) >= s.start_time AND substr(l.timestamp, 12) < s.end_time
+        WHERE NOT EXISTS (SELECT 1 FROM attendance a WHERE a.session_id=s.id AND a.student_id=st.id)
+        GROUP BY s.id, st.id;
+    ''',
+    # 6: the intervals a student was actually in the room; existing rows become one interval each
+    '''
+    CREATE TABLE IF NOT EXISTS attendance_intervals (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        session_id INTEGER,
+        student_id INTEGER,
+        start_time TEXT,
+        end_time TEXT,
+        duration_sec INTEGER,
+        FOREIGN KEY(session_id) REFERENCES sessions(id),
+        FOREIGN KEY(student_id) REFERENCES students(id)
+    );
+    CREATE INDEX IF NOT EXISTS idx_intervals_session_student ON attendance_intervals(session_id, student_id);
+    INSERT INTO attendance_intervals(session_id, student_id, start_time, end_time, duration_sec)
+        SELECT session_id, student_id, entry_time, exit_time, duration_sec FROM attendance
+        WHERE entry_time IS NOT NULL AND exit_time IS NOT NULL;
+    ''',
+    # 7: live feed: entry/update events in commit order; id is the readers' cursor and never reused
+    '''
+    CREATE TABLE IF NOT EXISTS attendance_events (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        session_id INTEGER,
+        kind TEXT,
+        payload TEXT,
+        created_at REAL
+    );
+    CREATE INDEX IF NOT EXISTS idx_attendance_events_session ON attendance_events(session_id, id);
+    ''',
+]
+
+_local = threading.local()
+
+
+def _timed(method, sql, *args):
+    start = time.perf_counter()
+    try:
+        return method(sql, *args)
+    finally:
+        metrics.observe('sql_seconds', time.perf_counter() - start, statement=metrics.sql_label(sql))
+
+
+class TimedCursor(sqlite3.Cursor):
+    """Records every statement's execution time in the sql_seconds histogram"""
+
+    def execute(self, sql, *args):
+        return _timed(super().execute, sql, *args)
+
+    def executemany(self, sql, *args):
+        return _timed(super().executemany, sql, *args)
+
+
+class PooledConnection(sqlite3.Connection):
+    """Connection reused by every get_conn() call on the same thread.
+
+    close() only ends any open transaction, so existing open/use/close call
+    sites keep working while the underlying connection stays open.
+    Statements run through it are timed (see TimedCursor).
+    """
+
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, *args):
+        return _timed(super().execute, sql, *args)
+
+    def executemany(self, sql, *args):
+        return _timed(super().executemany, sql, *args)
+
+    def executescript(self, script):
+        return _timed(super().executescript, script)
+
+    def close(self):
+        if self.in_transaction:
+            self.rollback()
+
+    def really_close(self):
+        super().close()
+
+
+def connect(path=None):
+    """A new, unshared connection with the standard pragmas"""
+    conn = sqlite3.connect(path or DB_PATH, factory=PooledConnection, check_same_thread=False)
     conn.row_factory = sqlite3.Row
+    for pragma in CONNECTION_PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+def get_conn():
+    path = str(DB_PATH)
+    conns = getattr(_local, 'conns', None)
+    if conns is None:
+        conns = _local.conns = {}
+    conn = conns.get(path)
+    if conn is None:
+        conn = conns[path] = connect(path)
     return conn
 
+def migrate(conn):
+    version = conn.execute('PRAGMA user_version').fetchone()[0]
+    conn.commit()
+    for number, script in enumerate(MIGRATIONS[version:], start=version + 1):
+        # One transaction per migration, version included: a failure leaves nothing half-applied
+        try:
+            conn.executescript(f'BEGIN; {script}; PRAGMA user_version={number}; COMMIT;')
+        except Exception:
+            conn.rollback()
+            raise
+        print(f'Applied database migration {number}')
+
+def _columns(cur, table):
+    return {row['name'] for row in cur.execute(f'PRAGMA table_info({table})')}
+
 def init_db():
     conn = get_conn()
     cur = conn.cursor()
+    # Persistent for the database file; readers no longer block on the recognizer's writes
+    cur.execute('PRAGMA journal_mode=WAL')
+    # The old sensor.py and main.py created their own attendance/students tables in this
+    # file; keep their rows under other names (merged by migrations 4 and 5)
+    columns = _columns(cur, 'attendance')
+    if columns and 'session_id' not in columns:
+        if 'timestamp' in columns:
+            legacy = 'main_log'
+        elif {'date', 'time'} <= columns:
+            legacy = 'sensor_log'
+        else:
+            # Neither schema: keep the rows, but out of reach of migrations 4 and 5
+            legacy = 'legacy_attendance'
+        cur.execute(f'ALTER TABLE attendance RENAME TO {legacy}')
+        print(f'Renamed legacy attendance table to {legacy}')
+    columns = _columns(cur, 'students')
+    if columns and 'id' not in columns:
+        cur.execute('ALTER TABLE students RENAME TO main_students')
+        print('Renamed legacy students table to main_students')
     # Students table
     cur.execute('''
     CREATE TABLE IF NOT EXISTS students (
@@ -56,8 +327,9 @@ def init_db():
     )
     ''')
     conn.commit()
+    migrate(conn)
     conn.close()
 
 if __name__ == '__main__':
     init_db()
-    print('DB initialized')
\ No newline at end of file
+    print('DB initialized')
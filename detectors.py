@@ -0,0 +1,302 @@
+import argparse
+import threading
+import urllib.request
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import cv2
+import dlib
+import face_recognition
+import numpy as np
+# The encoder face_recognition.face_encodings uses, for faces aligned on our own landmarks
+from face_recognition.api import face_encoder
+
+MODELS_DIR = Path('models')
+
+# Optional "detector" block in camera_config.json
+DETECTOR_DEFAULTS = {
+    'backend': 'hog',         # hog, cnn (dlib via face_recognition), haar, ssd, yunet (OpenCV, CPU)
+    'upsample': 1,            # hog/cnn: times to upsample the image looking for small faces
+    'confidence': 0.6,        # ssd/yunet: minimum detection score
+    'min_size': 20,           # haar/ssd/yunet: smallest face kept, in detector input pixels
+    'model_dir': str(MODELS_DIR),
+}
+
+# Model files of the OpenCV DNN backends, fetched into models/ by `python detectors.py download`
+MODEL_FILES = {
+    'ssd': {
+        'deploy.prototxt':
+            'https://raw.githubusercontent.com/opencv/opencv/4.x/samples/dnn/face_detector/deploy.prototxt',
+        'res10_300x300_ssd_iter_140000.caffemodel':
+            'https://raw.githubusercontent.com/opencv/opencv_3rdparty/'
+            'dnn_samples_face_detector_20170830/res10_300x300_ssd_iter_140000.caffemodel',
+    },
+    'yunet': {
+        'face_detection_yunet_2023mar.onnx':
+            'https://github.com/opencv/opencv_zoo/raw/main/models/face_detection_yunet/'
+            'face_detection_yunet_2023mar.onnx',
+    },
+}
+
+BACKENDS = ('hog', 'cnn', 'haar', 'ssd', 'yunet')
+
+# dlib's 5-point alignment, which the encoder expects, uses eye corners and the base of the nose;
+# YuNet gives eye centres and the nose tip.  Mean-face offsets, in inter-ocular distances:
+EYE_HALF_WIDTH = 0.2      # Eye centre to either corner
+NOSE_TIP_TO_BASE = 0.16
+
+
+class Location(tuple):
+    """(top, right, bottom, left) box that may also carry the detector's five landmarks.
+
+    landmarks is a 5x2 array of (x, y): the two eye centres, nose tip and the
+    two mouth corners, or None.  Everything that takes plain location tuples
+    still does; face_encodings() uses the landmarks to align the face.
+    """
+
+    def __new__(cls, box, landmarks=None):
+        location = super().__new__(cls, box)
+        location.landmarks = landmarks
+        return location
+
+
+def to_location(x, y, w, h, width, height):
+    """OpenCV (x, y, w, h) box -> face_recognition (top, right, bottom, left), squared and clipped.
+
+    dlib's landmark predictor is trained on its own near-square boxes; the
+    OpenCV detectors return taller boxes, so they are squared around the
+    centre before encoding.
+    """
+    side = (w + h) / 2
+    cx, cy = x + w / 2, y + h / 2
+    top, left = int(max(cy - side / 2, 0)), int(max(cx - side / 2, 0))
+    bottom, right = int(min(cy + side / 2, height)), int(min(cx + side / 2, width))
+    return top, right, bottom, left
+
+
+class DlibBackend:
+    def __init__(self, model, upsample=1, **_):
+        self.model = model
+        self.upsample = upsample
+
+    def detect(self, rgb):
+        return face_recognition.face_locations(rgb, self.upsample, model=self.model)
+
+
+class HaarBackend:
+    def __init__(self, min_size=20, **_):
+        if not hasattr(cv2, 'CascadeClassifier'):
+            raise ImportError('Haar cascades need opencv-python 4.x (removed from OpenCV 5)')
+        self.min_size = min_size
+        self.cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
+
+    def detect(self, rgb):
+        gray = cv2.equalizeHist(cv2.cvtColor(rgb, cv2.COLOR_RGB2GRAY))
+        boxes = self.cascade.detectMultiScale(gray, scaleFactor=1.1, minNeighbors=5,
+                                              minSize=(self.min_size, self.min_size))
+        height, width = gray.shape
+        return [to_location(x, y, w, h, width, height) for x, y, w, h in boxes]
+
+
+class SsdBackend:
+    """ResNet-10 SSD (res10_300x300) from the OpenCV face_detector sample"""
+
+    def __init__(self, model_dir=MODELS_DIR, confidence=0.6, min_size=20, **_):
+        files = model_paths('ssd', model_dir)
+        self.net = cv2.dnn.readNetFromCaffe(str(files['deploy.prototxt']),
+                                            str(files['res10_300x300_ssd_iter_140000.caffemodel']))
+        self.net.setPreferableBackend(cv2.dnn.DNN_BACKEND_OPENCV)
+        self.net.setPreferableTarget(cv2.dnn.DNN_TARGET_CPU)
+        self.confidence = confidence
+        self.min_size = min_size
+
+    def detect(self, rgb):
+        height, width = rgb.shape[:2]
+        # The network expects BGR with these channel means
+        bgr = cv2.cvtColor(rgb, cv2.COLOR_RGB2BGR)
+        blob = cv2.dnn.blobFromImage(bgr, 1.0, (300, 300), (104.0, 177.0, 123.0))
+        self.net.setInput(blob)
+        detections = self.net.forward()[0, 0]
+        locations = []
+        for _, _, score, x1, y1, x2, y2 in detections:
+            if score < self.confidence:
+                continue
+            x, y = x1 * width, y1 * height
+            w, h = (x2 - x1) * width, (y2 - y1) * height
+            if min(w, h) >= self.min_size:
+                locations.append(to_location(x, y, w, h, width, height))
+        return locations
+
+
+class YuNetBackend:
+    def __init__(self, model_dir=MODELS_DIR, confidence=0.6, min_size=20, **_):
+        files = model_paths('yunet', model_dir)
+        self.net = cv2.FaceDetectorYN.create(str(files['face_detection_yunet_2023mar.onnx']), '', (320, 320),
+                                             confidence, 0.3, 5000)
+        self.min_size = min_size
+        self.size = None
+
+    def detect(self, rgb):
+        height, width = rgb.shape[:2]
+        if self.size != (width, height):
+            self.net.setInputSize((width, height))
+            self.size = (width, height)
+        _, faces = self.net.detect(cv2.cvtColor(rgb, cv2.COLOR_RGB2BGR))
+        if faces is None:
+            return []
+        # Columns: x, y, w, h, five landmark points (x, y), score
+        locations = []
+        for face in faces:
+            x, y, w, h = face[:4]
+            if min(w, h) >= self.min_size:
+                locations.append(Location(to_location(x, y, w, h, width, height), face[4:14].reshape(5, 2)))
+        return locations
+
+
+def dlib_points(landmarks):
+    """Eye centres and nose tip -> dlib's five points: image-right eye outer and inner corner,
+    image-left eye outer and inner corner, base of the nose"""
+    left, right = landmarks[:2][np.argsort(landmarks[:2, 0])]
+    span = np.linalg.norm(right - left)
+    along = (right - left) / span
+    down = np.array([-along[1], along[0]])
+    corner = EYE_HALF_WIDTH * span * along
+    nose = landmarks[2] + NOSE_TIP_TO_BASE * span * down
+    return np.array([right + corner, right - corner, left - corner, left + corner, nose])
+
+
+def face_encodings(rgb, locations):
+    """face_recognition.face_encodings, aligned on the detector's own landmarks where it has them.
+
+    Saves dlib's landmark pass, and OpenCV boxes are not the ones dlib's
+    predictor was trained on, so its fit on them is the weaker one.
+    """
+    if all(getattr(location, 'landmarks', None) is None for location in locations):
+        return face_recognition.face_encodings(rgb, locations)
+    encodings = []
+    for location in locations:
+        landmarks = getattr(location, 'landmarks', None)
+        if landmarks is None or np.allclose(landmarks[0], landmarks[1]):
+            encodings.extend(face_recognition.face_encodings(rgb, [location]))
+            continue
+        top, right, bottom, left = location
+        points = dlib.points([dlib.point(int(round(x)), int(round(y))) for x, y in dlib_points(landmarks)])
+        shape = dlib.full_object_detection(dlib.rectangle(left, top, right, bottom), points)
+        encodings.append(np.array(face_encoder.compute_face_descriptor(rgb, shape, 1)))
+    return encodings
+
+
+def model_paths(backend, model_dir=MODELS_DIR):
+    paths = {name: Path(model_dir) / name for name in MODEL_FILES[backend]}
+    missing = [name for name, p in paths.items() if not p.exists()]
+    if missing:
+        urls = '\n'.join(f"  {MODEL_FILES[backend][name]} -> {paths[name]}" for name in missing)
+        raise FileNotFoundError(f"The {backend} detector needs model files that are not in {model_dir}. "
+                                f"Run `python detectors.py download {backend}` or download them by hand:\n{urls}")
+    return paths
+
+
+def create_backend(backend='hog', **options):
+    if backend in ('hog', 'cnn'):
+        return DlibBackend(backend, **options)
+    if backend == 'haar':
+        return HaarBackend(**options)
+    if backend == 'ssd':
+        return SsdBackend(**options)
+    if backend == 'yunet':
+        return YuNetBackend(**options)
+    raise ValueError(f"Unknown detector backend {backend!r}, expected one of {', '.join(BACKENDS)}")
+
+
+class FaceDetector:
+    """Face locations of an RGB image from the configured backend.
+
+    Boxes are in face_recognition's (top, right, bottom, left) order, so
+    they go straight to face_encodings as known locations; pass them to
+    this module's face_encodings to use the landmarks YuNet also returns.  OpenCV nets and
+    cascades are not safe to share between threads, so every detector
+    thread gets its own backend instance.
+    """
+
+    def __init__(self, backend='hog', **options):
+        self.backend = backend
+        self.options = options
+        self._local = threading.local()
+        create_backend(backend, **options)  # Fail at start-up, not in the first worker
+
+    def detect(self, rgb):
+        impl = getattr(self._local, 'impl', None)
+        if impl is None:
+            impl = self._local.impl = create_backend(self.backend, **self.options)
+        return impl.detect(np.ascontiguousarray(rgb))
+
+    def encode(self, rgb, locations):
+        return face_encodings(rgb, locations)
+
+
+_worker_detector = None  # Per worker process, set by _init_worker
+
+
+def _init_worker(backend, options):
+    global _worker_detector
+    _worker_detector = FaceDetector(backend, **options)
+
+
+def _detect(rgb):
+    return _worker_detector.detect(rgb)
+
+
+def _encode(rgb, locations):
+    return face_encodings(rgb, locations)
+
+
+class FaceWorkers:
+    """FaceDetector's detect/encode, run in a pool of worker processes.
+
+    dlib's HOG detector releases the GIL, but its landmark predictor and
+    face encoder do not, so detector threads alone never use more than
+    one core for encoding.  Calls block the calling thread only; with one
+    caller thread per process every core stays busy.
+    """
+
+    def __init__(self, processes, backend='hog', **options):
+        self.backend = backend
+        self.processes = processes
+        self.pool = ProcessPoolExecutor(processes, initializer=_init_worker, initargs=(backend, options))
+        # Start the workers now, not on the first frame, and surface initializer errors early
+        self.pool.submit(int).result()
+
+    def detect(self, rgb):
+        return self.pool.submit(_detect, rgb).result()
+
+    def encode(self, rgb, locations):
+        return self.pool.submit(_encode, rgb, locations).result()
+
+    def shutdown(self):
+        self.pool.shutdown(cancel_futures=True)
+
+
+def detector_from_config(config):
+    """FaceDetector from the camera_config.json 'detector' block"""
+    return FaceDetector(**dict(DETECTOR_DEFAULTS, **config.get('detector', {})))
+
+
+def download(backends, model_dir=MODELS_DIR):
+    Path(model_dir).mkdir(parents=True, exist_ok=True)
+    for backend in backends:
+        for name, url in MODEL_FILES[backend].items():
+            path = Path(model_dir) / name
+            if path.exists():
+                print(f"{path} already present")
+                continue
+            print(f"Downloading {url}")
+            urllib.request.urlretrieve(url, path)
+            print(f"Saved {path} ({path.stat().st_size // 1024} KB)")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Face detector model files')
+    parser.add_argument('command', choices=('download',))
+    parser.add_argument('backends', nargs='*', default=list(MODEL_FILES), choices=list(MODEL_FILES))
+    args = parser.parse_args()
+    download(args.backends)
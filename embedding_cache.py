@@ -0,0 +1,122 @@
+import threading
+import time
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+EMBEDDING_CACHE_DEFAULTS = {
+    'enabled': True,
+    'size': 256,              # Entries kept, least recently used evicted first
+    'ttl': 3.0,               # Seconds an entry is trusted; keep below tracking reverify_seconds
+    'hash_size': 8,           # Crop is reduced to hash_size x hash_size for the difference hash
+    'max_distance': 6,        # Hash bits that may differ for a crop to count as unchanged
+    'position_bucket': 48,    # Pixels (full frame) per position bucket of the face centre
+}
+
+
+def crop_hash(image, location, hash_size=8):
+    """Difference hash of a face crop as an int; robust to noise and small lighting changes"""
+    top, right, bottom, left = location
+    crop = image[max(top, 0):max(bottom, 0), max(left, 0):max(right, 0)]
+    if crop.size == 0:
+        return None
+    if crop.ndim == 3:
+        crop = crop.mean(axis=2).astype(np.float32)
+    thumb = cv2.resize(crop.astype(np.float32), (hash_size + 1, hash_size), interpolation=cv2.INTER_AREA)
+    bits = np.packbits(thumb[:, 1:] > thumb[:, :-1])
+    return int.from_bytes(bits.tobytes(), 'big')
+
+
+class EmbeddingCache:
+    """Bounded LRU of face encodings (and their matches) keyed by crop hash and position.
+
+    A lookup hits when an entry in the same source and position bucket is
+    younger than ttl and its hash is within max_distance bits of the crop's,
+    so a face that hasn't moved or changed reuses its encoding instead of
+    running face_encodings again.
+    """
+
+    def __init__(self, size=256, ttl=3.0, hash_size=8, max_distance=6, position_bucket=48, **_):
+        self.size = size
+        self.ttl = ttl
+        self.hash_size = hash_size
+        self.max_distance = max_distance
+        self.position_bucket = position_bucket
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()  # (bucket, hash) -> [encoding, match, stored_at]
+        self._buckets = {}             # bucket -> set of hashes in it
+        self._lock = threading.Lock()
+
+    def key(self, image, location, box=None, source=None):
+        """Cache key for a face at `location` in `image`; `box` is its full-frame position if image is scaled"""
+        crop = crop_hash(image, location, self.hash_size)
+        if crop is None:
+            return None
+        top, right, bottom, left = box or location
+        bucket = (source, (left + right) // 2 // self.position_bucket, (top + bottom) // 2 // self.position_bucket)
+        return bucket, crop
+
+    def get(self, key):
+        """(encoding, match) for an effectively unchanged crop, else None; match may be None"""
+        if key is None:
+            return None
+        bucket, crop = key
+        now = time.monotonic()
+        with self._lock:
+            best, best_distance = None, self.max_distance + 1
+            for other in self._buckets.get(bucket, ()):
+                distance = bin(crop ^ other).count('1')
+                if distance < best_distance:
+                    best, best_distance = other, distance
+            entry = self._entries.get((bucket, best)) if best is not None else None
+            if entry is not None and now - entry[2] > self.ttl:
+                self._remove((bucket, best))
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end((bucket, best))
+            self.hits += 1
+            return entry[0], entry[1]
+
+    def put(self, key, encoding, match=None):
+        if key is None:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+            self._entries[key] = [encoding, match, time.monotonic()]
+            self._buckets.setdefault(key[0], set()).add(key[1])
+            while len(self._entries) > self.size:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def set_match(self, key, match):
+        """Attach the gallery match to an entry stored before matching"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                entry[1] = match
+
+    def clear_matches(self):
+        """Forget cached matches (the gallery changed); encodings stay valid"""
+        with self._lock:
+            for entry in self._entries.values():
+                entry[1] = None
+
+    def _remove(self, key):
+        # Caller holds the lock
+        del self._entries[key]
+        hashes = self._buckets.get(key[0])
+        if hashes is not None:
+            hashes.discard(key[1])
+            if not hashes:
+                del self._buckets[key[0]]
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {'entries': len(self._entries), 'hits': self.hits, 'misses': self.misses,
+                'evictions': self.evictions, 'hit_ratio': self.hits / total if total else 0.0}
@@ -1,33 +1,187 @@
 import face_recognition
+import argparse
+import hashlib
+import json
 import os
-import pickle
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pathlib import Path
 
+import numpy as np
+
+from detectors import BACKENDS, DETECTOR_DEFAULTS, FaceDetector, face_encodings
+from gallery_store import DELTAS_DIR, GALLERY_PATH, delta_paths, read_delta, read_gallery, write_delta, write_gallery
+
 DATASET_DIR = Path('dataset')
 MODELS_DIR = Path('models')
-MODELS_DIR.mkdir(exist_ok=True)
-
-known_encodings = []
-known_names = []
-
-for person in os.listdir(DATASET_DIR):
-    person_dir = DATASET_DIR / person
-    if not person_dir.is_dir():
-        continue
-    for img_name in os.listdir(person_dir):
-        img_path = person_dir / img_name
-        try:
-            image = face_recognition.load_image_file(str(img_path))
-            boxes = face_recognition.face_locations(image, model='hog')
-            encs = face_recognition.face_encodings(image, boxes)
-            if len(encs) > 0:
-                known_encodings.append(encs[0])
-                known_names.append(person)
-                print(f"Encoded {person}/{img_name}")
-        except Exception as e:
-            print('Skipping', img_path, e)
-
-with open(MODELS_DIR / 'encodings.pkl', 'wb') as f:
-    pickle.dump({'encodings': known_encodings, 'names': known_names}, f)
-
-print('Saved encodings:', len(known_names))
\ No newline at end of file
+CONFIG_FILE = Path('camera_config.json')
+# path -> {mtime, size, sha1, name, has_face} for every image already encoded
+MANIFEST_PATH = MODELS_DIR / 'manifest.json'
+
+
+def file_sha1(path):
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def scan_dataset():
+    """Every image under dataset/<person>/ as (relative path, person, stat)"""
+    images = []
+    for person in sorted(os.listdir(DATASET_DIR)):
+        person_dir = DATASET_DIR / person
+        if not person_dir.is_dir():
+            continue
+        for img_name in sorted(os.listdir(person_dir)):
+            img_path = person_dir / img_name
+            if img_path.is_file():
+                images.append((img_path.as_posix(), person, img_path.stat()))
+    return images
+
+
+detector = None  # Per worker process, set by init_worker
+
+
+def init_worker(detector_config):
+    global detector
+    detector = FaceDetector(**detector_config)
+
+
+def encode_image(img_path):
+    """Worker: detect and encode the first face of one image"""
+    start = time.perf_counter()
+    encoding, error = None, None
+    try:
+        sha1 = file_sha1(img_path)
+        image = face_recognition.load_image_file(img_path)
+        boxes = detector.detect(image)
+        encs = face_encodings(image, boxes)
+        if len(encs) > 0:
+            encoding = encs[0]
+    except Exception as e:
+        sha1, error = None, str(e)
+    return img_path, sha1, encoding, error, os.getpid(), time.perf_counter() - start
+
+
+def load_previous(full):
+    """Previous manifest and path -> encoding map (gallery plus pending deltas), or empty ones for a full rebuild"""
+    if full or not MANIFEST_PATH.exists() or not GALLERY_PATH.exists():
+        return {}, {}
+    with open(MANIFEST_PATH, 'r') as f:
+        manifest = json.load(f)
+    gallery = read_gallery(GALLERY_PATH)
+    # Rows converted from a legacy pickle have no path and are re-encoded
+    encodings = {p: np.array(row) for p, row in zip(gallery.paths, gallery.matrix) if p}
+    for path in delta_paths():
+        delta = read_delta(path)
+        replaced = set(delta.names) | set(delta.remove)
+        encodings = {p: enc for p, enc in encodings.items()
+                     if manifest.get(p, {}).get('name') not in replaced}
+        encodings.update((p, np.array(row)) for p, row in zip(delta.paths, delta.encodings) if p)
+    return manifest, encodings
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Encode dataset/ faces into models/gallery.bin')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='encoder processes')
+    parser.add_argument('--full', action='store_true', help='ignore the manifest and re-encode everything')
+    parser.add_argument('--detector', choices=BACKENDS, help='face detector (default: camera_config.json)')
+    parser.add_argument('--delta', action='store_true',
+                        help='publish only the changed people as a delta the running recognizer picks up')
+    args = parser.parse_args()
+    if args.delta and args.full:
+        parser.error('--delta and --full cannot be combined')
+
+    config = {}
+    if CONFIG_FILE.exists():
+        with open(CONFIG_FILE) as f:
+            config = json.load(f)
+    detector_config = dict(DETECTOR_DEFAULTS, **config.get('detector', {}))
+    if args.detector:
+        detector_config['backend'] = args.detector
+
+    MODELS_DIR.mkdir(exist_ok=True)
+    manifest, encodings = load_previous(args.full)
+    images = scan_dataset()
+
+    new_manifest = {}
+    to_encode = []
+    for img_path, person, st in images:
+        entry = manifest.get(img_path)
+        if entry and entry['name'] == person and (img_path in encodings or not entry['has_face']):
+            if entry['mtime'] == st.st_mtime and entry['size'] == st.st_size:
+                new_manifest[img_path] = entry
+                continue
+            # Touched but possibly identical content: the hash decides
+            if entry['size'] == st.st_size and entry['sha1'] == file_sha1(img_path):
+                new_manifest[img_path] = dict(entry, mtime=st.st_mtime)
+                continue
+        new_manifest[img_path] = {'mtime': st.st_mtime, 'size': st.st_size, 'name': person}
+        to_encode.append(img_path)
+
+    removed = [p for p in manifest if p not in new_manifest]
+    print(f"{len(images)} images: {len(to_encode)} to encode, "
+          f"{len(images) - len(to_encode)} unchanged, {len(removed)} removed")
+
+    per_worker = defaultdict(lambda: [0, 0.0])  # pid -> [images, busy seconds]
+    start = time.perf_counter()
+    if to_encode:
+        with ProcessPoolExecutor(max_workers=max(1, args.workers), initializer=init_worker,
+                                 initargs=(detector_config,)) as pool:
+            futures = [pool.submit(encode_image, p) for p in to_encode]
+            for done, future in enumerate(as_completed(futures), 1):
+                img_path, sha1, encoding, error, pid, elapsed = future.result()
+                per_worker[pid][0] += 1
+                per_worker[pid][1] += elapsed
+                encodings.pop(img_path, None)
+                if error is not None:
+                    # Left out of the manifest so the next run retries it
+                    del new_manifest[img_path]
+                    print(f"[{done}/{len(to_encode)}] Skipping {img_path} {error}")
+                    continue
+                new_manifest[img_path].update(sha1=sha1, has_face=encoding is not None)
+                if encoding is not None:
+                    encodings[img_path] = encoding
+                    print(f"[{done}/{len(to_encode)}] Encoded {img_path}")
+                else:
+                    print(f"[{done}/{len(to_encode)}] No face in {img_path}")
+
+    elapsed = time.perf_counter() - start
+    if to_encode:
+        print(f"Encoded {len(to_encode)} images in {elapsed:.1f}s "
+              f"({len(to_encode) / elapsed:.1f} images/sec overall)")
+        for pid, (count, busy) in sorted(per_worker.items()):
+            print(f"  worker {pid}: {count} images, {count / busy if busy else 0:.2f} images/sec")
+
+    paths = [p for p in new_manifest if p in encodings]
+    if args.delta:
+        # Everyone with an added, changed or removed image is republished with all their rows
+        changed = {new_manifest[p]['name'] for p in to_encode if p in new_manifest}
+        changed |= {manifest[p]['name'] for p in removed}
+        present = {new_manifest[p]['name'] for p in paths}
+        delta_rows = [p for p in paths if new_manifest[p]['name'] in changed]
+        gone = sorted(changed - present)
+        if delta_rows or gone:
+            delta_path = DELTAS_DIR / f"{time.time_ns()}.npz"
+            write_delta(delta_path, [encodings[p] for p in delta_rows],
+                        [new_manifest[p]['name'] for p in delta_rows], delta_rows, remove=gone)
+            print(f"Saved delta {delta_path}: {len(changed & present)} people updated, {len(gone)} removed")
+        else:
+            print('No changes; no delta written')
+    else:
+        pending = delta_paths()
+        write_gallery(GALLERY_PATH, [encodings[p] for p in paths],
+                      [new_manifest[p]['name'] for p in paths], paths)
+        # Their rows are in gallery.bin now
+        for path in pending:
+            path.unlink()
+        print('Saved encodings:', len(paths))
+    with open(MANIFEST_PATH, 'w') as f:
+        json.dump(new_manifest, f, indent=1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+import csv
+import io
+
+# Rows pulled from the cursor per chunk/batch; memory stays flat regardless of export size
+BATCH_SIZE = 5000
+
+EXPORT_COLUMNS = ['attendance_id', 'session_id', 'date', 'subject', 'teacher', 'start_time', 'end_time',
+                  'student_id', 'student', 'roll_no', 'entry_time', 'exit_time', 'duration_sec', 'status']
+
+EXPORT_QUERY = '''
+    SELECT a.id AS attendance_id, s.id AS session_id, s.date, sub.name AS subject, s.teacher,
+           s.start_time, s.end_time, st.id AS student_id, st.name AS student, st.roll_no,
+           a.entry_time, a.exit_time, a.duration_sec, a.status
+    FROM attendance a
+    JOIN sessions s ON a.session_id=s.id
+    JOIN students st ON a.student_id=st.id
+    LEFT JOIN subjects sub ON s.subject_id=sub.id
+'''
+
+# Export scope -> WHERE clause; each uses one of the attendance/sessions indexes
+SCOPES = {
+    'session': ('WHERE a.session_id=?', 'ORDER BY st.name'),
+    'student': ('WHERE a.student_id=?', 'ORDER BY s.date, s.start_time'),
+    'range': ('WHERE s.date BETWEEN ? AND ?', 'ORDER BY s.date, s.start_time, a.session_id'),
+}
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    ARROW_AVAILABLE = True
+except ImportError:
+    ARROW_AVAILABLE = False
+
+
+def iter_batches(conn, scope, params, batch_size=BATCH_SIZE):
+    where, order = SCOPES[scope]
+    cur = conn.cursor()
+    cur.execute(f"{EXPORT_QUERY} {where} {order}", params)
+    while True:
+        rows = cur.fetchmany(batch_size)
+        if not rows:
+            break
+        yield rows
+
+
+def stream_csv(batches):
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(EXPORT_COLUMNS)
+    for rows in batches:
+        writer.writerows(tuple(r) for r in rows)
+        yield buf.getvalue()
+        buf.seek(0)
+        buf.truncate()
+    if buf.tell():
+        yield buf.getvalue()
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file object whose contents are handed out as they are written"""
+
+    def __init__(self):
+        self._chunks = []
+        self._pos = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._pos += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._pos
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def _arrow_schema():
+    types = {'attendance_id': pa.int64(), 'session_id': pa.int64(), 'student_id': pa.int64(),
+             'duration_sec': pa.int64()}
+    return pa.schema([(name, types.get(name, pa.string())) for name in EXPORT_COLUMNS])
+
+
+def _record_batch(rows, schema):
+    columns = list(zip(*rows))
+    return pa.record_batch([pa.array(col, type=field.type) for col, field in zip(columns, schema)],
+                           schema=schema)
+
+
+def stream_arrow(batches, fmt):
+    """Parquet (one row group per batch) or Arrow IPC stream, yielded as bytes"""
+    schema = _arrow_schema()
+    sink = _ChunkSink()
+    if fmt == 'parquet':
+        writer = pq.ParquetWriter(sink, schema)
+        write = writer.write_batch
+    else:
+        writer = pa.ipc.new_stream(sink, schema)
+        write = writer.write_batch
+    for rows in batches:
+        write(_record_batch(rows, schema))
+        data = sink.drain()
+        if data:
+            yield data
+    writer.close()
+    yield sink.drain()
+
+
+FORMATS = {
+    'csv': ('text/csv', 'csv'),
+    'parquet': ('application/vnd.apache.parquet', 'parquet'),
+    'arrow': ('application/vnd.apache.arrow.stream', 'arrows'),
+}
+
+
+def stream_export(conn, scope, params, fmt):
+    batches = iter_batches(conn, scope, params)
+    if fmt == 'csv':
+        yield from stream_csv(batches)
+    else:
+        yield from stream_arrow(batches, fmt)
@@ -0,0 +1,337 @@
+import zlib
+from collections import namedtuple
+from pathlib import Path
+
+import numpy as np
+
+from gallery_store import GALLERY_PATH, read_gallery
+
+# Same threshold recognize_run.py used with face_recognition.compare_faces
+MATCH_TOLERANCE = 0.48
+UNKNOWN = "Unknown"
+
+Match = namedtuple('Match', ['name', 'distance', 'margin'])
+
+# Optional IVF index written by build_index.py
+INDEX_PATH = Path('models/index.npz')
+
+
+class FaceIndex:
+    """Exact nearest-neighbour matcher over the known face encodings.
+
+    The gallery is held as one contiguous float32 matrix with its squared
+    norms precomputed, and rows are grouped by person so that the closest
+    encoding of every identity can be reduced in one pass.
+    """
+
+    def __init__(self, encodings, names, tolerance=MATCH_TOLERANCE):
+        self.tolerance = tolerance
+        names = list(names)
+        if len(names) == 0:
+            self._set_gallery(np.zeros((0, 128), dtype=np.float32), np.zeros(0, dtype=np.float32),
+                              np.zeros(0, dtype=np.int32), [])
+            return
+
+        matrix = np.asarray(encodings, dtype=np.float32).reshape(len(names), -1)
+        unique_names, labels = np.unique(np.asarray(names, dtype=object), return_inverse=True)
+        # Stable sort keeps each person's rows in enrollment order
+        order = np.argsort(labels, kind='stable')
+        matrix = np.ascontiguousarray(matrix[order])
+        self._set_gallery(matrix, np.einsum('ij,ij->i', matrix, matrix),
+                          labels[order].astype(np.int32), [str(n) for n in unique_names])
+
+    def _set_gallery(self, matrix, sq_norms, labels, names):
+        # Rows must already be grouped by person (labels non-decreasing)
+        self.matrix = matrix
+        self.sq_norms = sq_norms
+        self.labels = labels
+        self.names = names
+        self.starts = np.flatnonzero(np.r_[True, labels[1:] != labels[:-1]]) if len(labels) else labels
+
+    @classmethod
+    def from_gallery(cls, path, tolerance=MATCH_TOLERANCE):
+        """Open a gallery.bin without copying it: the matrix stays memory-mapped"""
+        gallery = read_gallery(path)
+        index = cls.__new__(cls)
+        index.tolerance = tolerance
+        index._set_gallery(gallery.matrix, gallery.sq_norms, gallery.labels, gallery.names)
+        return index
+
+    def __len__(self):
+        return len(self.matrix)
+
+    @property
+    def dim(self):
+        return self.matrix.shape[1]
+
+    def distances(self, encodings):
+        """Euclidean distances between every query and every gallery row (faces x gallery)"""
+        queries = np.asarray(encodings, dtype=np.float32).reshape(-1, self.dim)
+        q_norms = np.einsum('ij,ij->i', queries, queries)
+        d2 = q_norms[:, None] + self.sq_norms[None, :] - 2.0 * (queries @ self.matrix.T)
+        np.maximum(d2, 0.0, out=d2)
+        return np.sqrt(d2, out=d2)
+
+    def person_distances(self, encodings):
+        """Distance from every query to the closest encoding of every person (faces x people)"""
+        return np.minimum.reduceat(self.distances(encodings), self.starts, axis=1)
+
+    def match(self, encodings, exclude=None):
+        """Match all faces of a frame at once.
+
+        Returns one Match per query with the best person, its distance and the
+        margin to the closest *other* person (inf when only one is enrolled).
+        People flagged in the boolean `exclude` array are never matched.
+        """
+        queries = np.asarray(encodings, dtype=np.float32).reshape(-1, self.dim)
+        if len(queries) == 0:
+            return []
+        if len(self.names) == 0:
+            return [Match(UNKNOWN, float('inf'), float('inf')) for _ in range(len(queries))]
+
+        per_person = self.person_distances(queries)
+        if exclude is not None:
+            per_person[:, exclude] = np.inf
+        rows = np.arange(len(queries))
+        if per_person.shape[1] > 1:
+            # kth=1 puts the closest person first and the runner-up second
+            top2 = np.argpartition(per_person, 1, axis=1)[:, :2]
+            d_top2 = per_person[rows[:, None], top2]
+            best = top2[:, 0]
+            best_d = d_top2[:, 0]
+            margin = d_top2[:, 1] - d_top2[:, 0]
+        else:
+            best = np.zeros(len(queries), dtype=np.intp)
+            best_d = per_person[:, 0]
+            margin = np.full(len(queries), np.inf)
+
+        results = []
+        for person, dist, gap in zip(best, best_d, margin):
+            name = self.names[person] if dist <= self.tolerance else UNKNOWN
+            if np.isnan(gap):  # Every person excluded
+                gap = np.inf
+            results.append(Match(name, float(dist), float(gap)))
+        return results
+
+
+
+def _sq_distances(points, centers):
+    d2 = (np.einsum('ij,ij->i', points, points)[:, None]
+          + np.einsum('ij,ij->i', centers, centers)[None, :]
+          - 2.0 * (points @ centers.T))
+    return np.maximum(d2, 0.0, out=d2)
+
+
+def _assign(points, centers, chunk=8192):
+    """Index of the nearest center for every point, computed in chunks to bound memory"""
+    out = np.empty(len(points), dtype=np.int32)
+    for i in range(0, len(points), chunk):
+        out[i:i + chunk] = _sq_distances(points[i:i + chunk], centers).argmin(axis=1)
+    return out
+
+
+def _kmeans(points, k, rng, iters=10, sample=None):
+    """Plain Lloyd's k-means; trains on a random sample when one is given"""
+    train = points
+    if sample is not None and len(points) > sample:
+        train = points[rng.choice(len(points), sample, replace=False)]
+    centers = train[rng.choice(len(train), k, replace=False)].copy()
+    for _ in range(iters):
+        assign = _assign(train, centers)
+        sums = np.zeros_like(centers)
+        np.add.at(sums, assign, train)
+        counts = np.bincount(assign, minlength=k)
+        filled = counts > 0
+        centers[filled] = sums[filled] / counts[filled, None]
+    return centers
+
+
+def person_centroids(face_index, per_person=3, rng=None):
+    """Summarize every person's encodings by at most `per_person` k-means centroids"""
+    rng = rng or np.random.default_rng(0)
+    ends = np.r_[face_index.starts[1:], len(face_index)]
+    centroids, labels = [], []
+    for person, (start, end) in enumerate(zip(face_index.starts, ends)):
+        rows = face_index.matrix[start:end]
+        if len(rows) > per_person:
+            rows = _kmeans(rows, per_person, rng, iters=5)
+        centroids.append(rows)
+        labels.append(np.full(len(rows), person, dtype=np.int32))
+    return np.concatenate(centroids).astype(np.float32), np.concatenate(labels)
+
+
+class IVFIndex:
+    """Approximate matcher for large galleries.
+
+    Person centroids are partitioned into `nlist` coarse buckets (IVF).  A query
+    probes its `nprobe` nearest buckets, collects the people found there and
+    re-ranks them exactly against their full encodings in the FaceIndex.
+    """
+
+    def __init__(self, face_index, coarse, bucket_offsets, centroids, centroid_labels, nprobe=8):
+        self.face_index = face_index
+        self.coarse = coarse
+        self.bucket_offsets = bucket_offsets
+        self.centroids = centroids
+        self.centroid_labels = centroid_labels
+        self.nprobe = nprobe
+        self.tolerance = face_index.tolerance
+        self.names = face_index.names
+        self._ends = np.r_[face_index.starts[1:], len(face_index)]
+
+    def __len__(self):
+        return len(self.face_index)
+
+    @classmethod
+    def build(cls, face_index, per_person=3, nlist=None, nprobe=8, seed=0):
+        rng = np.random.default_rng(seed)
+        centroids, labels = person_centroids(face_index, per_person, rng)
+        if nlist is None:
+            nlist = int(4 * np.sqrt(len(centroids)))
+        nlist = max(1, min(nlist, len(centroids)))
+        coarse = _kmeans(centroids, nlist, rng, iters=10, sample=64 * nlist).astype(np.float32)
+        bucket = _assign(centroids, coarse)
+        # Duplicate encodings leave clusters empty; drop them so every probed bucket holds someone
+        # (no centroid was nearest to a dropped centre, so the assignment is unchanged)
+        filled = np.bincount(bucket, minlength=len(coarse)) > 0
+        coarse, bucket = coarse[filled], (np.cumsum(filled) - 1)[bucket]
+        # Store centroids bucket by bucket so each inverted list is a contiguous slice
+        order = np.argsort(bucket, kind='stable')
+        offsets = np.r_[0, np.cumsum(np.bincount(bucket, minlength=len(coarse)))]
+        return cls(face_index, coarse, offsets, centroids[order], labels[order], nprobe=nprobe)
+
+    def save(self, path):
+        np.savez(path, coarse=self.coarse, bucket_offsets=self.bucket_offsets,
+                 centroids=self.centroids, centroid_labels=self.centroid_labels,
+                 gallery_checksum=np.uint32(gallery_checksum(self.face_index)))
+
+    @classmethod
+    def load(cls, path, face_index, nprobe=8):
+        """Load a saved index, or return None when it was built for a different gallery"""
+        with np.load(path, allow_pickle=False) as data:
+            if int(data['gallery_checksum']) != gallery_checksum(face_index):
+                return None
+            return cls(face_index, data['coarse'], data['bucket_offsets'],
+                       data['centroids'], data['centroid_labels'], nprobe=nprobe)
+
+    def candidates(self, query):
+        """People whose centroids fall in the nprobe buckets nearest to the query"""
+        nprobe = min(self.nprobe, len(self.coarse))
+        d2 = _sq_distances(query[None, :], self.coarse)[0]
+        buckets = np.argpartition(d2, nprobe - 1)[:nprobe]
+        starts, ends = self.bucket_offsets[buckets], self.bucket_offsets[buckets + 1]
+        return np.unique(self.centroid_labels[_ranges(starts, ends)])
+
+    def match(self, encodings, exclude=None):
+        index = self.face_index
+        queries = np.asarray(encodings, dtype=np.float32).reshape(-1, index.dim)
+        if len(index.names) == 0:
+            return index.match(queries)
+        results = []
+        for query in queries:
+            people = self.candidates(query)
+            if len(people) == 0:
+                # Only empty buckets probed (an index saved before they were dropped): search exactly
+                results.extend(index.match(query[None], exclude=exclude))
+                continue
+            if exclude is not None:
+                people = people[~exclude[people]]
+                if len(people) == 0:
+                    results.append(Match(UNKNOWN, float('inf'), float('inf')))
+                    continue
+            rows = _ranges(index.starts[people], self._ends[people])
+            d2 = _sq_distances(query[None, :], index.matrix[rows])[0]
+            # Collapse rows to the closest encoding of each candidate person
+            lens = self._ends[people] - index.starts[people]
+            per_person = np.sqrt(np.minimum.reduceat(d2, np.r_[0, np.cumsum(lens)[:-1]]))
+            order = np.argsort(per_person)[:2]
+            dist = float(per_person[order[0]])
+            margin = float(per_person[order[1]] - dist) if len(order) > 1 else float('inf')
+            name = index.names[people[order[0]]] if dist <= self.tolerance else UNKNOWN
+            results.append(Match(name, dist, margin))
+        return results
+
+
+class DeltaMatcher:
+    """A base matcher plus people added, replaced or removed since it was built.
+
+    Deltas are usually a handful of people, so they get their own small
+    FaceIndex and the base (possibly a large IVF index) is reused as is;
+    replaced and removed people are masked out of it.
+    """
+
+    def __init__(self, base, added, hidden):
+        self.base = base
+        self.added = added      # FaceIndex of the delta people
+        self.hidden = hidden    # Boolean mask over base.names
+        self.tolerance = base.tolerance
+        self.names = [n for n, h in zip(base.names, hidden) if not h] + added.names
+        # Rows per base person, from the FaceIndex underneath an IVF index
+        starts = getattr(base, 'face_index', base).starts
+        rows = np.diff(np.r_[starts, len(base)])
+        self._size = len(base) - int(rows[hidden].sum()) + len(added)
+
+    def __len__(self):
+        return self._size
+
+    def match(self, encodings):
+        base = self.base.match(encodings, exclude=self.hidden if self.hidden.any() else None)
+        if not self.added.names:
+            return base
+        return [_best_of(a, b) for a, b in zip(base, self.added.match(encodings))]
+
+
+def _best_of(a, b):
+    """Combine the matches of one face against two disjoint sets of people"""
+    if b.distance < a.distance:
+        a, b = b, a
+    if a.distance == float('inf'):
+        return a
+    runner_up = min(a.distance + a.margin, b.distance)
+    return Match(a.name, a.distance, runner_up - a.distance)
+
+
+def apply_deltas(base, deltas):
+    """DeltaMatcher over `base` for deltas (read_delta results) applied in order"""
+    people = {}       # name -> encodings, later deltas replace earlier ones
+    removed = set()
+    for delta in deltas:
+        for name in delta.remove:
+            people.pop(name, None)
+            removed.add(name)
+        for name in dict.fromkeys(delta.names):
+            people[name] = delta.encodings[[n == name for n in delta.names]]
+            removed.discard(name)
+    names = [name for name, rows in people.items() for _ in range(len(rows))]
+    encodings = np.concatenate(list(people.values())) if people else np.zeros((0, 128), np.float32)
+    hidden = np.isin(np.asarray(base.names, dtype=object), list(removed | set(people)))
+    return DeltaMatcher(base, FaceIndex(encodings, names, base.tolerance), hidden)
+
+
+def _ranges(starts, ends):
+    """Concatenation of arange(s, e) for every (s, e) pair, without a Python loop"""
+    lens = ends - starts
+    total = int(lens.sum())
+    if total == 0:
+        return np.zeros(0, dtype=np.intp)
+    shift = np.repeat(starts - np.r_[0, np.cumsum(lens)[:-1]], lens)
+    return np.arange(total) + shift
+
+
+def gallery_checksum(face_index):
+    return zlib.crc32(face_index.matrix.tobytes(), zlib.crc32('\n'.join(face_index.names).encode()))
+
+
+def load_matcher(gallery_path=GALLERY_PATH, index_path=INDEX_PATH):
+    """FaceIndex over the memory-mapped gallery, or the IVF index over it when one is current"""
+    face_index = FaceIndex.from_gallery(gallery_path)
+    print(f"Loaded {len(face_index)} known face encodings ({len(face_index.names)} people)")
+    # Large galleries: probe the IVF index from build_index.py instead of scanning everything
+    if Path(index_path).exists():
+        ivf_index = IVFIndex.load(index_path, face_index)
+        if ivf_index is None:
+            print('Index is out of date with the encodings - rerun build_index.py. Using exact search.')
+        else:
+            print(f"Using IVF index: {len(ivf_index.coarse)} buckets, nprobe={ivf_index.nprobe}")
+            return ivf_index
+    return face_index
@@ -0,0 +1,183 @@
+"""Binary, memory-mappable face gallery (models/gallery.bin).
+
+Layout, all little-endian:
+
+    header    128 bytes: magic, version, dim, rows, people and the byte offset
+              of every section below
+    matrix    rows x dim float32 encodings, grouped by person
+    sq_norms  rows float32 squared norms of the matrix rows
+    labels    rows int32 person index of every row
+    names     (people + 1) uint64 offsets into a UTF-8 blob of person names
+    paths     (rows + 1) uint64 offsets into a UTF-8 blob of source image paths
+
+Sections start on 64-byte boundaries so the numeric ones can be opened with
+np.memmap directly; several recognizer processes then share one page-cached
+copy and startup does not depend on the gallery size.  On Windows a mapped
+file cannot be replaced, so there the sections are read into memory and
+encode_faces.py can rewrite the gallery while recognizers are running.
+
+Small changes can also be published as deltas (models/deltas/*.npz): the
+full encodings of people added or re-enrolled, plus people removed.  The
+recognizer applies them on top of the gallery without a rebuild, and the
+next full encode_faces.py run folds them into gallery.bin.
+
+Convert an existing encodings.pkl with:
+
+    python gallery_store.py convert [models/encodings.pkl] [models/gallery.bin]
+"""
+import os
+import struct
+import sys
+import time
+from collections import namedtuple
+from pathlib import Path
+
+import numpy as np
+
+GALLERY_PATH = Path('models/gallery.bin')
+DELTAS_DIR = Path('models/deltas')
+MAGIC = b'FACEGAL\x00'
+VERSION = 1
+HEADER = struct.Struct('<8sIIQQQQQQQ')
+HEADER_SIZE = 128
+ALIGN = 64
+# Windows refuses to replace a file another process holds open, even briefly for reading
+MEMORY_MAP = os.name != 'nt'
+
+Gallery = namedtuple('Gallery', ['matrix', 'sq_norms', 'labels', 'names', 'paths'])
+Delta = namedtuple('Delta', ['names', 'encodings', 'paths', 'remove'])
+
+
+class GalleryFormatError(ValueError):
+    pass
+
+
+def _align(offset):
+    return (offset + ALIGN - 1) // ALIGN * ALIGN
+
+
+def _string_table(strings):
+    blobs = [s.encode('utf-8') for s in strings]
+    offsets = np.zeros(len(blobs) + 1, dtype='<u8')
+    offsets[1:] = np.cumsum([len(b) for b in blobs])
+    return offsets.tobytes() + b''.join(blobs)
+
+
+def _read_string_table(buf, offset, count):
+    offsets = np.frombuffer(buf, dtype='<u8', count=count + 1, offset=offset)
+    base = offset + offsets.nbytes
+    return [buf[base + int(a):base + int(b)].decode('utf-8') for a, b in zip(offsets[:-1], offsets[1:])]
+
+
+def _replace(tmp_path, path, attempts=20):
+    for attempt in range(attempts):
+        try:
+            return os.replace(tmp_path, path)
+        except PermissionError:
+            # Windows: a reader has the file open for a moment; try again shortly
+            if attempt == attempts - 1:
+                raise
+            time.sleep(0.05)
+
+
+def write_gallery(path, encodings, names, paths=None):
+    """Write a gallery atomically; processes that still map the old file keep their copy"""
+    names = list(names)
+    paths = list(paths) if paths is not None else [''] * len(names)
+    matrix = np.asarray(encodings, dtype='<f4').reshape(len(names), -1) if names else np.zeros((0, 128), '<f4')
+
+    people, labels = np.unique(np.asarray(names, dtype=object), return_inverse=True)
+    order = np.argsort(labels, kind='stable')
+    matrix = np.ascontiguousarray(matrix[order])
+    labels = labels[order].astype('<i4')
+    paths = [paths[i] for i in order]
+    sq_norms = np.einsum('ij,ij->i', matrix, matrix).astype('<f4')
+
+    sections = [matrix.tobytes(), sq_norms.tobytes(), labels.tobytes(),
+                _string_table([str(p) for p in people]), _string_table(paths)]
+    offsets, pos = [], HEADER_SIZE
+    for blob in sections:
+        pos = _align(pos)
+        offsets.append(pos)
+        pos += len(blob)
+
+    header = HEADER.pack(MAGIC, VERSION, matrix.shape[1], len(matrix), len(people), *offsets)
+    tmp_path = Path(f"{path}.tmp")
+    with open(tmp_path, 'wb') as f:
+        f.write(header.ljust(HEADER_SIZE, b'\x00'))
+        for offset, blob in zip(offsets, sections):
+            f.write(b'\x00' * (offset - f.tell()))
+            f.write(blob)
+    _replace(tmp_path, path)
+
+
+def read_gallery(path):
+    """Open a gallery; matrix, sq_norms and labels are read-only memory maps (in memory on Windows)"""
+    with open(path, 'rb') as f:
+        head = f.read(HEADER_SIZE)
+        if len(head) < HEADER.size or head[:8] != MAGIC:
+            raise GalleryFormatError(f"{path} is not a face gallery")
+        (_, version, dim, rows, people,
+         matrix_off, norms_off, labels_off, names_off, paths_off) = HEADER.unpack_from(head)
+        if version != VERSION:
+            raise GalleryFormatError(f"{path} has gallery version {version}, expected {VERSION}")
+        f.seek(names_off)
+        tables = f.read()
+
+    def section(dtype, offset, shape):
+        if rows == 0:
+            return np.zeros(shape, dtype=dtype)
+        if not MEMORY_MAP:
+            return np.fromfile(path, dtype=dtype, count=int(np.prod(shape)), offset=offset).reshape(shape)
+        return np.memmap(path, dtype=dtype, mode='r', offset=offset, shape=shape)
+
+    return Gallery(
+        matrix=section('<f4', matrix_off, (rows, dim)),
+        sq_norms=section('<f4', norms_off, (rows,)),
+        labels=section('<i4', labels_off, (rows,)),
+        names=_read_string_table(tables, 0, people),
+        paths=_read_string_table(tables, paths_off - names_off, rows),
+    )
+
+
+def write_delta(path, encodings, names, paths=None, remove=()):
+    """Write a delta atomically: every person in `names` is replaced by these rows, `remove` is dropped"""
+    names = [str(n) for n in names]
+    paths = [str(p) for p in paths] if paths is not None else [''] * len(names)
+    matrix = np.asarray(encodings, dtype='<f4').reshape(len(names), -1) if names else np.zeros((0, 128), '<f4')
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = Path(f"{path}.tmp")
+    with open(tmp_path, 'wb') as f:
+        np.savez(f, names=np.array(names, dtype=str), encodings=matrix, paths=np.array(paths, dtype=str),
+                 remove=np.array([str(n) for n in remove], dtype=str))
+    _replace(tmp_path, path)
+
+
+def read_delta(path):
+    with np.load(path, allow_pickle=False) as data:
+        return Delta(names=data['names'].tolist(), encodings=data['encodings'].astype(np.float32),
+                     paths=data['paths'].tolist(), remove=data['remove'].tolist())
+
+
+def delta_paths(deltas_dir=DELTAS_DIR):
+    """Pending deltas in the order they were written"""
+    return sorted(Path(deltas_dir).glob('*.npz')) if Path(deltas_dir).is_dir() else []
+
+
+def convert_pickle(pkl_path, out_path):
+    # The only place a legacy pickle is still read; only convert files you trust
+    import pickle
+    with open(pkl_path, 'rb') as f:
+        data = pickle.load(f)
+    write_gallery(out_path, data['encodings'], data['names'], data.get('paths'))
+    return len(data['names'])
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2 or sys.argv[1] != 'convert':
+        print(__doc__)
+        sys.exit(1)
+    src = Path(sys.argv[2]) if len(sys.argv) > 2 else Path('models/encodings.pkl')
+    dst = Path(sys.argv[3]) if len(sys.argv) > 3 else GALLERY_PATH
+    count = convert_pickle(src, dst)
+    print(f"Converted {count} encodings from {src} to {dst}")
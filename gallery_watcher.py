@@ -0,0 +1,108 @@
+import os
+import threading
+import time
+
+import metrics
+from face_index import INDEX_PATH, apply_deltas, load_matcher
+from gallery_store import DELTAS_DIR, GALLERY_PATH, delta_paths, read_delta
+
+# Optional "gallery_reload" block in camera_config.json
+GALLERY_RELOAD_DEFAULTS = {
+    'enabled': True,
+    'poll_interval': 2.0,     # Seconds between checks of the gallery, index and deltas
+}
+
+
+def _stamp(path):
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return st.st_mtime_ns, st.st_size, st.st_ino
+
+
+class GalleryWatcher:
+    """Keeps `matcher` in step with gallery.bin, its IVF index and pending deltas.
+
+    The files are polled by mtime; a change is loaded on the watcher's own
+    thread and swapped in with one assignment, so recognition never pauses
+    and every frame is matched against a single, complete matcher.  When
+    only deltas changed the loaded base is reused and just the deltas are
+    applied on top.  Callbacks in on_reload run after each swap.
+    """
+
+    def __init__(self, gallery_path=GALLERY_PATH, index_path=INDEX_PATH, deltas_dir=DELTAS_DIR,
+                 poll_interval=2.0, **_):
+        self.gallery_path = gallery_path
+        self.index_path = index_path
+        self.deltas_dir = deltas_dir
+        self.poll_interval = poll_interval
+        self.matcher = None
+        self.reloads = 0
+        self.on_reload = []       # Callables run after every swap
+        self._base = None
+        self._base_stamp = None
+        self._delta_stamp = None
+        self._failed = None       # Stamps of a load that failed; not retried until the files change
+        self._stop = threading.Event()
+        self._thread = None
+
+    def load(self):
+        """Load synchronously (start-up); later changes are picked up by check()"""
+        self.check()
+        return self.matcher
+
+    def start(self):
+        if self.matcher is None:
+            self.load()
+        self._thread = threading.Thread(target=self._run, name='gallery-watcher', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(self.poll_interval + 1)
+
+    def check(self):
+        """Reload if anything changed; returns True when a new matcher was swapped in"""
+        base_stamp = (_stamp(self.gallery_path), _stamp(self.index_path))
+        deltas = delta_paths(self.deltas_dir)
+        delta_stamp = tuple((path.name, _stamp(path)) for path in deltas)
+        if (base_stamp, delta_stamp) in ((self._base_stamp, self._delta_stamp), self._failed):
+            return False
+
+        start = time.perf_counter()
+        full = base_stamp != self._base_stamp
+        try:
+            base = load_matcher(self.gallery_path, self.index_path) if full else self._base
+            matcher = apply_deltas(base, [read_delta(path) for path in deltas]) if deltas else base
+        except Exception as e:
+            if self.matcher is None:
+                raise
+            # E.g. a delta deleted between listing and reading; keep serving the current matcher
+            print('Gallery reload failed, keeping the current gallery:', e)
+            self._failed = (base_stamp, delta_stamp)
+            return False
+        first = self.matcher is None
+        self._base, self._base_stamp, self._delta_stamp = base, base_stamp, delta_stamp
+        self.matcher = matcher
+        elapsed = time.perf_counter() - start
+        if first:
+            return True
+
+        self.reloads += 1
+        metrics.inc('gallery_reloads_total', kind='full' if full else 'delta')
+        metrics.observe('gallery_reload_seconds', elapsed, kind='full' if full else 'delta')
+        print(f"Gallery reload #{self.reloads} ({'full' if full else f'{len(deltas)} deltas'}): "
+              f"{len(matcher.names)} people in {elapsed * 1000:.0f} ms")
+        for callback in self.on_reload:
+            try:
+                callback(matcher)
+            except Exception as e:
+                print('Gallery reload callback failed:', e)
+        return True
+
+    def _run(self):
+        while not self._stop.wait(self.poll_interval):
+            self.check()
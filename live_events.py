@@ -0,0 +1,159 @@
+import bisect
+import json
+import threading
+import time
+from collections import defaultdict
+
+from database import get_conn
+
+# Optional "live_feed" block in camera_config.json
+LIVE_FEED_DEFAULTS = {
+    'enabled': True,
+    'poll_interval': 0.25,    # Seconds between checks for new events (one query for all viewers)
+    'heartbeat': 15,          # Seconds between keep-alive comments on an idle stream
+    'buffer': 500,            # Recent events kept in memory per session for late joiners
+}
+
+# Rows kept in attendance_events; readers only need the recent tail
+EVENT_RETENTION = 10000
+
+
+def publish_events(cur, events):
+    """Append (session_id, kind, payload dict) events; call inside the writer's transaction"""
+    if not events:
+        return
+    now = time.time()
+    cur.executemany('INSERT INTO attendance_events(session_id, kind, payload, created_at) VALUES (?, ?, ?, ?)',
+                    [(session_id, kind, json.dumps(payload), now) for session_id, kind, payload in events])
+    cur.execute('DELETE FROM attendance_events WHERE id <= (SELECT MAX(id) FROM attendance_events) - ?',
+                (EVENT_RETENTION,))
+
+
+def session_summary(cur, session_id):
+    cur.execute('''SELECT COUNT(*) AS total, SUM(status='Present') AS present, SUM(status='Absent') AS absent
+                   FROM attendance WHERE session_id=?''', (session_id,))
+    row = cur.fetchone()
+    return {'total': row['total'], 'present': row['present'] or 0, 'absent': row['absent'] or 0}
+
+
+def latest_event_id(conn):
+    return conn.execute('SELECT COALESCE(MAX(id), 0) FROM attendance_events').fetchone()[0]
+
+
+def sse(event_id, kind, payload):
+    return f"id: {event_id}\nevent: {kind}\ndata: {payload}\n\n"
+
+
+class EventHub:
+    """Fans attendance events out to every open SSE stream.
+
+    One thread watches PRAGMA data_version and, when another connection has
+    committed, reads the new events once for all viewers.  Each event is
+    formatted once and kept per session; streams block on a shared
+    condition and only slice the buffer of their own session, so the cost
+    of a viewer is a sleeping thread, not a database query.
+    """
+
+    def __init__(self, poll_interval=0.25, heartbeat=15, buffer=500, **_):
+        self.poll_interval = poll_interval
+        self.heartbeat = heartbeat
+        self.buffer = buffer
+        self.last_id = None
+        self.polls = 0
+        self._ids = defaultdict(list)      # session_id -> event ids, ascending
+        self._frames = defaultdict(list)   # session_id -> formatted SSE frames, same order
+        self._since = {}                   # session_id -> buffer holds every event after this id
+        self._start_id = None
+        self._cond = threading.Condition()
+        self._stop = threading.Event()
+        self._thread = None
+        self._data_version = None
+
+    def start(self):
+        conn = get_conn()
+        self.last_id = self._start_id = latest_event_id(conn)
+        conn.close()
+        self._thread = threading.Thread(target=self._run, name='event-hub', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        with self._cond:
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(self.poll_interval * 2)
+
+    def stream(self, session_id, after):
+        """SSE text for events of the session with id > after, then each new one as it arrives"""
+        with self._cond:
+            upto = self.last_id
+            buffered = after >= self._since.get(session_id, self._start_id)
+            backlog = self._slice(session_id, after) if buffered else None
+        if backlog is None:
+            # A reconnect from further back than the buffer (Last-Event-ID): read the table once
+            backlog = self._read(session_id, after, upto)
+        if backlog:
+            yield backlog
+        cursor = max(after, upto)
+        while not self._stop.is_set():
+            with self._cond:
+                self._cond.wait_for(lambda: self.last_id > cursor or self._stop.is_set(), self.heartbeat)
+                upto = self.last_id
+                # A slow client can fall behind the trimmed buffer; it catches up from the table
+                buffered = cursor >= self._since.get(session_id, self._start_id)
+                chunk = self._slice(session_id, cursor) if buffered else None
+            if chunk is None:
+                chunk = self._read(session_id, cursor, upto)
+            cursor = max(cursor, upto)
+            # The comment doubles as a dead-connection check: writing to a closed client ends the stream
+            yield chunk or ': keep-alive\n\n'
+
+    def _read(self, session_id, after, upto):
+        conn = get_conn()
+        try:
+            rows = conn.execute('''SELECT id, kind, payload FROM attendance_events
+                                   WHERE session_id=? AND id > ? AND id <= ? ORDER BY id''',
+                                (session_id, after, upto)).fetchall()
+        finally:
+            conn.close()
+        return ''.join(sse(row['id'], row['kind'], row['payload']) for row in rows)
+
+    def _slice(self, session_id, after):
+        # Caller holds the condition
+        ids = self._ids.get(session_id)
+        if not ids:
+            return ''
+        return ''.join(self._frames[session_id][bisect.bisect_right(ids, after):])
+
+    def _poll(self, conn):
+        version = conn.execute('PRAGMA data_version').fetchone()[0]
+        if version == self._data_version:
+            return
+        self._data_version = version
+        self.polls += 1
+        rows = conn.execute('SELECT id, session_id, kind, payload FROM attendance_events WHERE id > ? ORDER BY id',
+                            (self.last_id,)).fetchall()
+        if not rows:
+            return
+        with self._cond:
+            for row in rows:
+                ids, frames = self._ids[row['session_id']], self._frames[row['session_id']]
+                ids.append(row['id'])
+                frames.append(sse(row['id'], row['kind'], row['payload']))
+                if len(ids) > self.buffer * 2:
+                    self._since[row['session_id']] = ids[-self.buffer - 1]
+                    del ids[:-self.buffer], frames[:-self.buffer]
+            self.last_id = rows[-1]['id']
+            self._cond.notify_all()
+
+    def _run(self):
+        conn = get_conn()
+        try:
+            while not self._stop.wait(self.poll_interval):
+                try:
+                    self._poll(conn)
+                except Exception as e:
+                    print('Live feed poll failed:', e)
+        finally:
+            conn.close()
@@ -1,28 +1,54 @@
+import ast
 import cv2
 import os
-import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
 from deepface import DeepFace
-from datetime import datetime
+from attendance_writer import AttendanceWriter
+from database import init_db, get_conn
+from session_cache import SessionCache
+from utils import format_ts
 
-conn = sqlite3.connect('attendance.db')
+MODEL_NAME = 'Facenet'
+EMBEDDING_DIM = 128
+COSINE_THRESHOLD = 0.40   # DeepFace's cosine distance threshold for Facenet
+MARK_DEBOUNCE_SECONDS = 5  # Mark the same student at most this often
+
+# Enrollment: every captured image is scored and the usable ones aggregated
+MIN_FACE_SIZE = 80        # Pixels; smaller faces score proportionally lower
+SHARP_LAPLACIAN_VAR = 100  # Laplacian variance treated as fully sharp
+MIN_QUALITY = 0.3         # Images scoring below this are dropped
+EXEMPLARS = 3             # Diverse embeddings stored next to the mean
+TRAIN_WORKERS = 4         # Images embedded concurrently (threads share the loaded model)
+
+# Shared schema (database.py): embeddings live in students.embedding as float32 BLOBs
+init_db()
+conn = get_conn()
 cursor = conn.cursor()
 
-# Create tables if not exist
-cursor.execute('''
-CREATE TABLE IF NOT EXISTS students (
-    name TEXT PRIMARY KEY,
-    embedding TEXT
-)
-''')
 
-cursor.execute('''
-CREATE TABLE IF NOT EXISTS attendance (
-    name TEXT,
-    timestamp TEXT
-)
-''')
+def to_blob(embedding):
+    return np.asarray(embedding, dtype=np.float32).tobytes()
+
+
+def from_blob(blob):
+    """Stored template: the mean embedding first, then the exemplars"""
+    return np.frombuffer(blob, dtype=np.float32).reshape(-1, EMBEDDING_DIM)
+
+
+def convert_legacy_embeddings():
+    """Copy str(list) embeddings from the old students table (now main_students) into the BLOB column"""
+    cursor.execute('''SELECT m.name, m.embedding FROM main_students m JOIN students s ON s.name=m.name
+                      WHERE s.embedding IS NULL AND m.embedding IS NOT NULL''')
+    rows = [(to_blob(ast.literal_eval(text)), name) for name, text in cursor.fetchall()]
+    if rows:
+        with conn:
+            cursor.executemany('UPDATE students SET embedding=? WHERE name=?', rows)
+        print(f"Converted {len(rows)} legacy embeddings")
+
 
-conn.commit()
+convert_legacy_embeddings()
 
 def capture_faces():
     name = input("Enter student name: ").strip()
@@ -55,12 +81,56 @@ def capture_faces():
     print(f"\n{count} images saved for {name}.")
 
 
+def quality_score(image, face):
+    """0..1 from face size, sharpness and pose (eye symmetry and tilt) of one detected face"""
+    area = face['facial_area']
+    x, y, w, h = area['x'], area['y'], area['w'], area['h']
+    size = min(1.0, min(w, h) / MIN_FACE_SIZE)
+    crop = cv2.cvtColor(image[max(y, 0):y + h, max(x, 0):x + w], cv2.COLOR_BGR2GRAY)
+    blur = min(1.0, cv2.Laplacian(crop, cv2.CV_64F).var() / SHARP_LAPLACIAN_VAR) if crop.size else 0.0
+    pose = 1.0
+    left, right = area.get('left_eye'), area.get('right_eye')
+    if left and right:
+        # Frontal faces have the eyes centred in the box and level
+        offset = abs((left[0] + right[0]) / 2 - (x + w / 2)) / max(w, 1)
+        tilt = abs(np.degrees(np.arctan2(left[1] - right[1], abs(left[0] - right[0]) or 1)))
+        pose = max(0.0, 1 - 4 * offset) * max(0.0, 1 - tilt / 30)
+    return size * blur * pose
+
+
+def embed_image(path):
+    """(embedding, quality) of the largest face in an image, or None when there is none"""
+    image = cv2.imread(path)
+    if image is None:
+        return None
+    faces = DeepFace.represent(img_path=image, model_name=MODEL_NAME, enforce_detection=False)
+    faces = [face for face in faces if face.get('face_confidence', 1) > 0]
+    if not faces:
+        return None
+    face = max(faces, key=lambda f: f['facial_area']['w'] * f['facial_area']['h'])
+    return np.asarray(face['embedding'], dtype=np.float32), quality_score(image, face)
+
+
+def build_template(embeddings, qualities, exemplars=EXEMPLARS):
+    """Mean of the normalised embeddings plus the best shot and the shots farthest from those already kept"""
+    embeddings = embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+    mean = embeddings.mean(axis=0)
+    mean /= np.linalg.norm(mean)
+    chosen = [int(np.argmax(qualities))]
+    while len(chosen) < min(exemplars, len(embeddings)):
+        nearest = (embeddings @ embeddings[chosen].T).max(axis=1)
+        nearest[chosen] = np.inf
+        chosen.append(int(np.argmin(nearest)))
+    return np.vstack([mean, embeddings[chosen]]).astype(np.float32)
+
+
 def train_faces():
     dataset_path = "dataset"
     if not os.path.exists(dataset_path):
         print("No dataset folder found.")
         return
 
+    students = {}
     for student in os.listdir(dataset_path):
         folder = os.path.join(dataset_path, student)
         if not os.path.isdir(folder):
@@ -70,17 +140,75 @@ def train_faces():
         if not images:
             print(f"No images found for {student}, skipping.")
             continue
+        students[student] = [os.path.join(folder, image) for image in sorted(images)]
 
-        first_img = os.path.join(folder, images[0])
+    def safe_embed(path):
         try:
-            embedding = DeepFace.represent(img_path=first_img, model_name='Facenet')[0]['embedding']
-            cursor.execute("INSERT OR REPLACE INTO students VALUES (?, ?)", (student, str(embedding)))
-            conn.commit()
-            print(f"Stored face data for {student}")
+            return embed_image(path)
         except Exception as e:
-            print(f"Error processing {student}: {e}")
+            print(f"Error processing {path}: {e}")
+            return None
+
+    paths = [path for images in students.values() for path in images]
+    with ThreadPoolExecutor(TRAIN_WORKERS) as pool:
+        results = dict(zip(paths, pool.map(safe_embed, paths)))
+
+    rows = []
+    for student, images in students.items():
+        kept = [results[path] for path in images if results[path] and results[path][1] >= MIN_QUALITY]
+        dropped = len(images) - len(kept)
+        if not kept:
+            print(f"No usable images for {student} ({dropped} dropped), recapture and train again.")
+            continue
+        template = build_template(np.stack([e for e, _ in kept]), [q for _, q in kept])
+        rows.append((student, to_blob(template)))
+        print(f"Stored face data for {student}: {len(kept)} images used, {dropped} dropped, "
+              f"{len(template) - 1} exemplars")
+
+    # All students in one transaction
+    with conn:
+        cursor.executemany('''INSERT INTO students(name, embedding) VALUES (?, ?)
+                              ON CONFLICT(name) DO UPDATE SET embedding=excluded.embedding''', rows)
+
+def load_gallery():
+    """Names, L2-normalised template rows of every trained student and each student's first row"""
+    cursor.execute('SELECT name, embedding FROM students WHERE embedding IS NOT NULL ORDER BY name')
+    rows = cursor.fetchall()
+    names = [row['name'] for row in rows]
+    if not rows:
+        return names, np.zeros((0, EMBEDDING_DIM), dtype=np.float32), np.zeros(0, dtype=np.intp)
+    templates = [from_blob(row['embedding']) for row in rows]
+    starts = np.r_[0, np.cumsum([len(t) for t in templates])[:-1]]
+    gallery = np.vstack(templates)
+    gallery /= np.linalg.norm(gallery, axis=1, keepdims=True)
+    return names, gallery, starts
+
+
+def match_embeddings(embeddings, names, gallery, starts, threshold=COSINE_THRESHOLD):
+    """(name or None, cosine distance) per embedding; one matrix product for the whole frame"""
+    if len(embeddings) == 0 or len(names) == 0:
+        return [(None, None)] * len(embeddings)
+    faces = np.asarray(embeddings, dtype=np.float32)
+    faces /= np.linalg.norm(faces, axis=1, keepdims=True)
+    # Closest row (mean or exemplar) of each student's template
+    distances = np.minimum.reduceat(1.0 - faces @ gallery.T, starts, axis=1)
+    best = distances.argmin(axis=1)
+    return [(names[j] if distances[i, j] <= threshold else None, float(distances[i, j]))
+            for i, j in enumerate(best)]
+
 
 def recognize_faces():
+    names, gallery, starts = load_gallery()
+    if not names:
+        print("No trained students. Train face data first.")
+        return
+    print(f"Loaded {len(names)} student templates ({len(gallery)} embeddings)")
+
+    # Presence goes into the active session; the writer turns it into one row per student
+    session_cache = SessionCache(poll_interval=1.0).start()
+    attendance_writer = AttendanceWriter(session_cache).start()
+    last_marked = {}
+
     cam = cv2.VideoCapture(0)
     print("\nPress 'q' to quit camera.\n")
 
@@ -90,18 +218,25 @@ def recognize_faces():
             break
 
         try:
-            # Compare current frame with database
-            result = DeepFace.find(img_path=frame, db_path="dataset", model_name='Facenet', enforce_detection=False)
-
-            if not result.empty:
-                name = result.iloc[0]['identity'].split('/')[-2]
-                timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                print(f"{name} Present at {timestamp}")
-
-                cursor.execute("INSERT INTO attendance VALUES (?, ?)", (name, timestamp))
-                conn.commit()
+            # Embed every face in the frame once, then match against the in-memory gallery
+            faces = DeepFace.represent(img_path=frame, model_name=MODEL_NAME, enforce_detection=False)
+            faces = [face for face in faces if face.get('face_confidence', 1) > 0]
+            matches = match_embeddings([face['embedding'] for face in faces], names, gallery, starts)
         except Exception as e:
-            pass
+            print('Recognition error:', e)
+            matches = []
+
+        now = time.monotonic()
+        for name, distance in matches:
+            if name is None or now - last_marked.get(name, -MARK_DEBOUNCE_SECONDS) < MARK_DEBOUNCE_SECONDS:
+                continue
+            last_marked[name] = now
+            session_id = session_cache.active_session_id
+            if session_id is None:
+                print(f"{name} recognized, but no session is active")
+                continue
+            _, timestamp = attendance_writer.mark(session_id, name, session_cache.student_id(name))
+            print(f"{name} Present at {format_ts(timestamp)} (distance {distance:.2f})")
 
         cv2.imshow("Smart Attendance", frame)
 
@@ -110,6 +245,8 @@ def recognize_faces():
 
     cam.release()
     cv2.destroyAllWindows()
+    session_cache.stop()
+    attendance_writer.stop()
 
 
 def main():
@@ -0,0 +1,260 @@
+import bisect
+import json
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+import traceback
+from collections import Counter
+from contextlib import contextmanager
+from functools import lru_cache
+from pathlib import Path
+
+# Optional "metrics" block in camera_config.json
+METRICS_DEFAULTS = {
+    'enabled': True,
+    'stats_file': 'metrics.db',   # SQLite file the recognizer publishes its metrics to
+    'export_interval': 5.0,       # Seconds between publishes
+    'profiling': False,           # Allow on-demand sampling profiles (SIGUSR1 / /debug/profile)
+    'profile_seconds': 10,
+    'profile_dir': 'profiles',
+}
+
+# Seconds; covers a SQL lookup up to a slow CNN detection
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # Last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Registry:
+    """Counters, gauges and histograms keyed by (name, sorted labels).
+
+    Updates take one lock and a dict lookup, cheap enough for every frame,
+    face and SQL statement.
+    """
+
+    def __init__(self):
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+        self._lock = threading.Lock()
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        with self._lock:
+            self.gauges[(name, tuple(sorted(labels.items())))] = value
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            hist = self.histograms.get(key)
+            if hist is None:
+                hist = self.histograms[key] = Histogram()
+            hist.observe(value)
+
+    @contextmanager
+    def timer(self, name, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def snapshot(self):
+        """JSON-serialisable copy: [(kind, name, labels, value)]"""
+        with self._lock:
+            rows = [('counter', n, dict(l), v) for (n, l), v in self.counters.items()]
+            rows += [('gauge', n, dict(l), v) for (n, l), v in self.gauges.items()]
+            rows += [('histogram', n, dict(l), {'buckets': list(h.buckets), 'counts': list(h.counts),
+                                                'sum': h.sum, 'count': h.count})
+                     for (n, l), h in self.histograms.items()]
+        return rows
+
+
+REGISTRY = Registry()
+inc = REGISTRY.inc
+observe = REGISTRY.observe
+timer = REGISTRY.timer
+
+
+@lru_cache(maxsize=1024)
+def sql_label(sql):
+    """Low-cardinality name for a statement: verb and main table, e.g. 'UPDATE attendance'"""
+    words = re.findall(r'[A-Za-z_]+', sql)
+    if not words:
+        return 'unknown'
+    verb = words[0].upper()
+    upper = [w.upper() for w in words]
+    keyword = {'SELECT': 'FROM', 'DELETE': 'FROM', 'INSERT': 'INTO', 'REPLACE': 'INTO'}.get(verb)
+    if keyword in upper and upper.index(keyword) + 1 < len(words):
+        return f"{verb} {words[upper.index(keyword) + 1]}"
+    if verb in ('UPDATE', 'PRAGMA') and len(words) > 1:
+        return f"{verb} {words[1]}"
+    return verb
+
+
+# ---------- Publishing across processes ----------
+
+def publish(registry, path, process):
+    """Replace this process's rows in the SQLite stats file with a fresh snapshot"""
+    conn = sqlite3.connect(path, timeout=1)
+    try:
+        with conn:
+            conn.execute('''CREATE TABLE IF NOT EXISTS metrics (
+                process TEXT, kind TEXT, name TEXT, labels TEXT, value TEXT, updated_at REAL)''')
+            conn.execute('DELETE FROM metrics WHERE process=?', (process,))
+            now = time.time()
+            conn.executemany('INSERT INTO metrics VALUES (?, ?, ?, ?, ?, ?)',
+                             [(process, kind, name, json.dumps(labels), json.dumps(value), now)
+                              for kind, name, labels, value in registry.snapshot()])
+    finally:
+        conn.close()
+
+
+def read_published(path, exclude=None):
+    """{process: (updated_at, rows)} from the stats file"""
+    if not Path(path).exists():
+        return {}
+    conn = sqlite3.connect(path, timeout=1)
+    try:
+        rows = conn.execute('SELECT process, kind, name, labels, value, updated_at FROM metrics').fetchall()
+    except sqlite3.OperationalError:
+        return {}
+    finally:
+        conn.close()
+    published = {}
+    for process, kind, name, labels, value, updated_at in rows:
+        if process == exclude:
+            continue
+        entry = published.setdefault(process, [updated_at, []])
+        entry[1].append((kind, name, json.loads(labels), json.loads(value)))
+    return published
+
+
+class Publisher:
+    """Background thread publishing a registry every interval seconds"""
+
+    def __init__(self, registry, path, process, interval=5.0):
+        self.registry = registry
+        self.path = path
+        self.process = process
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='metrics-publisher', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(self.interval)
+        self._publish()
+
+    def _publish(self):
+        try:
+            publish(self.registry, self.path, self.process)
+        except Exception as e:
+            print('Metrics publish failed:', e)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._publish()
+
+
+# ---------- Prometheus text format ----------
+
+def _labels(labels):
+    if not labels:
+        return ''
+    body = ','.join('{}="{}"'.format(k, str(v).replace('\\', '\\\\').replace('"', '\\"'))
+                    for k, v in sorted(labels.items()))
+    return '{' + body + '}'
+
+
+def render(sources):
+    """Prometheus exposition text for [(process, rows)]; metric names get an attendance_ prefix"""
+    families = {}
+    for process, rows in sources:
+        for kind, name, labels, value in rows:
+            families.setdefault((name, kind), []).append((dict(labels, process=process), value))
+    lines = []
+    for (name, kind), samples in sorted(families.items()):
+        metric = f'attendance_{name}'
+        lines.append(f'# TYPE {metric} {kind}')
+        for labels, value in samples:
+            if kind != 'histogram':
+                lines.append(f'{metric}{_labels(labels)} {value}')
+                continue
+            cumulative = 0
+            for bound, count in zip(value['buckets'] + ['+Inf'], value['counts']):
+                cumulative += count
+                lines.append(f'{metric}_bucket{_labels(dict(labels, le=bound))} {cumulative}')
+            lines.append(f'{metric}_sum{_labels(labels)} {value["sum"]}')
+            lines.append(f'{metric}_count{_labels(labels)} {value["count"]}')
+    return '\n'.join(lines) + '\n'
+
+
+# ---------- On-demand profiling ----------
+
+def sample_profile(seconds, interval=0.005, exclude_current=True):
+    """Sample every thread's stack for `seconds`; returns a Counter of collapsed stacks"""
+    stacks = Counter()
+    me = threading.get_ident()
+    names = {t.ident: t.name for t in threading.enumerate()}
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        for ident, frame in sys._current_frames().items():
+            if exclude_current and ident == me:
+                continue
+            frames = [f"{Path(f.filename).name}:{f.name}" for f in traceback.extract_stack(frame)]
+            stacks[';'.join([names.get(ident, str(ident))] + frames)] += 1
+        time.sleep(interval)
+    return stacks
+
+
+def write_profile(stacks, directory, process):
+    """Collapsed stacks (flamegraph.pl / speedscope input) plus a top-functions summary"""
+    os.makedirs(directory, exist_ok=True)
+    path = Path(directory) / f"{process}-{time.strftime('%Y%m%d-%H%M%S')}.txt"
+    self_counts = Counter()
+    for stack, count in stacks.items():
+        self_counts[stack.rsplit(';', 1)[-1]] += count
+    total = sum(stacks.values()) or 1
+    with open(path, 'w') as f:
+        f.write(f"# {total} samples; top functions by self samples\n")
+        for func, count in self_counts.most_common(25):
+            f.write(f"# {count / total:6.1%}  {func}\n")
+        for stack, count in stacks.most_common():
+            f.write(f"{stack} {count}\n")
+    return path
+
+
+def profile_in_background(seconds, directory, process):
+    """Start a sampling profile on a thread; the result is written under `directory`"""
+    def run():
+        print(f"Profiling {process} for {seconds}s...")
+        path = write_profile(sample_profile(seconds), directory, process)
+        print(f"Profile written to {path}")
+    thread = threading.Thread(target=run, name='profiler', daemon=True)
+    thread.start()
+    return thread
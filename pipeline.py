@@ -0,0 +1,214 @@
+import threading
+import time
+from collections import deque
+
+
+class EndOfStream(Exception):
+    """Raised by a source stage when there is nothing more to read"""
+
+
+class DropOldestQueue:
+    """Bounded queue that never blocks the producer.
+
+    When full, the oldest item is discarded to make room, so a slow consumer
+    always works on recent data and end-to-end latency stays bounded.
+    """
+
+    def __init__(self, maxsize):
+        self.maxsize = max(1, maxsize)
+        self.dropped = 0
+        self._items = deque()
+        self._cond = threading.Condition()
+
+    def put(self, item, block=False):
+        """Enqueue item; with block=True wait for room instead of dropping (file sources)"""
+        with self._cond:
+            while block and len(self._items) >= self.maxsize:
+                self._cond.wait(0.1)
+            if len(self._items) >= self.maxsize:
+                self._items.popleft()
+                self.dropped += 1
+            self._items.append(item)
+            self._cond.notify_all()
+
+    def get(self, timeout=None):
+        """Next item, or None if nothing arrived within timeout"""
+        with self._cond:
+            if not self._items:
+                self._cond.wait(timeout)
+            if not self._items:
+                return None
+            item = self._items.popleft()
+            self._cond.notify_all()
+            return item
+
+    def __len__(self):
+        return len(self._items)
+
+
+class StageStats:
+    """Items/sec over a sliding window plus cumulative busy time"""
+
+    def __init__(self, window=5.0):
+        self.window = window
+        self.items = 0
+        self.busy = 0.0
+        self._stamps = deque()
+        self._lock = threading.Lock()
+
+    def record(self, elapsed):
+        now = time.monotonic()
+        with self._lock:
+            self.items += 1
+            self.busy += elapsed
+            self._stamps.append(now)
+            while self._stamps and self._stamps[0] < now - self.window:
+                self._stamps.popleft()
+
+    def fps(self):
+        now = time.monotonic()
+        with self._lock:
+            recent = [t for t in self._stamps if t >= now - self.window]
+        return len(recent) / self.window
+
+    def avg_ms(self):
+        return self.busy * 1000 / self.items if self.items else 0.0
+
+
+class Stage:
+    """One or more worker threads applying fn to items from inbox.
+
+    A stage without an inbox is a source: fn() is called repeatedly and
+    raises EndOfStream when done.  Results that are None are not forwarded.
+    A stage finishes once all its upstream stages have finished and its inbox
+    is drained.  blocking=True makes it wait for room downstream instead of
+    dropping, so recorded inputs are processed frame by frame.
+    """
+
+    def __init__(self, name, fn, inbox=None, outbox=None, workers=1, upstream=(), blocking=False):
+        self.name = name
+        self.fn = fn
+        self.inbox = inbox
+        self.outbox = outbox
+        self.upstream = list(upstream)
+        self.blocking = blocking
+        self.workers = max(1, workers)
+        self.stats = StageStats()
+        self.finished = threading.Event()
+        self._threads = []
+        self._alive = 0
+        self._alive_lock = threading.Lock()
+
+    def start(self, stop_event):
+        self._alive = self.workers
+        for i in range(self.workers):
+            t = threading.Thread(target=self._run, args=(stop_event,),
+                                 name=f"{self.name}-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def join(self, timeout=None):
+        for t in self._threads:
+            t.join(timeout)
+
+    def _run(self, stop_event):
+        try:
+            self._loop(stop_event)
+        finally:
+            with self._alive_lock:
+                self._alive -= 1
+                if self._alive == 0:
+                    self.finished.set()
+
+    def _loop(self, stop_event):
+        while not stop_event.is_set():
+            if self.inbox is not None:
+                item = self.inbox.get(timeout=0.1)
+                if item is None:
+                    if self.upstream and all(u.finished.is_set() for u in self.upstream) and not len(self.inbox):
+                        return
+                    continue
+            start = time.perf_counter()
+            try:
+                result = self.fn(item) if self.inbox is not None else self.fn()
+            except EndOfStream:
+                return
+            except Exception as e:
+                print(f"[{self.name}] error: {e}")
+                continue
+            self.stats.record(time.perf_counter() - start)
+            if result is not None and self.outbox is not None:
+                self.outbox.put(result, block=self.blocking)
+
+
+class Pipeline:
+    """Chain of stages connected by drop-oldest queues"""
+
+    def __init__(self):
+        self.stages = []
+        self.queues = {}
+        self.stop_event = threading.Event()
+
+    def queue(self, name, maxsize):
+        q = DropOldestQueue(maxsize)
+        self.queues[name] = q
+        return q
+
+    def add_stage(self, name, fn, inbox=None, outbox=None, workers=1, blocking=False):
+        upstream = [s for s in self.stages if inbox is not None and s.outbox is inbox]
+        stage = Stage(name, fn, inbox, outbox, workers, upstream, blocking)
+        self.stages.append(stage)
+        return stage
+
+    def start(self):
+        for stage in self.stages:
+            stage.start(self.stop_event)
+
+    def stop(self, timeout=2.0):
+        self.stop_event.set()
+        for stage in self.stages:
+            stage.join(timeout)
+
+    @property
+    def running(self):
+        """False once stopped, or once every stage has drained after the source ended"""
+        return not self.stop_event.is_set() and not all(s.finished.is_set() for s in self.stages)
+
+    def stats(self):
+        return {
+            'stages': {s.name: {'fps': s.stats.fps(), 'avg_ms': s.stats.avg_ms(),
+                                'items': s.stats.items, 'workers': s.workers}
+                       for s in self.stages},
+            'queues': {name: {'depth': len(q), 'maxsize': q.maxsize, 'dropped': q.dropped}
+                       for name, q in self.queues.items()},
+        }
+
+    def format_stats(self):
+        stats = self.stats()
+        stages = ', '.join(f"{name} {s['fps']:.1f}fps/{s['avg_ms']:.0f}ms"
+                           for name, s in stats['stages'].items())
+        queues = ', '.join(f"{name} {q['depth']}/{q['maxsize']} (dropped {q['dropped']})"
+                           for name, q in stats['queues'].items())
+        return f"stages: {stages} | queues: {queues}"
+
+
+class Latest:
+    """Thread-safe holder for the most recent value (frame, annotations)"""
+
+    def __init__(self, value=None):
+        self._value = value
+        self._seq = -1
+        self._lock = threading.Lock()
+
+    def set(self, value, seq=None):
+        with self._lock:
+            # Out-of-order results from parallel workers never overwrite newer ones
+            if seq is not None:
+                if seq < self._seq:
+                    return
+                self._seq = seq
+            self._value = value
+
+    def get(self):
+        with self._lock:
+            return self._value
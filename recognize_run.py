@@ -1,13 +1,28 @@
 import cv2
-import pickle
 import time
 from pathlib import Path
-from datetime import datetime
-import face_recognition
-from database import get_conn
-from utils import secs_between, PRESENCE_THRESHOLD
+from face_index import UNKNOWN
+from gallery_store import GALLERY_PATH
+from gallery_watcher import GALLERY_RELOAD_DEFAULTS, GalleryWatcher
+from pipeline import EndOfStream, Latest, Pipeline
+from sources import Source, sources_from_config
+from scheduler import SCHEDULER_DEFAULTS, AdaptiveScheduler
+from database import init_db
+from session_cache import SessionCache
+from attendance_writer import AttendanceWriter
+from utils import PRESENCE_GAP, format_ts
+from tracker import TRACKING_DEFAULTS, FaceTracker
+from embedding_cache import EMBEDDING_CACHE_DEFAULTS, EmbeddingCache
+from detectors import FaceWorkers, detector_from_config
+import argparse
+import signal
 import threading
 import json
+import metrics
+
+parser = argparse.ArgumentParser(description='Live face recognition attendance')
+parser.add_argument('--headless', action='store_true',
+                    help='no display window (servers, recorded-video tests)')
 
 # Load camera configuration
 CONFIG_FILE = Path('camera_config.json')
@@ -21,49 +36,18 @@ def load_camera_config():
             return default_config
     return default_config
 
-# Optional serial (Arduino) integration
-try:
-    import serial
-    SERIAL_AVAILABLE = True
-except Exception:
-    SERIAL_AVAILABLE = False
-    print("Serial not available - running without Arduino")
-
-# Load encodings
-enc_path = Path('models/encodings.pkl')
-if not enc_path.exists():
-    print('Encodings not found. Run encode_faces.py first.')
-    exit(1)
-
-with open(enc_path, 'rb') as f:
-    data = pickle.load(f)
-known_encodings = data['encodings']
-known_names = data['names']
-
-print(f"Loaded {len(known_names)} known face encodings")
-
-# Runtime structures
-current_session_id = None
-present_track = {}  # name -> {first_seen, last_seen}
-
-# Camera initialization with external camera preference
-camera_config = load_camera_config()
-camera_index = camera_config['camera_index']
-
-print(f"Attempting to initialize camera index: {camera_index} (External USB)")
-video_capture = cv2.VideoCapture(camera_index)
-video_capture.set(cv2.CAP_PROP_FRAME_WIDTH, 640)
-video_capture.set(cv2.CAP_PROP_FRAME_HEIGHT, 480)
-
-if not video_capture.isOpened():
-    print(f"Failed to open camera index {camera_index}. Trying index 0...")
-    video_capture = cv2.VideoCapture(0)
-    if not video_capture.isOpened():
-        print("No camera found. Please check connections.")
-        exit(1)
-    print("Using fallback camera index 0")
+# Pipeline configuration (optional "pipeline" block in camera_config.json)
+PIPELINE_DEFAULTS = {
+    'process_every_n_frames': 2,  # Process every 2nd frame (starting point when adaptive)
+    'scale': 0.5,                 # Downscale before detection (starting point when adaptive)
+    'workers': 0,                 # Detector/encoder workers, 0 = one per source
+    'worker_processes': True,     # Run them as processes; dlib's landmarks and encoder hold the GIL
+    'frame_queue': 2,             # Frames waiting for a detector, per source
+    'match_queue': 4,             # Encoded faces waiting for the matcher
+    'result_queue': 8,            # Matches waiting for the attendance sink
+    'stats_interval': 30,         # Seconds between stats printouts, 0 to disable
+}
 
-print("Camera initialized successfully")
 
 # Serial listener thread
 serial_port = None
@@ -86,170 +70,374 @@ def serial_listener(port_name):
 # threading.Thread(target=serial_listener, args=("COM3",), daemon=True).start()
 
 def mark_entry(name):
-    global present_track, current_session_id
     if current_session_id is None:
         print(f"No active session. Cannot mark entry for {name}")
         return
-        
-    # Ensure student exists in DB
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute('SELECT id FROM students WHERE name=?', (name,))
-    row = cur.fetchone()
-    if not row:
-        # Auto-insert student record
-        cur.execute('INSERT OR IGNORE INTO students(name) VALUES (?)', (name,))
-        conn.commit()
-        cur.execute('SELECT id FROM students WHERE name=?', (name,))
-        row = cur.fetchone()
-    student_id = row['id']
-    now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-    
-    # If already tracked, update last_seen
-    if name in present_track:
-        present_track[name]['last_seen'] = now
-        print(f"Updated presence: {name}")
-    else:
-        present_track[name] = {'student_id': student_id, 'first_seen': now, 'last_seen': now}
-        print(f"New entry: {name} at {now}")
-    
-    conn.close()
+
+    # Cached lookup; auto-inserts the student record on first sighting only
+    student_id = session_cache.student_id(name)
+    is_new, now = attendance_writer.mark(current_session_id, name, student_id)
+    # Called for every recognized face in every frame; only first sightings are printed
+    if is_new:
+        print(f"New entry: {name} at {format_ts(now)}")
 
 def flush_attendance_records():
-    """Write present_track to DB for the current session"""
-    global present_track, current_session_id
+    """Checkpoint present_track to DB now instead of waiting for the writer"""
     if current_session_id is None:
         print('No active session. Cannot flush attendance.')
         return
-        
-    conn = get_conn()
-    cur = conn.cursor()
-    
-    # Get session info to compute threshold
-    cur.execute('SELECT date, start_time, end_time FROM sessions WHERE id=?', (current_session_id,))
-    srow = cur.fetchone()
-    if srow:
-        session_start = f"{srow['date']} {srow['start_time']}"
-        session_end = f"{srow['date']} {srow['end_time']}"
-        session_length = secs_between(session_start, session_end)
-    else:
-        session_length = None
-
-    records_processed = 0
-    for name, rec in present_track.items():
-        student_id = rec['student_id']
-        entry_time = rec['first_seen']
-        exit_time = rec['last_seen']
-        duration = secs_between(entry_time, exit_time)
-        status = 'Absent'
-        
-        if session_length is None:
-            # Fallback: if present > 60 sec -> present
-            if duration >= 60:
-                status = 'Present'
-        else:
-            if duration >= int(session_length * PRESENCE_THRESHOLD):
-                status = 'Present'
-            else:
-                status = 'Absent'
-
-        cur.execute('''INSERT INTO attendance(session_id, student_id, entry_time, exit_time, duration_sec, status)
-                       VALUES (?, ?, ?, ?, ?, ?)''', 
-                       (current_session_id, student_id, entry_time, exit_time, duration, status))
-        records_processed += 1
-        
-    conn.commit()
-    conn.close()
+    records_processed = attendance_writer.checkpoint(force=True)
     print(f'Attendance flushed for session {current_session_id}: {records_processed} records')
-    present_track = {}
 
 def get_active_session():
-    """Check for active session in database"""
+    """Check for active session (cached; refreshed when the database changes)"""
     global current_session_id
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute('SELECT id FROM sessions WHERE active=1')
-    row = cur.fetchone()
-    conn.close()
-    
-    if row:
-        current_session_id = row['id']
+    session_id = session_cache.active_session_id
+    if session_id is not None:
+        current_session_id = session_id
         return True
     return False
 
-print('Starting face recognition system...')
-print('Press q to quit, f to flush attendance, s to check session status')
-
-frame_count = 0
-process_every_n_frames = 2  # Process every 2nd frame for performance
-
-while True:
-    ret, frame = video_capture.read()
-    if not ret:
-        print("Failed to grab frame")
-        break
-    
-    frame_count += 1
-    
-    # Only process every nth frame for better performance
-    if frame_count % process_every_n_frames == 0:
-        # Resize frame for faster processing
-        small_frame = cv2.resize(frame, (0, 0), fx=0.5, fy=0.5)
-        rgb_small_frame = small_frame[:, :, ::-1]  # BGR to RGB
-        
-        # Detect faces
-        face_locations = face_recognition.face_locations(rgb_small_frame)
-        face_encodings = face_recognition.face_encodings(rgb_small_frame, face_locations)
-        
-        for encoding, location in zip(face_encodings, face_locations):
-            matches = face_recognition.compare_faces(known_encodings, encoding, tolerance=0.48)
-            name = "Unknown"
-            
-            if True in matches:
-                first_match_index = matches.index(True)
-                name = known_names[first_match_index]
-                
-                # Scale location back to original frame size
-                top, right, bottom, left = [v * 2 for v in location]
-                
-                # Check if we have an active session
+
+def on_gallery_reload(matcher):
+    # Cached and tracked identities were matched against the previous gallery
+    if embedding_cache is not None:
+        embedding_cache.clear_matches()
+    for tracker in trackers.values():
+        tracker.expire()
+
+
+def make_capture(source):
+    def capture_frame():
+        """Source stage: read one frame, keep it for display, forward the ones to process"""
+        with metrics.timer('stage_seconds', stage='capture', source=source.name):
+            ret, frame = source.read()
+        if not ret:
+            print(f"Failed to grab frame from {source.name}")
+            raise EndOfStream()
+        frame_counts[source.name] += 1
+        metrics.inc('frames_read_total', source=source.name)
+        latest_frames[source.name].set(frame)
+        if scheduler is not None:
+            frame_scale = scheduler.should_process(source.name, frame)
+            if frame_scale is None:
+                return None
+        elif frame_counts[source.name] % process_every_n_frames != 0:
+            return None
+        else:
+            frame_scale = scale
+        return source.name, frame_counts[source.name], frame, frame_scale
+    return capture_frame
+
+
+def detect_and_encode(item):
+    source_name, seq, frame, frame_scale = item
+    start = time.perf_counter()
+    # Resize frame for faster processing
+    small_frame = cv2.resize(frame, (0, 0), fx=frame_scale, fy=frame_scale)
+    rgb_small_frame = cv2.cvtColor(small_frame, cv2.COLOR_BGR2RGB)  # Contiguous, so detectors need no copy
+
+    with metrics.timer('stage_seconds', stage='detect'):
+        face_locations = face_workers.detect(rgb_small_frame)
+    metrics.inc('frames_processed_total', source=source_name)
+    metrics.inc('faces_detected_total', len(face_locations), source=source_name)
+    # Scale locations back to original frame size, so tracks survive scale changes
+    boxes = [tuple(int(v / frame_scale) for v in location) for location in face_locations]
+    if source_name in trackers:
+        tracks = trackers[source_name].update(boxes)
+    else:
+        tracks = [(None, True) for _ in face_locations]
+    # Only new, uncertain or stale tracks are encoded; the rest keep their identity
+    needed = [(loc, box) for loc, box, (_, needs) in zip(face_locations, boxes, tracks) if needs]
+    if embedding_cache is not None:
+        keys = [embedding_cache.key(rgb_small_frame, loc, box, source_name) for loc, box in needed]
+        cached = [embedding_cache.get(key) for key in keys]
+    else:
+        keys = cached = [None] * len(needed)
+    # Effectively unchanged crops skip face_encodings altogether
+    missing = [loc for (loc, _), hit in zip(needed, cached) if hit is None]
+    if missing:
+        with metrics.timer('stage_seconds', stage='encode'):
+            computed = iter(face_workers.encode(rgb_small_frame, missing))
+    else:
+        computed = iter([])
+    metrics.inc('encodes_total', len(missing))
+    metrics.inc('encodes_skipped_total', len(face_locations) - len(needed), reason='tracked')
+    metrics.inc('encodes_skipped_total', len(needed) - len(missing), reason='cached')
+    encoded = []
+    for key, hit in zip(keys, cached):
+        if hit is None:
+            encoding = next(computed)
+            if embedding_cache is not None:
+                embedding_cache.put(key, encoding)
+            encoded.append((key, encoding, None))
+        else:
+            encoded.append((key, hit[0], hit[1]))
+    if scheduler is not None:
+        scheduler.observe(time.perf_counter() - start)
+    return source_name, seq, boxes, tracks, encoded
+
+
+def match_faces(item):
+    source_name, seq, boxes, tracks, face_encodings = item
+    # Match every encoded face in the frame against the gallery in one batch; cache hits carry their match
+    unmatched = [encoding for _, encoding, match in face_encodings if match is None]
+    with metrics.timer('stage_seconds', stage='match'):
+        fresh = iter(gallery_watcher.matcher.match(unmatched))
+    resolved = []
+    for key, _, match in face_encodings:
+        if match is None:
+            match = next(fresh)
+            if embedding_cache is not None:
+                embedding_cache.set_match(key, match)
+        resolved.append(match)
+    resolved = iter(resolved)
+    matches = []
+    for track, needs in tracks:
+        if needs:
+            match = next(resolved)
+            if track is not None:
+                trackers[source_name].resolve(track, match)
+        else:
+            match = track.match
+        # None while the track's first encode is still in flight
+        matches.append(match)
+    return source_name, seq, boxes, matches
+
+
+@metrics.timer('stage_seconds', stage='sink')
+def record_attendance(item):
+    """Sink stage: mark attendance from every source into one present_track"""
+    source_name, seq, boxes, matches = item
+    annotations = []
+    for match, box in zip(matches, boxes):
+        name = match.name if match is not None else UNKNOWN
+
+        if match is None:
+            color = (200, 200, 200)  # Grey while the identity is being resolved
+        elif name != UNKNOWN:
+            # Check if we have an active session
+            with state_lock:
                 if get_active_session():
                     mark_entry(name)
                     color = (0, 255, 0)  # Green for recognized
                 else:
                     color = (255, 255, 0)  # Yellow for recognized but no session
-                
-                # Draw rectangle and name
-                cv2.rectangle(frame, (left, top), (right, bottom), color, 2)
-                cv2.putText(frame, name, (left, top - 10), 
-                           cv2.FONT_HERSHEY_SIMPLEX, 0.8, color, 2)
-            else:
-                # Unknown face
-                top, right, bottom, left = [v * 2 for v in location]
-                cv2.rectangle(frame, (left, top), (right, bottom), (0, 0, 255), 2)
-                cv2.putText(frame, name, (left, top - 10), 
-                           cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 0, 255), 2)
-
-    # Display session status on frame
-    status_text = f"Session: {'Active' if current_session_id else 'Inactive'}"
-    cv2.putText(frame, status_text, (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)
-    cv2.putText(frame, f"Tracking: {len(present_track)} students", (10, 60), 
-               cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)
-    
-    cv2.imshow('Smart Attendance System - External Camera', frame)
-    
-    key = cv2.waitKey(1) & 0xFF
-    if key == ord('q'):
-        break
-    elif key == ord('f'):
-        flush_attendance_records()
-    elif key == ord('s'):
-        get_active_session()
-        print(f"Session status: {'Active' if current_session_id else 'Inactive'}")
-
-# Cleanup
-video_capture.release()
-cv2.destroyAllWindows()
-if serial_port:
-    serial_port.close()
-print("System shutdown complete")
\ No newline at end of file
+        else:
+            color = (0, 0, 255)  # Red for unknown
+        annotations.append((box, name, color))
+    latest_annotations[source_name].set(annotations, seq)
+
+
+def print_runtime_stats():
+    if scheduler is not None:
+        st = scheduler.stats()
+        print(f"Scheduler: every {st['skip']} frame(s) at scale {st['scale']:.2f}, {st['decisions']} adjustments")
+    for source_name, tracker in trackers.items():
+        st = tracker.stats()
+        print(f"Tracking {source_name}: {st['tracks']} tracks, {st['encodes_run']} encodes run, "
+              f"{st['encodes_avoided']} avoided ({st['avoided_ratio']:.0%})")
+    if embedding_cache is not None:
+        st = embedding_cache.stats()
+        print(f"Embedding cache: {st['entries']} entries, {st['hits']} hits, {st['misses']} misses "
+              f"({st['hit_ratio']:.0%}), {st['evictions']} evicted")
+
+
+def show_frames():
+    """Draw the newest frame of every source with its newest annotations; returns the key pressed"""
+    for source in sources:
+        frame = latest_frames[source.name].get()
+        if frame is None:
+            continue
+        frame = frame.copy()
+
+        for (top, right, bottom, left), name, color in latest_annotations[source.name].get():
+            # Draw rectangle and name
+            cv2.rectangle(frame, (left, top), (right, bottom), color, 2)
+            cv2.putText(frame, name, (left, top - 10), 
+                       cv2.FONT_HERSHEY_SIMPLEX, 0.8, color, 2)
+
+        # Display session status on frame
+        status_text = f"Session: {'Active' if current_session_id else 'Inactive'}"
+        cv2.putText(frame, status_text, (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)
+        cv2.putText(frame, f"Tracking: {len(attendance_writer.present_track)} students", (10, 60), 
+                   cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)
+
+        cv2.imshow(f'Smart Attendance System - {source.name}', frame)
+    return cv2.waitKey(1) & 0xFF
+
+
+# Worker processes started with spawn (Windows) import this module; only the main process runs the system
+if __name__ == '__main__':
+    args = parser.parse_args()
+
+    # Optional serial (Arduino) integration
+    try:
+        import serial
+        SERIAL_AVAILABLE = True
+    except Exception:
+        SERIAL_AVAILABLE = False
+        print("Serial not available - running without Arduino")
+
+    # Load encodings (memory-mapped, so startup doesn't grow with the gallery)
+    if not GALLERY_PATH.exists():
+        if Path('models/encodings.pkl').exists():
+            print('Found legacy models/encodings.pkl. Run: python gallery_store.py convert')
+        else:
+            print('Encodings not found. Run encode_faces.py first.')
+        exit(1)
+
+    # gallery_watcher.matcher is swapped for a new one when the gallery or its deltas change
+    gallery_watcher = GalleryWatcher(GALLERY_PATH)
+    gallery_watcher.load()
+
+    camera_config = load_camera_config()
+
+    # Camera initialization: one capture worker per configured source
+    sources = []
+    for source in sources_from_config(camera_config):
+        print(f"Attempting to initialize source: {source.name} ({source.kind})")
+        if source.open():
+            sources.append(source)
+        else:
+            print(f"Failed to open source {source.name}")
+
+    if not sources and 'sources' not in camera_config:
+        # Single external camera configured but missing: fall back to the built-in one
+        print("Trying index 0...")
+        fallback = Source(0)
+        if fallback.open():
+            sources.append(fallback)
+            print("Using fallback camera index 0")
+
+    if not sources:
+        print("No camera found. Please check connections.")
+        exit(1)
+
+    print(f"{len(sources)} source(s) initialized successfully")
+
+    pipeline_config = dict(PIPELINE_DEFAULTS, **camera_config.get('pipeline', {}))
+    process_every_n_frames = pipeline_config['process_every_n_frames']
+    scale = pipeline_config['scale']
+    # Face tracking: carry identities between frames instead of re-encoding every face
+    tracking_config = dict(TRACKING_DEFAULTS, **camera_config.get('tracking', {}))
+    # Adaptive frame skip/downscale and motion gating; disable for the fixed values above
+    scheduler_config = dict(SCHEDULER_DEFAULTS, **camera_config.get('scheduler', {}))
+    scheduler = (AdaptiveScheduler(process_every_n_frames, scale, **scheduler_config)
+                 if scheduler_config['enabled'] else None)
+    # Reuse encodings (and matches) of face crops that haven't changed since the last encode
+    embedding_cache_config = dict(EMBEDDING_CACHE_DEFAULTS, **camera_config.get('embedding_cache', {}))
+    embedding_cache = EmbeddingCache(**embedding_cache_config) if embedding_cache_config['enabled'] else None
+    # Face detector backend (hog by default; haar/ssd/yunet are much cheaper on CPU)
+    detector = detector_from_config(camera_config)
+    print(f"Face detector: {detector.backend}")
+    # Stage timings and counters, published for the dashboard's /metrics
+    metrics_config = dict(metrics.METRICS_DEFAULTS, **camera_config.get('metrics', {}))
+    # Detection/encoding processes, started before the recognizer's own threads (fork copies only this one)
+    face_workers = detector
+    if pipeline_config['worker_processes']:
+        face_workers = FaceWorkers(pipeline_config['workers'] or len(sources), detector.backend, **detector.options)
+        print(f"Detection/encoding in {face_workers.processes} worker processes")
+
+    # Runtime structures
+    init_db()  # Applies pending migrations (indexes, WAL) before the first query
+    session_cache = SessionCache(poll_interval=1.0).start()
+    current_session_id = None
+    # Owns present_track; checkpoints it in the background and recovers it after a restart
+    attendance_writer = AttendanceWriter(session_cache, interval=camera_config.get('checkpoint_interval', 30),
+                                         max_gap=camera_config.get('presence_gap', PRESENCE_GAP)).start()
+
+    # current_session_id is updated by the sink thread and read from the UI thread
+    state_lock = threading.Lock()
+    latest_frames = {source.name: Latest() for source in sources}
+    latest_annotations = {source.name: Latest([]) for source in sources}
+    frame_counts = {source.name: 0 for source in sources}
+    trackers = {source.name: FaceTracker(**tracking_config) for source in sources} if tracking_config['enabled'] else {}
+
+    # Enrollments (re-encoded gallery or deltas) are picked up without a restart
+    gallery_reload_config = dict(GALLERY_RELOAD_DEFAULTS, **camera_config.get('gallery_reload', {}))
+    gallery_watcher.on_reload.append(on_gallery_reload)
+    if gallery_reload_config['enabled']:
+        gallery_watcher.poll_interval = gallery_reload_config['poll_interval']
+        gallery_watcher.start()
+
+    # Detection workers and the matcher are shared by all sources
+    pipeline = Pipeline()
+    frames_q = pipeline.queue('frames', pipeline_config['frame_queue'] * len(sources))
+    encoded_q = pipeline.queue('encoded', pipeline_config['match_queue'])
+    results_q = pipeline.queue('results', pipeline_config['result_queue'])
+    for source in sources:
+        pipeline.add_stage(f"capture:{source.name}", make_capture(source), outbox=frames_q,
+                           blocking=not source.is_live)
+    # Recorded inputs only: process every frame rather than dropping under load
+    offline = not any(source.is_live for source in sources)
+    pipeline.add_stage('detect', detect_and_encode, frames_q, encoded_q,
+                       workers=pipeline_config['workers'] or len(sources), blocking=offline)
+    # Matching is cheap; never drop recognized faces on the way to the attendance sink
+    pipeline.add_stage('match', match_faces, encoded_q, results_q, blocking=True)
+    pipeline.add_stage('sink', record_attendance, results_q)
+
+    print('Starting face recognition system...')
+    if args.headless:
+        print('Running headless - Ctrl+C to stop')
+    else:
+        print('Press q to quit, f to flush attendance, s to check session status, p for pipeline stats')
+    pipeline.start()
+    last_stats = time.monotonic()
+    publisher = None
+    if metrics_config['enabled']:
+        publisher = metrics.Publisher(metrics.REGISTRY, metrics_config['stats_file'], 'recognizer',
+                                      metrics_config['export_interval']).start()
+    if metrics_config['profiling'] and hasattr(signal, 'SIGUSR1'):
+        # kill -USR1 <pid> writes a sampling profile of every thread to profile_dir
+        signal.signal(signal.SIGUSR1, lambda *_: metrics.profile_in_background(
+            metrics_config['profile_seconds'], metrics_config['profile_dir'], 'recognizer'))
+
+    # The display only reads the latest frames and annotations, so it never waits on recognition
+    try:
+        while pipeline.running:
+            if pipeline_config['stats_interval'] and time.monotonic() - last_stats >= pipeline_config['stats_interval']:
+                print('Pipeline', pipeline.format_stats())
+                print_runtime_stats()
+                last_stats = time.monotonic()
+
+            if args.headless:
+                time.sleep(0.1)
+                continue
+
+            key = show_frames()
+            if key == ord('q'):
+                break
+            elif key == ord('f'):
+                with state_lock:
+                    flush_attendance_records()
+            elif key == ord('s'):
+                with state_lock:
+                    get_active_session()
+                print(f"Session status: {'Active' if current_session_id else 'Inactive'}")
+            elif key == ord('p'):
+                print('Pipeline', pipeline.format_stats())
+                print_runtime_stats()
+    except KeyboardInterrupt:
+        pass
+
+    # Cleanup
+    pipeline.stop()
+    if face_workers is not detector:
+        face_workers.shutdown()
+    session_cache.stop()
+    gallery_watcher.stop()
+    print('Pipeline', pipeline.format_stats())
+    print_runtime_stats()
+    print("Frames read: " + ', '.join(f"{name} {count}" for name, count in frame_counts.items()))
+    # Final flush of everything still in memory
+    attendance_writer.stop()
+    if publisher is not None:
+        publisher.stop()
+    for source in sources:
+        source.release()
+    if not args.headless:
+        cv2.destroyAllWindows()
+    if serial_port:
+        serial_port.close()
+    print("System shutdown complete")
\ No newline at end of file
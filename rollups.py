@@ -0,0 +1,79 @@
+"""Attendance reports served from the rollup tables (see database.MIGRATIONS).
+
+The rollups are maintained by triggers on every attendance write, so these
+queries never touch the attendance table.  To backfill or repair them:
+
+    python rollups.py rebuild
+"""
+import sys
+import time
+
+from database import REBUILD_ROLLUPS, get_conn, init_db
+from utils import DEFAULTER_THRESHOLD
+
+STUDENT_ATTENDANCE = '''
+    SELECT r.student_id, st.name, st.roll_no, r.subject_id, sub.name AS subject,
+           r.present, sr.sessions_held, r.duration_sec,
+           ROUND(1.0 * r.present / sr.sessions_held, 4) AS attendance_ratio
+    FROM attendance_rollup r
+    JOIN subject_rollup sr ON sr.subject_id=r.subject_id
+    JOIN students st ON st.id=r.student_id
+    LEFT JOIN subjects sub ON sub.id=r.subject_id
+    WHERE r.records > 0 AND sr.sessions_held > 0
+'''
+
+
+def _dicts(cur):
+    return [dict(row) for row in cur.fetchall()]
+
+
+def student_attendance(conn, student_id=None, subject_id=None):
+    """Per student x subject: sessions present, sessions held and the ratio"""
+    sql, params = STUDENT_ATTENDANCE, []
+    if student_id is not None:
+        sql += ' AND r.student_id=?'
+        params.append(student_id)
+    if subject_id is not None:
+        sql += ' AND r.subject_id=?'
+        params.append(subject_id)
+    return _dicts(conn.execute(sql + ' ORDER BY st.name, subject', params))
+
+
+def subject_averages(conn):
+    return _dicts(conn.execute('''
+        SELECT sr.subject_id, sub.name AS subject, sr.sessions_held,
+               COUNT(r.student_id) AS students,
+               ROUND(AVG(1.0 * r.present / sr.sessions_held), 4) AS average_ratio,
+               ROUND(AVG(r.duration_sec), 1) AS average_duration_sec
+        FROM subject_rollup sr
+        JOIN attendance_rollup r ON r.subject_id=sr.subject_id AND r.records > 0
+        LEFT JOIN subjects sub ON sub.id=sr.subject_id
+        WHERE sr.sessions_held > 0
+        GROUP BY sr.subject_id
+        ORDER BY subject
+    '''))
+
+
+def defaulters(conn, threshold=DEFAULTER_THRESHOLD, subject_id=None):
+    sql, params = STUDENT_ATTENDANCE + ' AND 1.0 * r.present / sr.sessions_held < ?', [threshold]
+    if subject_id is not None:
+        sql += ' AND r.subject_id=?'
+        params.append(subject_id)
+    return _dicts(conn.execute(sql + ' ORDER BY attendance_ratio, st.name', params))
+
+
+def rebuild(conn):
+    # One transaction, so readers never see half-empty rollups
+    conn.executescript('BEGIN;' + REBUILD_ROLLUPS + 'COMMIT;')
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2 or sys.argv[1] != 'rebuild':
+        print(__doc__)
+        sys.exit(1)
+    init_db()
+    conn = get_conn()
+    start = time.perf_counter()
+    rebuild(conn)
+    rows = conn.execute('SELECT COUNT(*) FROM attendance_rollup').fetchone()[0]
+    print(f"Rebuilt rollups: {rows} student x subject rows in {time.perf_counter() - start:.2f}s")
@@ -0,0 +1,129 @@
+import threading
+import time
+from collections import deque
+
+import cv2
+import numpy as np
+
+SCHEDULER_DEFAULTS = {
+    'enabled': True,
+    'target_latency_ms': 150,     # Detection+encoding time per processed frame
+    'target_cpu': 0.5,            # Share of one core spent on detection+encoding
+    'min_skip': 1,                # Bounds for "process every nth frame"
+    'max_skip': 8,
+    'min_scale': 0.25,            # Bounds for the detection downscale factor
+    'max_scale': 0.75,
+    'scale_step': 0.05,
+    'adjust_interval': 2.0,       # Seconds between policy decisions
+    'motion_threshold': 3.0,      # Mean abs pixel difference that counts as motion
+    'motion_roi': None,           # [x0, y0, x1, y1] as fractions, e.g. the doorway
+    'static_recheck_seconds': 2.0,  # Detect at least this often even without motion
+    'boost_seconds': 3.0,         # Keep the full rate this long after the last motion
+    'log': True,
+}
+
+
+class MotionDetector:
+    """Frame differencing on a tiny grayscale thumbnail"""
+
+    def __init__(self, threshold, roi=None):
+        self.threshold = threshold
+        self.roi = roi
+        self._previous = None
+
+    def __call__(self, frame):
+        if self.roi:
+            h, w = frame.shape[:2]
+            x0, y0, x1, y1 = self.roi
+            frame = frame[int(y0 * h):int(y1 * h), int(x0 * w):int(x1 * w)]
+        thumb = cv2.cvtColor(cv2.resize(frame, (64, 48), interpolation=cv2.INTER_AREA), cv2.COLOR_BGR2GRAY)
+        previous, self._previous = self._previous, thumb
+        if previous is None:
+            return True
+        return float(np.mean(cv2.absdiff(thumb, previous))) >= self.threshold
+
+
+class AdaptiveScheduler:
+    """Decides which frames are processed and at what scale.
+
+    Static frames are skipped outright apart from a periodic re-check; after
+    motion every skip-th frame is processed for boost_seconds.  The skip and
+    the downscale factor are adjusted every adjust_interval seconds so that
+    measured detection latency and CPU share stay under their targets.
+    """
+
+    def __init__(self, skip=2, scale=0.5, **config):
+        self.config = dict(SCHEDULER_DEFAULTS, **config)
+        self.skip = skip
+        self.scale = scale
+        self.decisions = 0
+        self._motion = {}
+        self._counts = {}
+        self._last_processed = {}
+        self._boost_until = {}
+        self._samples = deque()           # (finished_at, busy seconds) of recent frames
+        self._last_adjust = time.monotonic()
+        self._lock = threading.Lock()
+
+    def should_process(self, source_name, frame):
+        """Called for every captured frame; returns the scale to process at, or None to skip"""
+        cfg = self.config
+        now = time.monotonic()
+        with self._lock:
+            motion = self._motion.setdefault(source_name, MotionDetector(cfg['motion_threshold'], cfg['motion_roi']))
+            count = self._counts[source_name] = self._counts.get(source_name, 0) + 1
+            if motion(frame):
+                if now >= self._boost_until.get(source_name, 0) and cfg['log']:
+                    print(f"[scheduler] motion on {source_name}")
+                self._boost_until[source_name] = now + cfg['boost_seconds']
+            if now < self._boost_until.get(source_name, 0):
+                # Motion recently: run at the adaptive rate
+                process = count % self.skip == 0
+            else:
+                # Static scene: only an occasional re-check
+                process = now - self._last_processed.get(source_name, 0) >= cfg['static_recheck_seconds']
+            if process:
+                self._last_processed[source_name] = now
+                return self.scale
+            return None
+
+    def observe(self, busy_seconds):
+        """Report the detection+encoding time of one processed frame"""
+        now = time.monotonic()
+        with self._lock:
+            self._samples.append((now, busy_seconds))
+            if now - self._last_adjust >= self.config['adjust_interval']:
+                self._adjust(now)
+
+    def _adjust(self, now):
+        cfg = self.config
+        window = now - self._last_adjust
+        while self._samples and self._samples[0][0] < self._last_adjust:
+            self._samples.popleft()
+        self._last_adjust = now
+        if not self._samples:
+            return
+        busy = [b for _, b in self._samples]
+        latency_ms = 1000 * sum(busy) / len(busy)
+        cpu = sum(busy) / window
+        self._samples.clear()
+
+        skip, scale = self.skip, self.scale
+        if latency_ms > cfg['target_latency_ms'] and scale > cfg['min_scale']:
+            scale = max(cfg['min_scale'], scale - cfg['scale_step'])
+        elif cpu > cfg['target_cpu'] and skip < cfg['max_skip']:
+            skip += 1
+        elif cpu < 0.7 * cfg['target_cpu'] and skip > cfg['min_skip']:
+            skip -= 1
+        elif latency_ms < 0.7 * cfg['target_latency_ms'] and scale < cfg['max_scale']:
+            scale = min(cfg['max_scale'], scale + cfg['scale_step'])
+
+        if (skip, scale) != (self.skip, self.scale):
+            self.decisions += 1
+            if cfg['log']:
+                print(f"[scheduler] latency {latency_ms:.0f}ms cpu {cpu:.0%}: "
+                      f"skip {self.skip}->{skip}, scale {self.scale:.2f}->{scale:.2f}")
+            self.skip, self.scale = skip, round(scale, 2)
+
+    def stats(self):
+        return {'skip': self.skip, 'scale': self.scale, 'decisions': self.decisions}
@@ -1,87 +1,338 @@
-import serial
+import argparse
+import json
+import queue
+import threading
 import time
 import cv2
 import face_recognition
 import os
-import sqlite3
-import datetime
+from collections import deque
+from pathlib import Path
+from attendance_writer import AttendanceWriter
+from database import init_db
+from embedding_cache import EmbeddingCache
+from face_index import UNKNOWN
+from gallery_store import GALLERY_PATH
+from gallery_watcher import GalleryWatcher
+from session_cache import SessionCache
+from sources import Source
+from utils import format_ts
 
 # ---------- CONFIG ----------
 SERIAL_PORT = 'COM6'   # ⚠️ Change this based on your Arduino port (e.g., COM4, /dev/ttyUSB0)
 BAUD_RATE = 9600
+CONFIG_FILE = Path('camera_config.json')
+
+# Optional "sensor" block in camera_config.json
+SENSOR_DEFAULTS = {
+    'port': SERIAL_PORT,
+    'baud_rate': BAUD_RATE,
+    'trigger': 'Detected',    # Serial line that means someone is at the door
+    'camera': None,           # Source spec (index, video, stream URL); None probes indices 0-3 once
+    'buffer_frames': 15,      # Recent frames kept in the ring buffer (~0.5 s at 30 fps)
+    'max_frame_age': 1.0,     # Seconds; only frames this recent are used for a trigger
+    'candidates': 3,          # Sharpest frames tried per trigger, best first
+    'scale': 0.5,             # Downscale before face detection
+    'checkpoint_interval': 30,  # Seconds between attendance writes
+    'presence_gap': None,     # Door events are sparse: presence runs from first to last event
+}
 
 # ---------- DATABASE ----------
-def init_db():
-    conn = sqlite3.connect("attendance.db")
-    c = conn.cursor()
-    c.execute("""CREATE TABLE IF NOT EXISTS attendance (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    name TEXT,
-                    date TEXT,
-                    time TEXT
-                )""")
-    conn.commit()
-    conn.close()
-
-def insert_log(name):
-    conn = sqlite3.connect("attendance.db")
-    c = conn.cursor()
-    now = datetime.datetime.now()
-    c.execute("INSERT INTO attendance (name, date, time) VALUES (?, ?, ?)",
-              (name, now.strftime("%Y-%m-%d"), now.strftime("%H:%M:%S")))
-    conn.commit()
-    conn.close()
+# Sensor events go into the shared attendance/sessions schema (database.py)
+# through the same write-behind AttendanceWriter as recognize_run.py.
+# Rows from the old sensor-only attendance(name, date, time) table are kept
+# as sensor_log and merged into attendance by migration 4.
 
 # ---------- FACE RECOGNITION ----------
-known_faces = []
-known_names = []
-
-# Load known faces from dataset/
-for file in os.listdir("dataset"):
-    path = os.path.join("dataset", file)
-    image = face_recognition.load_image_file(path)
-    encoding = face_recognition.face_encodings(image)[0]
-    known_faces.append(encoding)
-    known_names.append(file.split(".")[0])
-
-def recognize_face():
+gallery_watcher = None  # Same matcher as the live recognizer, from models/, reloaded on changes
+
+# Repeated triggers by someone still standing at the door reuse the last result
+embedding_cache = EmbeddingCache(size=64, ttl=10.0)
+
+def load_gallery(watch=False):
+    global gallery_watcher
+    if not GALLERY_PATH.exists():
+        raise SystemExit('Encodings not found. Run encode_faces.py first.')
+    gallery_watcher = GalleryWatcher()
+    gallery_watcher.on_reload.append(lambda matcher: embedding_cache.clear_matches())
+    if watch:
+        gallery_watcher.start()
+    else:
+        gallery_watcher.load()
+
+def sharpness(frame):
+    """Variance of the Laplacian on a small grayscale copy; higher is sharper"""
+    gray = cv2.cvtColor(cv2.resize(frame, (160, 120), interpolation=cv2.INTER_AREA), cv2.COLOR_BGR2GRAY)
+    return cv2.Laplacian(gray, cv2.CV_64F).var()
+
+def recognize_frame(frame, scale=0.5):
+    """Name of the first face in a BGR frame, UNKNOWN, or None if there is no face"""
+    small = cv2.resize(frame, (0, 0), fx=scale, fy=scale) if scale != 1 else frame
+    rgb = cv2.cvtColor(small, cv2.COLOR_BGR2RGB)
+    locations = face_recognition.face_locations(rgb)
+    if len(locations) == 0:
+        return None
+    box = tuple(int(v / scale) for v in locations[0])
+    key = embedding_cache.key(rgb, locations[0], box)
+    hit = embedding_cache.get(key)
+    if hit is not None:
+        return hit[1]
+    encodings = face_recognition.face_encodings(rgb, locations[:1])
+    name = gallery_watcher.matcher.match(encodings)[0].name
+    embedding_cache.put(key, encodings[0], name)
+    return name
+
+def recognize_face(frames=None, scale=0.5):
+    """Try frames (best first) until one has a face; without frames grab one from the first camera found"""
+    if frames is None:
+        frames = []
+        for i in range(4):
+            cam = cv2.VideoCapture(i)
+            if cam.isOpened():
+                print(f"✅ Camera found at index {i}")
+                ret, frame = cam.read()
+                cam.release()
+                if ret:
+                    frames.append(frame)
+                    break
+    for frame in frames:
+        name = recognize_frame(frame, scale)
+        if name is not None:
+            return name
+    return None
+
+# ---------- CAMERA ----------
+def find_camera():
     for i in range(4):
         cam = cv2.VideoCapture(i)
-        if cam.isOpened():
+        opened = cam.isOpened()
+        cam.release()
+        if opened:
             print(f"✅ Camera found at index {i}")
-            ret, frame = cam.read()
-            cam.release()
+            return i
+    return None
+
+class FrameRing:
+    """Keeps the camera open and the last few frames in memory, so a trigger never waits on it"""
+
+    def __init__(self, source, size=15):
+        self.source = source
+        self.frames = deque(maxlen=size)   # (time.monotonic(), frame)
+        self.frames_read = 0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if not self.source.open():
+            raise RuntimeError(f"Cannot open camera {self.source.name}")
+        self._thread = threading.Thread(target=self._run, name='frame-ring', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(2)
+        self.source.release()
+
+    def recent(self, max_age):
+        now = time.monotonic()
+        with self._lock:
+            return [frame for t, frame in self.frames if now - t <= max_age]
+
+    def _run(self):
+        # Recorded sources (for simulation) are played at ~30 fps and looped
+        delay = 0 if self.source.is_live else 1 / 30
+        while not self._stop.is_set():
+            ret, frame = self.source.read()
             if not ret:
+                if self.source.is_live:
+                    time.sleep(0.01)
+                else:
+                    self.source.release()
+                    self.source.open()
                 continue
-            rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            encodings = face_recognition.face_encodings(rgb)
-            if len(encodings) == 0:
-                continue
-            matches = face_recognition.compare_faces(known_faces, encodings[0])
-            if True in matches:
-                return known_names[matches.index(True)]
-            return "Unknown"
-    return None
+            with self._lock:
+                self.frames.append((time.monotonic(), frame))
+            self.frames_read += 1
+            if delay:
+                time.sleep(delay)
+
+def sharpest(frames, n):
+    return sorted(frames, key=sharpness, reverse=True)[:n]
 
 # ---------- ARDUINO LISTENER ----------
-def listen_arduino():
-    print("[INFO] Waiting for sensor trigger...")
-    arduino = serial.Serial(SERIAL_PORT, BAUD_RATE, timeout=1)
+class FileSerial:
+    """Stand-in for serial.Serial that follows a text file, for running without hardware.
+
+    Lines appended after start-up are read like serial lines, e.g.
+    `echo Detected >> triggers.txt`.  (A pty works with the real port too:
+    pass its /dev/pts/N path as --port.)
+    """
+
+    def __init__(self, path, timeout=1):
+        self.timeout = timeout
+        Path(path).touch()
+        self._file = open(path, 'rb')
+        self._file.seek(0, os.SEEK_END)
+        self._partial = b''
+
+    def readline(self):
+        deadline = time.monotonic() + self.timeout
+        while True:
+            self._partial += self._file.readline()
+            if self._partial.endswith(b'\n'):
+                line, self._partial = self._partial, b''
+                return line
+            if time.monotonic() >= deadline:
+                return b''
+            time.sleep(0.005)
+
+    def close(self):
+        self._file.close()
+
+def open_port(config, simulate=None):
+    if simulate:
+        return FileSerial(simulate)
+    import serial
+    arduino = serial.Serial(config['port'], config['baud_rate'], timeout=1)
     time.sleep(2)  # wait for Arduino to reset
-    init_db()
+    return arduino
+
+class SensorListener:
+    """Serial reader, recognizer and logger on their own threads.
+
+    The reader blocks on readline() and only snapshots the frame buffer on a
+    trigger, so back-to-back triggers each get the frames of their own
+    moment.  Recognition and the database write happen off the reader; the
+    logger marks presence in the active session and the writer batches it.
+    """
+
+    def __init__(self, port, ring, config, session_cache, attendance_writer):
+        self.port = port
+        self.ring = ring
+        self.config = config
+        self.session_cache = session_cache
+        self.attendance_writer = attendance_writer
+        self.triggers = queue.Queue()
+        self.logs = queue.Queue()
+        self.latencies = []       # Seconds from serial line to attendance logged
+        self.on_logged = None     # Optional callback(name, latency)
+        self._stop = threading.Event()
+        self._threads = []
+
+    def start(self):
+        for target, name in ((self._read, 'serial-reader'), (self._recognize, 'sensor-recognizer'),
+                             (self._log, 'sensor-logger')):
+            thread = threading.Thread(target=target, name=name, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self.triggers.put(None)
+        for thread in self._threads:
+            thread.join(5)
+
+    def _read(self):
+        while not self._stop.is_set():
+            data = self.port.readline().decode(errors='ignore').strip()
+            if self.config['trigger'] in data:
+                print("[EVENT] Sensor triggered — capturing image...")
+                self.triggers.put((time.monotonic(), self.ring.recent(self.config['max_frame_age'])))
 
-    while True:
-        data = arduino.readline().decode().strip()
-        if "Detected" in data:
-            print("[EVENT] Sensor triggered — capturing image...")
-            name = recognize_face()
+    def _recognize(self):
+        while True:
+            item = self.triggers.get()
+            if item is None:
+                break
+            triggered_at, frames = item
+            try:
+                name = recognize_face(sharpest(frames, self.config['candidates']), self.config['scale'])
+            except Exception as e:
+                print('Sensor recognition error:', e)
+                continue
             if name:
-                insert_log(name)
-                print(f"[+] Attendance logged for: {name}")
+                self.logs.put((name, triggered_at))
             else:
                 print("[-] No face detected.")
-        time.sleep(1)
+        self.logs.put(None)
 
-if __name__ == "__main__":
-    listen_arduino()
+    def _log(self):
+        while True:
+            item = self.logs.get()
+            if item is None:
+                break
+            name, triggered_at = item
+            if name == UNKNOWN:
+                print("[-] Unknown face.")
+                continue
+            session_id = self.session_cache.active_session_id
+            if session_id is None:
+                print(f"No active session. Cannot log {name}")
+                continue
+            try:
+                student_id = self.session_cache.student_id(name)
+                is_new, now = self.attendance_writer.mark(session_id, name, student_id)
+            except Exception as e:
+                print('Sensor logging error:', e)
+                continue
+            latency = time.monotonic() - triggered_at
+            self.latencies.append(latency)
+            print(f"[+] {'Entry' if is_new else 'Presence'} logged for: {name} at {format_ts(now)} "
+                  f"({latency * 1000:.0f} ms after trigger)")
+            if self.on_logged:
+                self.on_logged(name, latency)
 
+def load_sensor_config():
+    config = {}
+    if CONFIG_FILE.exists():
+        with open(CONFIG_FILE) as f:
+            config = json.load(f)
+    return dict(SENSOR_DEFAULTS, **config.get('sensor', {}))
+
+def listen_arduino(simulate=None, camera=None, port=None):
+    config = load_sensor_config()
+    if port:
+        config['port'] = port
+    camera = camera if camera is not None else config['camera']
+    if camera is None:
+        camera = find_camera()
+        if camera is None:
+            print("[-] No camera found.")
+            return
+    load_gallery(watch=True)
+    init_db()  # Applies pending migrations, including the legacy sensor table
+    session_cache = SessionCache(poll_interval=1.0).start()
+    attendance_writer = AttendanceWriter(session_cache, interval=config['checkpoint_interval'],
+                                         max_gap=config['presence_gap']).start()
+    ring = FrameRing(Source(camera), config['buffer_frames']).start()
+    port = open_port(config, simulate)
+    listener = SensorListener(port, ring, config, session_cache, attendance_writer).start()
+    print("[INFO] Waiting for sensor trigger...")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        listener.stop()
+        ring.stop()
+        gallery_watcher.stop()
+        port.close()
+        session_cache.stop()
+        attendance_writer.stop()
+        if listener.latencies:
+            lat = sorted(listener.latencies)
+            print(f"Logged {len(lat)} triggers, median {lat[len(lat) // 2] * 1000:.0f} ms, "
+                  f"max {lat[-1] * 1000:.0f} ms")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Log attendance when the Arduino sensor triggers')
+    parser.add_argument('--simulate', metavar='FILE', help='Read trigger lines appended to FILE instead of the serial port')
+    parser.add_argument('--port', help='Serial port, overriding the sensor config (a pty path works too)')
+    parser.add_argument('--camera', help='Camera index, video file or stream URL (default: sensor config)')
+    args = parser.parse_args()
+    listen_arduino(args.simulate, args.camera, args.port)
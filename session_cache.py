@@ -0,0 +1,84 @@
+import threading
+
+from database import get_conn
+
+
+class SessionCache:
+    """In-memory view of the active session and the name -> student_id map.
+
+    A background thread keeps one connection open and polls
+    PRAGMA data_version, which only changes when another connection (the
+    dashboard starting or ending a session, a new student...) commits.  Only
+    then are sessions and students re-read, so the recognition loop itself
+    does no database I/O in the steady state.
+    """
+
+    def __init__(self, poll_interval=1.0):
+        self.poll_interval = poll_interval
+        self.active_session_id = None
+        self.refreshes = 0
+        self._students = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._data_version = None
+        self.refresh()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._poll, name='session-cache', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(self.poll_interval * 2)
+
+    def refresh(self, conn=None):
+        own = conn is None
+        conn = conn or get_conn()
+        try:
+            cur = conn.cursor()
+            cur.execute('SELECT id FROM sessions WHERE active=1')
+            row = cur.fetchone()
+            cur.execute('SELECT id, name FROM students')
+            students = {r['name']: r['id'] for r in cur.fetchall()}
+        finally:
+            if own:
+                conn.close()
+        with self._lock:
+            self.active_session_id = row['id'] if row else None
+            self._students = students
+            self.refreshes += 1
+
+    def student_id(self, name):
+        with self._lock:
+            student_id = self._students.get(name)
+        if student_id is not None:
+            return student_id
+
+        # First sighting of an enrolled face without a students row: auto-insert it
+        conn = get_conn()
+        cur = conn.cursor()
+        cur.execute('INSERT OR IGNORE INTO students(name) VALUES (?)', (name,))
+        conn.commit()
+        cur.execute('SELECT id FROM students WHERE name=?', (name,))
+        student_id = cur.fetchone()['id']
+        conn.close()
+        with self._lock:
+            self._students[name] = student_id
+        return student_id
+
+    def _poll(self):
+        conn = get_conn()
+        try:
+            while not self._stop.wait(self.poll_interval):
+                try:
+                    version = conn.execute('PRAGMA data_version').fetchone()[0]
+                    if version != self._data_version:
+                        self._data_version = version
+                        self.refresh(conn)
+                except Exception as e:
+                    print('Session cache error:', e)
+        finally:
+            conn.close()
@@ -0,0 +1,86 @@
+import os
+from pathlib import Path
+
+import cv2
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+
+
+class ImageDirSource:
+    """Image directory that reads like a cv2.VideoCapture, one file per frame (for testing)"""
+
+    def __init__(self, path):
+        self.files = sorted(p for p in Path(path).iterdir() if p.suffix.lower() in IMAGE_EXTENSIONS)
+        self._pos = 0
+
+    def isOpened(self):
+        return len(self.files) > 0
+
+    def read(self):
+        while self._pos < len(self.files):
+            frame = cv2.imread(str(self.files[self._pos]))
+            self._pos += 1
+            if frame is not None:
+                return True, frame
+        return False, None
+
+    def release(self):
+        self._pos = len(self.files)
+
+
+class Source:
+    """One configured input: a camera index, a video file, a stream URL or an image directory"""
+
+    def __init__(self, spec, name=None):
+        self.spec = spec
+        self.name = name or str(spec)
+        self.capture = None
+
+    @property
+    def is_live(self):
+        # Cameras and streams drop stale frames; files and directories are processed in full
+        return self.kind in ('camera', 'stream')
+
+    @property
+    def kind(self):
+        if isinstance(self.spec, int) or str(self.spec).isdigit():
+            return 'camera'
+        if '://' in str(self.spec):
+            return 'stream'
+        if os.path.isdir(str(self.spec)):
+            return 'images'
+        return 'video'
+
+    def open(self):
+        if self.kind == 'camera':
+            self.capture = cv2.VideoCapture(int(self.spec))
+            self.capture.set(cv2.CAP_PROP_FRAME_WIDTH, 640)
+            self.capture.set(cv2.CAP_PROP_FRAME_HEIGHT, 480)
+        elif self.kind == 'images':
+            self.capture = ImageDirSource(self.spec)
+        else:
+            self.capture = cv2.VideoCapture(str(self.spec))
+        return self.capture.isOpened()
+
+    def read(self):
+        return self.capture.read()
+
+    def release(self):
+        if self.capture is not None:
+            self.capture.release()
+
+
+def sources_from_config(config):
+    """Sources listed in camera_config.json.
+
+    "sources" may hold plain specs or {"name": ..., "source": ...} entries;
+    without it the single "camera_index" is used as before.
+    """
+    entries = config.get('sources') or [config.get('camera_index', 0)]
+    sources = []
+    for entry in entries:
+        if isinstance(entry, dict):
+            sources.append(Source(entry['source'], entry.get('name')))
+        else:
+            sources.append(Source(entry))
+    return sources
@@ -1,22 +1,286 @@
+import bisect
+import csv
 import datetime
+import json
+import sys
+import threading
+import time
+from collections import namedtuple
+from pathlib import Path
 
-# Define your timetable
+from database import get_conn, init_db
+
+DAYS = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+
+Slot = namedtuple('Slot', ['day', 'start', 'end', 'subject', 'teacher', 'section'])
+
+# Define your timetable: day -> (start, end, subject); any slot length works
 timetable = {
-    "Monday": {
-        "09": "Math",
-        "10": "Physics",
-        "11": "AI/ML"
-    },
-    "Tuesday": {
-        "09": "English",
-        "10": "Chemistry",
-        "11": "AI/ML"
-    },
+    "Monday": [
+        ("09:00", "10:00", "Math"),
+        ("10:00", "11:00", "Physics"),
+        ("11:00", "12:00", "AI/ML"),
+    ],
+    "Tuesday": [
+        ("09:00", "10:00", "English"),
+        ("10:00", "11:00", "Chemistry"),
+        ("11:00", "12:00", "AI/ML"),
+    ],
     # Add other days similarly
 }
 
-def get_current_subject():
-    now = datetime.datetime.now()
-    day = now.strftime("%A")
-    hour = now.strftime("%H")
-    return timetable.get(day, {}).get(hour, "Unknown")
\ No newline at end of file
+# camera_config.json "timetable" block; auto_activate starts/ends sessions on schedule (opt-in)
+SCHEDULE_DEFAULTS = {
+    'auto_activate': False,
+    'section': None,        # Only activate this section's sessions (None: any)
+    'poll_interval': 20,
+}
+
+
+def to_seconds(value):
+    """'HH:MM' or 'HH:MM:SS' -> seconds since midnight"""
+    parts = [int(p) for p in str(value).strip().split(':')]
+    if len(parts) == 2:
+        parts.append(0)
+    h, m, s = parts
+    return h * 3600 + m * 60 + s
+
+
+class IntervalIndex:
+    """Intervals sorted by start for bisect lookups; overlaps are allowed.
+
+    max_end[i] is the latest end among the first i+1 intervals, so a lookup
+    walks back from the last start <= t only while an earlier interval can
+    still cover t.
+    """
+
+    def __init__(self, intervals):
+        # intervals: (start_sec, end_sec, item)
+        intervals = sorted(intervals, key=lambda iv: (iv[0], iv[1]))
+        self.starts = [iv[0] for iv in intervals]
+        self.ends = [iv[1] for iv in intervals]
+        self.items = [iv[2] for iv in intervals]
+        self.max_end = []
+        latest = -1
+        for end in self.ends:
+            latest = max(latest, end)
+            self.max_end.append(latest)
+
+    def __len__(self):
+        return len(self.items)
+
+    def at(self, t):
+        """Items whose [start, end) covers t, latest start first"""
+        found = []
+        i = bisect.bisect_right(self.starts, t) - 1
+        while i >= 0 and self.max_end[i] > t:
+            if self.ends[i] > t:
+                found.append(self.items[i])
+            i -= 1
+        return found
+
+
+def slots_from_dict(table, section=None):
+    return [Slot(day, start, end, subject, None, section)
+            for day, entries in table.items() for start, end, subject in entries]
+
+
+def _slot(row):
+    day = str(row['day']).strip().capitalize()
+    if day not in DAYS:
+        raise ValueError(f"Unknown day {row['day']!r}")
+    start, end = row['start'].strip(), row['end'].strip()
+    if to_seconds(end) <= to_seconds(start):
+        raise ValueError(f"Slot ends before it starts: {day} {start}-{end}")
+    return Slot(day, start, end, row['subject'].strip(),
+                (row.get('teacher') or '').strip() or None, (row.get('section') or '').strip() or None)
+
+
+def read_timetable(f, json_format=False):
+    """Weekly slots from an open text file: CSV (header: day,start,end,subject[,teacher,section]) or JSON"""
+    rows = json.load(f) if json_format else csv.DictReader(f)
+    return [_slot(row) for row in rows]
+
+
+def load_timetable(path):
+    path = Path(path)
+    with open(path, newline='') as f:
+        return read_timetable(f, path.suffix.lower() == '.json')
+
+
+def build_index(slots):
+    """Weekday -> IntervalIndex of that day's slots"""
+    by_day = {}
+    for slot in slots:
+        by_day.setdefault(slot.day, []).append((to_seconds(slot.start), to_seconds(slot.end), slot))
+    return {day: IntervalIndex(intervals) for day, intervals in by_day.items()}
+
+
+_index = build_index(slots_from_dict(timetable))
+
+
+def get_current_subject(now=None, index=None, section=None):
+    now = now or datetime.datetime.now()
+    day_index = (index or _index).get(now.strftime("%A"))
+    if day_index is None:
+        return "Unknown"
+    t = now.hour * 3600 + now.minute * 60 + now.second
+    for slot in day_index.at(t):
+        if section is None or slot.section == section:
+            return slot.subject
+    return "Unknown"
+
+
+def expand_term(slots, first_day, last_day, skip_dates=()):
+    """One (subject, teacher, section, date, start, end) row per slot per matching date"""
+    by_weekday = {}
+    for slot in slots:
+        by_weekday.setdefault(DAYS.index(slot.day), []).append(slot)
+    skip = set(skip_dates)
+    rows = []
+    day = first_day
+    while day <= last_day:
+        date = day.isoformat()
+        if date not in skip:
+            for slot in by_weekday.get(day.weekday(), ()):
+                rows.append((slot.subject, slot.teacher, slot.section, date, slot.start, slot.end))
+        day += datetime.timedelta(days=1)
+    return rows
+
+
+def insert_sessions(conn, rows):
+    """Insert (subject, teacher, section, date, start, end) rows in one transaction.
+
+    Subjects are created as needed; a session already present for the same
+    date, start, subject and section is skipped, so re-importing is safe.
+    Returns the number of sessions created.
+    """
+    if not rows:
+        return 0
+    cur = conn.cursor()
+    with conn:
+        cur.executemany('INSERT OR IGNORE INTO subjects(name) VALUES (?)', {(r[0],) for r in rows})
+        cur.execute('SELECT id, name FROM subjects')
+        subject_ids = {r['name']: r['id'] for r in cur.fetchall()}
+        # Existing sessions in the date range, read once instead of probed per row
+        cur.execute('SELECT date, start_time, subject_id, section FROM sessions WHERE date BETWEEN ? AND ?',
+                    (min(r[3] for r in rows), max(r[3] for r in rows)))
+        existing = {tuple(r) for r in cur.fetchall()}
+        new = []
+        for subject, teacher, section, date, start, end in rows:
+            key = (date, start, subject_ids[subject], section)
+            if key not in existing:
+                existing.add(key)
+                new.append((subject_ids[subject], teacher, section, date, start, end))
+        cur.executemany('''INSERT INTO sessions(subject_id, teacher, section, date, start_time, end_time, active)
+                           VALUES (?, ?, ?, ?, ?, ?, 0)''', new)
+    return len(new)
+
+
+def import_term(conn, slots, first_day, last_day, skip_dates=()):
+    return insert_sessions(conn, expand_term(slots, first_day, last_day, skip_dates))
+
+
+class SessionScheduler:
+    """Activates today's sessions when their slot starts and ends them when it is over.
+
+    Each session is switched on once, at its first tick inside its slot, so
+    a teacher ending it early (or starting another) is not overridden.  Only
+    sessions this scheduler activated are switched off, and a slot does not
+    start while a session started by hand is still running.
+    """
+
+    def __init__(self, section=None, poll_interval=20):
+        self.section = section
+        self.poll_interval = poll_interval
+        self._started = set()
+        self._activated = None   # session_id switched on by us
+        self._deferred = set()   # Slots waiting for a hand-started session to end
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='session-scheduler', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(self.poll_interval)
+
+    def _today(self, cur, date):
+        sql = 'SELECT id, start_time, end_time FROM sessions WHERE date=?'
+        params = [date]
+        if self.section is not None:
+            sql += ' AND section=?'
+            params.append(self.section)
+        cur.execute(sql, params)
+        intervals = []
+        for row in cur.fetchall():
+            try:
+                intervals.append((to_seconds(row['start_time']), to_seconds(row['end_time']), row['id']))
+            except (TypeError, ValueError):
+                continue
+        return IntervalIndex(intervals)
+
+    def tick(self, now=None):
+        now = now or datetime.datetime.now()
+        t = now.hour * 3600 + now.minute * 60 + now.second
+        conn = get_conn()
+        try:
+            cur = conn.cursor()
+            current = self._today(cur, now.strftime('%Y-%m-%d')).at(t)
+            target = current[0] if current else None
+            if self._activated is not None and self._activated != target:
+                cur.execute('UPDATE sessions SET active=0 WHERE id=?', (self._activated,))
+                conn.commit()
+                print(f'[timetable] Session {self._activated} ended on schedule')
+                self._activated = None
+            if target is not None and target not in self._started:
+                cur.execute('SELECT id FROM sessions WHERE active=1')
+                running = [row['id'] for row in cur.fetchall()]
+                if target in running:
+                    # Started by hand already; it is the teacher's to end
+                    self._started.add(target)
+                elif running:
+                    if target not in self._deferred:
+                        self._deferred.add(target)
+                        print(f'[timetable] Session {target} not started: session {running[0]} is still active')
+                else:
+                    self._started.add(target)
+                    cur.execute('UPDATE sessions SET active=1 WHERE id=?', (target,))
+                    conn.commit()
+                    self._activated = target
+                    print(f'[timetable] Session {target} started on schedule')
+        finally:
+            conn.close()
+
+    def _run(self):
+        while True:
+            try:
+                self.tick()
+            except Exception as e:
+                print('Session scheduler error:', e)
+            if self._stop.wait(self.poll_interval):
+                break
+
+
+USAGE = '''usage: python timetable.py import TIMETABLE.csv|json FIRST_DAY LAST_DAY [SKIP_DATE ...]
+
+Expands the weekly timetable into one session per slot for every date in
+FIRST_DAY..LAST_DAY (YYYY-MM-DD), leaving out SKIP_DATEs (holidays).'''
+
+if __name__ == '__main__':
+    if len(sys.argv) < 5 or sys.argv[1] != 'import':
+        print(USAGE)
+        sys.exit(1)
+    init_db()
+    slots = load_timetable(sys.argv[2])
+    first_day = datetime.date.fromisoformat(sys.argv[3])
+    last_day = datetime.date.fromisoformat(sys.argv[4])
+    start = time.perf_counter()
+    conn = get_conn()
+    created = import_term(conn, slots, first_day, last_day, sys.argv[5:])
+    conn.close()
+    print(f"Imported {len(slots)} weekly slots: {created} sessions created in {time.perf_counter() - start:.2f}s")
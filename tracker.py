@@ -0,0 +1,157 @@
+import itertools
+import threading
+import time
+
+import numpy as np
+
+from face_index import UNKNOWN
+
+TRACKING_DEFAULTS = {
+    'enabled': True,
+    'iou_threshold': 0.3,     # Minimum box overlap to continue a track
+    'max_missed': 5,          # Processed frames a track survives without a detection
+    'reverify_seconds': 10,   # Re-encode confirmed tracks this often
+    'min_margin': 0.05,       # Matches closer than this to the runner-up are re-checked
+    'pending_frames': 5,      # Re-request an encode that hasn't come back after this many frames
+}
+
+
+def iou_matrix(a, b):
+    """IoU between (top, right, bottom, left) boxes, len(a) x len(b)"""
+    a = np.asarray(a, dtype=np.float32).reshape(-1, 4)
+    b = np.asarray(b, dtype=np.float32).reshape(-1, 4)
+    top = np.maximum(a[:, None, 0], b[None, :, 0])
+    right = np.minimum(a[:, None, 1], b[None, :, 1])
+    bottom = np.minimum(a[:, None, 2], b[None, :, 2])
+    left = np.maximum(a[:, None, 3], b[None, :, 3])
+    inter = np.clip(right - left, 0, None) * np.clip(bottom - top, 0, None)
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 1] - a[:, 3])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 1] - b[:, 3])
+    union = area_a[:, None] + area_b[None, :] - inter
+    return np.where(union > 0, inter / np.maximum(union, 1e-6), 0.0)
+
+
+def _centroid_distance(a, b):
+    return np.hypot((a[0] + a[2] - b[0] - b[2]) / 2, (a[1] + a[3] - b[1] - b[3]) / 2)
+
+
+class Track:
+    def __init__(self, track_id, box):
+        self.id = track_id
+        self.box = box
+        self.match = None         # Last Match from the gallery
+        self.verified_at = None   # time.monotonic() of that match
+        self.missed = 0
+        self.pending = 0          # Frames since an encode was requested, 0 = none outstanding
+
+
+class FaceTracker:
+    """Associates detections across frames so identities can be carried forward.
+
+    update() returns, per detected box, its track and whether the face still
+    needs a full encode + match: new tracks, low-confidence ones and tracks due
+    for periodic re-verification.  Everything else reuses the track's identity.
+    """
+
+    def __init__(self, iou_threshold=0.3, max_missed=5, reverify_seconds=10, min_margin=0.05,
+                 pending_frames=5, **_):
+        self.iou_threshold = iou_threshold
+        self.max_missed = max_missed
+        self.reverify_seconds = reverify_seconds
+        self.min_margin = min_margin
+        self.pending_frames = pending_frames
+        self.tracks = []
+        self.encodes_run = 0
+        self.encodes_avoided = 0
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def update(self, boxes):
+        with self._lock:
+            assigned = self._associate(boxes)
+            now = time.monotonic()
+            result = []
+            for track in assigned:
+                needs = self._needs_encode(track, now)
+                if needs:
+                    track.pending = 1
+                    self.encodes_run += 1
+                else:
+                    if track.pending:
+                        track.pending += 1
+                    self.encodes_avoided += 1
+                result.append((track, needs))
+            return result
+
+    def resolve(self, track, match):
+        """Record the gallery match computed for a track"""
+        with self._lock:
+            track.match = match
+            track.verified_at = time.monotonic()
+            track.pending = 0
+
+    def expire(self):
+        """Re-verify every track on its next detection (the gallery changed); names stay until then"""
+        with self._lock:
+            for track in self.tracks:
+                if track.verified_at is not None:
+                    track.verified_at = float('-inf')
+
+    def _needs_encode(self, track, now):
+        if track.pending:
+            # An encode is in flight; only ask again if it seems lost
+            return track.pending >= self.pending_frames
+        if track.match is None:
+            return True
+        if track.match.name == UNKNOWN or track.match.margin < self.min_margin:
+            return True
+        return now - track.verified_at >= self.reverify_seconds
+
+    def _associate(self, boxes):
+        """Greedy highest-IoU-first assignment, then nearest centroid for fast movers"""
+        assigned = [None] * len(boxes)
+        if self.tracks and boxes:
+            ious = iou_matrix(boxes, [t.box for t in self.tracks])
+            used = set()
+            for flat in np.argsort(-ious, axis=None):
+                i, j = divmod(int(flat), len(self.tracks))
+                if ious[i, j] < self.iou_threshold:
+                    break
+                if assigned[i] is not None or j in used:
+                    continue
+                assigned[i] = self.tracks[j]
+                used.add(j)
+
+            for i, box in enumerate(boxes):
+                if assigned[i] is not None:
+                    continue
+                free = [j for j in range(len(self.tracks)) if j not in used]
+                if not free:
+                    break
+                dist = [_centroid_distance(box, self.tracks[j].box) for j in free]
+                best = int(np.argmin(dist))
+                # Within half a face width of where the track was last seen
+                if dist[best] <= 0.5 * (box[1] - box[3]):
+                    assigned[i] = self.tracks[free[best]]
+                    used.add(free[best])
+
+        seen = set()
+        for i, box in enumerate(boxes):
+            if assigned[i] is None:
+                assigned[i] = Track(next(self._ids), box)
+                self.tracks.append(assigned[i])
+            assigned[i].box = box
+            assigned[i].missed = 0
+            seen.add(assigned[i].id)
+
+        for track in self.tracks:
+            if track.id not in seen:
+                track.missed += 1
+        self.tracks = [t for t in self.tracks if t.missed <= self.max_missed]
+        return assigned
+
+    def stats(self):
+        total = self.encodes_run + self.encodes_avoided
+        return {'tracks': len(self.tracks), 'encodes_run': self.encodes_run,
+                'encodes_avoided': self.encodes_avoided,
+                'avoided_ratio': self.encodes_avoided / total if total else 0.0}
@@ -4,8 +4,22 @@ from datetime import datetime
 # Threshold for marking present (percentage of session duration)
 PRESENCE_THRESHOLD = 0.6  # 60% default
 
+# Seconds a student may go unseen before their presence interval closes
+PRESENCE_GAP = 60
+
+# Students below this share of sessions attended are listed as defaulters
+DEFAULTER_THRESHOLD = 0.75  # 75% default
+
+TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+def format_ts(epoch):
+    return time.strftime(TIME_FORMAT, time.localtime(epoch))
+
+def parse_ts(text):
+    return int(datetime.strptime(text, TIME_FORMAT).timestamp())
+
 def secs_between(t1, t2):
-    fmt = '%Y-%m-%d %H:%M:%S'
+    fmt = TIME_FORMAT
     try:
         dt1 = datetime.strptime(t1, fmt)
         dt2 = datetime.strptime(t2, fmt)